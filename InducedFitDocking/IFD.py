@@ -9,6 +9,12 @@ import IFD_parseargs
 import IFD_run
 import IFD_write_input_file
 import IFD_default
+import IFD_check_input
+
+#Import TCM functionality
+import tcm_preflight
+import tcm_job_control
+import tcm_errors
 
 ###Initiate logger###
 logger = logging.getLogger()
@@ -66,32 +72,78 @@ def set_up(jobname = 'induced_fit_docking', output_directory = None):
 
     return master_dir, ifd_dir, SCHRODINGER
 
-def run_ifd(ifd_dir, SCHRODINGER, ifd_args = None):
-    """ Runs IFD job and associated tasks.
+def get_default(args):
+    """ Gets default IFD settings (from user json if argument passed in which overrides other settings)
+    
+    Returns: dict containing default args """
+
+    institutional_default_setings = "ADD_HERE"
+    user_default_settings = args.default
+    return IFD_default.main(IFD_path, institutional_default_setings, user_default_settings)
+
+def preflight(ifd_args = None):
+    """ Runs every check of an IFD job (argument parsing, input validation, template parsing, CRBN landmark detection and
+    default settings) without submitting the job, and prints a json report with the time spent in each check.
+    
+    Input:
+    - ifd_args: ifd specific args (used in args passed into module); parsed from command line if None
+    
+    Returns: boolean (True if a check failed, False if every check passed) """
+
+    report = tcm_preflight.Preflight('IFD')
+
+    # Parsing the arguments
+    if ifd_args is None:
+        parser = IFD_parseargs.build_parser()
+        parsed = report.run('argument parsing', parser.parse_known_args, failed = lambda result: False)
+        if parsed is None: # can't run other checks without arguments
+            report.print_report()
+            return True
+        args, unknowns = parsed
+    else:
+        args = ifd_args
+
+    # Checking protein poses and ligand
+    report.run('input validation', IFD_check_input.check_inputted_args, args)
+
+    # Checking template can be filled in
+    if getattr(args, 'template', None) is not None:
+        report.run('template parsing', IFD_write_input_file.template_error, args.template)
+    else:
+        report.skip('template parsing', 'no template passed in, input file is written from scratch')
+
+    # Finding cocrystallized ligand and hydrogen bonding sites on CRBN
+    report.run('landmark detection', IFD_find_info.parse_structure, args.proteins, failed = tcm_preflight.landmarks_missing)
+
+    # Getting default settings
+    report.run('default settings', get_default, args, failed = lambda result: not result)
+
+    report.print_report()
+    return not report.ok
+
+def prepare_ifd(ifd_dir, SCHRODINGER, ifd_args = None):
+    """ Parses and checks arguments, writes .inp file and gets final settings of IFD job.
     
     Requires:
-    - piper_dir: directory of IFD job (to store info and results of current IFD job)
+    - ifd_dir: directory of IFD job (to store info and results of current IFD job)
     - SCHRODINGER: location of SCHRODINGER installation
-    - ifd_args: ifd specific args (used in args passed into module) """
-
-    # Logging the start of PIPER module
-    logger.info(f'Induced Fit Docking started. Results and information in {ifd_dir}')
+    - ifd_args: ifd specific args (used in args passed into module)
+    
+    Returns: tuple of (args, params, input_file_name) where params is dict of final IFD settings """
 
     # Parsing and checking the arguments
     if ifd_args is None: # no arguments were passed in, parse and check 
         args = IFD_parseargs.parse_and_check_args()
     else: # arguments were passed in, just check the args
         args = ifd_args
-        if IFD_parseargs.check_inputted_args(args):
-            sys.exit(0)
+        if IFD_check_input.check_inputted_args(args):
+            raise tcm_errors.InputError('IFD inputs failed checks. See log for more detail.')
     
     # Building input file and deleting used arguments from args Namespace
     args, input_file_name = IFD_write_input_file.make_input_file_from_args(args, ifd_dir)
 
     # Getting default settings (from user if argument passed in which overrides other settings)
-    institutional_default_setings = "ADD_HERE"
-    user_default_settings = args.default
-    default = IFD_default.main(IFD_path, institutional_default_setings, user_default_settings)
+    default = get_default(args)
     
     # Deleting the default arguments from args to only get cmdline linux ones
     del args.default
@@ -100,12 +152,59 @@ def run_ifd(ifd_dir, SCHRODINGER, ifd_args = None):
     params = update_default_w_args(default, args)
     logger.info(f'Final settings of PIPER job: {params}')
 
+    return args, params, input_file_name
+
+def run_ifd(ifd_dir, SCHRODINGER, ifd_args = None):
+    """ Runs IFD job and associated tasks.
+    
+    Requires:
+    - ifd_dir: directory of IFD job (to store info and results of current IFD job)
+    - SCHRODINGER: location of SCHRODINGER installation
+    - ifd_args: ifd specific args (used in args passed into module)
+    
+    Returns: JobResult of the IFD submission (exit code, duration and output tail) """
+
+    # Logging the start of PIPER module
+    logger.info(f'Induced Fit Docking started. Results and information in {ifd_dir}')
+
+    # Getting final arguments, settings and .inp file
+    args, params, input_file_name = prepare_ifd(ifd_dir, SCHRODINGER, ifd_args)
+
     # IFD run
-    IFD_run.ifd(args, params, SCHRODINGER, ifd_dir, input_file_name)
+    result = IFD_run.ifd(args, params, SCHRODINGER, ifd_dir, input_file_name)
+    if result.returncode != 0:
+        logger.critical(f'IFD job submission failed with exit code {result.returncode}. Last output: ' + ' | '.join(result.output_tail[-5:]))
+
+    return result
+
+async def submit_ifd(ifd_dir, SCHRODINGER, ifd_args = None):
+    """ Launches IFD job under job control and waits for it to finish without blocking other jobs
+    (see tcm_job_control; many IFD jobs can be driven at once with asyncio.gather).
+    
+    Requires:
+    - ifd_dir: directory of IFD job (to store info and results of current IFD job)
+    - SCHRODINGER: location of SCHRODINGER installation
+    - ifd_args: ifd specific args (used in args passed into module)
+    
+    Returns: job dictionary with final job control status """
+
+    logger.info(f'Induced Fit Docking started. Results and information in {ifd_dir}')
+
+    args, params, input_file_name = prepare_ifd(ifd_dir, SCHRODINGER, ifd_args)
+    command = IFD_run.build_command(params, SCHRODINGER, input_file_name)
+
+    job = await tcm_job_control.run_job(command, cwd = ifd_dir, log = logger, watch_paths = [ifd_dir])
+    logger.info(f'IFD job {job["job_id"]} finished with status {job["status"]}. Results found in {ifd_dir}')
+
+    return job
 
 if __name__ == '__main__':
     """ If the script is called in by name (as a standalone module), it will define necessary paths and logger info and run the job. """
 
+    # Only running checks (no directories, loggers or job submission)
+    if '--preflight' in sys.argv:
+        sys.exit(1 if preflight() else 0)
+
     # Initially parsing user arguments to find whether an output directory and jobname was inputted
     jobname = 'prot_prot_docking'
     output_directory = None
@@ -119,5 +218,8 @@ if __name__ == '__main__':
     # Setting up paths and loggers with specific output directory or None
     master_dir, ifd_dir, SCHRODINGER = set_up(jobname, output_directory)
 
-    # Running the piper job 
-    run_ifd(ifd_dir, SCHRODINGER)
\ No newline at end of file
+    # Running the piper job (argument errors are logged by the parser)
+    try:
+        run_ifd(ifd_dir, SCHRODINGER)
+    except tcm_errors.ArgumentError:
+        sys.exit(2)
\ No newline at end of file
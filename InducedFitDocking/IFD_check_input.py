@@ -1,9 +1,8 @@
 #Import Python modules
 import logging
 
-# #Import Schrodinger modules 
-from schrodinger.structure import StructureReader, StructureWriter
-from schrodinger.application.prepwizard2.diagnostics import get_problems
+#Import TCM functionality
+import tcm_structure_scan
 
 ###Initiate logger###
 logger = logging.getLogger(__name__)
@@ -41,24 +40,19 @@ def protein_loading_error(protein_file, chain):
     Return: boolean (True if error occurs, False if no error)"""
 
     error = False
-    # tries loading in the protein and catches specific errors
-    try:
-        protein_chains = set() 
-        for structure in StructureReader(protein_file): # reads all the structures in file 
-            structure_exists = True # structures do exist in the file
-            for atom in structure.atom: # adds in all chains in the file 
-                protein_chains.add(atom.chain)
-
-        if not structure_exists: # no structure found
-            logger.critical(f'No protein structure exists within the file.')
-            return True # critical error and can't check other conditions
-        
-        if (chain is not None) and (chain not in protein_chains): # user-inputted chain doesn't exist in the file 
-            logger.critical(f'Selected chain does not exist in protein file. Please select another chain from {protein_chains} or upload another file')
-            error = True
+    # single scan of the protein file (poses are not run through diagnostics)
+    summary = tcm_structure_scan.get_summary(protein_file, diagnostics = False)
+
+    if not summary['loaded']: # exceptions / error arise in trying to load protein file
+        logger.critical(f'Error occured in loading protein: {summary["error"]}. ')
+        return True
 
-    except Exception as e: # other exceptions / error arise in trying to load and check protein file
-        logger.critical(f'Error occured in loading protein: {e}. ')
+    if summary['structures'] == 0: # no structure found
+        logger.critical(f'No protein structure exists within the file.')
+        return True # critical error and can't check other conditions
+    
+    if (chain is not None) and (chain not in summary['chains']): # user-inputted chain doesn't exist in the file 
+        logger.critical(f'Selected chain does not exist in protein file. Please select another chain from {set(summary["chains"])} or upload another file')
         error = True
     
     # returns error boolean
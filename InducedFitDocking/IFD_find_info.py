@@ -1,9 +1,8 @@
 #Import Python modules
 import logging
 
-#Import Schrodinger modules
-from schrodinger.structure import StructureReader
-from schrodinger.structutils.analyze import find_ligands
+#Import TCM functionality
+import tcm_fast_reader
 
 ###Initiate logger###
 logger = logging.getLogger(__name__)
@@ -17,6 +16,15 @@ def get_ligand_name(input_protein_file):
     -input_protein_file: file path to input protein (either multiple structures or single structure)
     
     Returns: name of ligand in protein files which should match the residue.pdbres attribute """
+
+    # reading protein file into numpy arrays if numpy backend selected
+    if tcm_fast_reader.use_fast_reader(input_protein_file):
+        return get_ligand_name_fast(input_protein_file)
+
+    # Schrodinger modules are imported when first needed (slow to import)
+    from schrodinger.structure import StructureReader
+    from schrodinger.structutils.analyze import find_ligands
+
     final_ligand = None
 
     # finds the name of the ligand (all protein files should have the same ligand name and only one ligand per structure)
@@ -31,6 +39,23 @@ def get_ligand_name(input_protein_file):
     
     return final_ligand
 
+def get_ligand_name_fast(input_protein_file):
+    """ Same as get_ligand_name but reads the protein file with tcm_fast_reader.
+    
+    Returns: name of ligand in protein files (without spaces) """
+    final_ligand = None
+
+    for title, atoms in tcm_fast_reader.read_structures(input_protein_file):
+        ligand = tcm_fast_reader.find_ligands(atoms) # list of (chain, pdbres, resnum) of every ligand
+        assert len(ligand) == 1, "Please make sure that the input protein file has only one ligand per protein structures"
+        ligand_name = ligand[0][1]
+        if final_ligand is None:
+            final_ligand = ligand_name
+        else:
+            assert ligand_name == final_ligand, "Please ensure that the same ligand exists in all protein files"
+
+    return final_ligand
+
 def find_ligand(residue, ligand):
     """Checks if the residue is our desired ligand. If it is the residue, it processes the residue information
     to return our ligand id to be used for our .inp file. Otherwise, it returns None. 
@@ -66,6 +91,9 @@ def W380_backbone(residue):
 
     if residue.resnum == 380 and residue.pdbres.strip() == 'TRP': # identified TRP380
         atom = residue.getAtomByPdbName(' H  ') # hydrogen corresponding to backbone nitrogen of W380 (pdb name of H)
+        if atom is None: # protein not prepared with hydrogens
+            logger.warning('TRP380 found but has no backbone H atom')
+            return None
         return int(atom.index)
     
 def H378_backbone(residue):
@@ -74,6 +102,9 @@ def H378_backbone(residue):
 
     if residue.resnum == 378 and residue.pdbres.strip() == 'HIS': # identified HIS378
         atom = residue.getBackboneOxygen() #getting carbonyl backbone oxygen
+        if atom is None:
+            logger.warning('HIS378 found but has no backbone O atom')
+            return None
         return int(atom.index)
     
 def H378_side_chain(residue):
@@ -82,6 +113,9 @@ def H378_side_chain(residue):
 
     if residue.resnum == 378 and residue.pdbres.strip() == 'HIS': # identified HIS378
         atom = residue.getAtomByPdbName(' HD1')
+        if atom is None: # wrong protonation state of HIS378 (e.g. HIE instead of HID)
+            logger.warning('HIS378 found but has no HD1 atom')
+            return None
         return int(atom.index)
     
 def parse_structure(input_protein_file):
@@ -94,7 +128,13 @@ def parse_structure(input_protein_file):
     
     Return: results dictionary such as {'lig_id':C:502, 'H378_o': 'O8440', 'H378_h': 'H8451', 'W380_h':'H8479'}
     """
+
+    # reading protein file into numpy arrays if numpy backend selected
+    if tcm_fast_reader.use_fast_reader(input_protein_file):
+        return parse_structure_fast(input_protein_file)
     
+    from schrodinger.structure import StructureReader # imported when first needed (slow to import)
+
     results = {}
 
     # finding the name of the ligand
@@ -120,9 +160,42 @@ def parse_structure(input_protein_file):
                     side_chain_h = H378_side_chain(residue) # checks if this is H378 and returns correct info if it is (o.w. None)
                     if side_chain_h is not None:
                         results['H378_h'] = side_chain_h
+            if len(results) == 4: # everything found, so the rest of the file is not read
+                break
     
     return results 
                     
+def parse_structure_fast(input_protein_file):
+    """ Same as parse_structure but reads the protein file with tcm_fast_reader and looks up the ligand and
+    hydrogen bonding sites with numpy array masks instead of iterating through residues.
+    
+    Return: results dictionary (see parse_structure) """
+
+    results = {}
+
+    # finding the name of the ligand
+    lig = get_ligand_name_fast(input_protein_file)
+
+    # (result key, residue name, residue number, pdb atom name) of each hydrogen bonding site
+    sites = [('W380_h', 'TRP', 380, 'H'), ('H378_o', 'HIS', 378, 'O'), ('H378_h', 'HIS', 378, 'HD1')]
+
+    for title, atoms in tcm_fast_reader.read_structures(input_protein_file):
+        if 'lig_id' not in results: #ligand not yet found
+            ligand = [(chain, resnum) for chain, resname, resnum in tcm_fast_reader.find_ligands(atoms) if resname == lig]
+            if ligand:
+                results['lig_id'] = f'{ligand[0][0]}:{ligand[0][1]}'
+        for key, resname, resnum, name in sites:
+            if key not in results: #site not yet found
+                index = tcm_fast_reader.find_atom(atoms, resname, resnum, name)
+                if index is not None:
+                    results[key] = index
+                elif tcm_fast_reader.find_atom(atoms, resname, resnum, 'CA') is not None: # residue found but not the atom
+                    logger.warning(f'{resname}{resnum} found but has no {name} atom')
+        if len(results) == len(sites) + 1: # everything found
+            break
+
+    return results
+
 if __name__ == '__main__':
     structure = 'InducedFit_5HXB-2_03Angstrom_rec.mae'
     res = parse_structure(structure)
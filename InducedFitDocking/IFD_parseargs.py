@@ -2,13 +2,15 @@
 import logging
 import textwrap
 import argparse
-import subprocess
 import os
 import sys
 
 # Import IFD functionality script
 import IFD_check_input
 
+#Import TCM functionality
+import tcm_errors
+
 ###Initiate logger###
 logger = logging.getLogger(__name__)
 
@@ -16,10 +18,9 @@ logger = logging.getLogger(__name__)
 class ArgumentParser(argparse.ArgumentParser):
     
     def error(self, message):
-        """ADD COMMENT"""
+        """Logs error and raises it (instead of exiting) so callers decide how to stop"""
         logger.critical(message)
-        print("An error has occurred. Check log file for information.")
-        subprocess.run(['kill', '0'])
+        raise tcm_errors.ArgumentError(message)
 
     """Disables prefix matching in ArgumentParser."""
     def _get_option_tuples(self, option_string):
@@ -71,8 +72,8 @@ def build_parser():
     
     Returns: object of class argparse.ArgumentParser with defined user inputs"""
 
-    # creating object of class ArgumentParser with program name and description
-    parser = argparse.ArgumentParser(
+    # creating object of class ArgumentParser (raising ArgumentError on bad arguments) with program name and description
+    parser = ArgumentParser(
         prog = 'Induced Fit Docking', 
         formatter_class=argparse.RawDescriptionHelpFormatter,
         usage='%(prog)s [options]',
@@ -106,6 +107,7 @@ def build_parser():
     job_control.add_argument('--jobname', dest = 'jobname', type = str, help = 'custom name for job to display on BMS RHEL8 cluster')
     job_control.add_argument('-d, --debug', dest = 'DEBUG', type = str2bool, help = 'shows details of job control to help with debugging; requires bool')
     job_control.add_argument('-o', '--output', dest = 'output', type = full_path, help = 'directory to place results and loggers in; must already exist')
+    job_control.add_argument('--preflight', dest = 'preflight', action = 'store_true', help = 'run every check (inputs, template, CRBN landmarks, default settings) and print a timed json report without submitting the IFD job')
     
     # adding specific arguments to add constraints
     h_bond_constraints.add_argument('--hbond', '--constraints', nargs = '+', dest = 'h_bond_constraints', type = full_path, action = ParseKeyValuePairs, 
@@ -1,6 +1,5 @@
 #Import Python modules
 import logging
-import subprocess
 import textwrap
 import argparse
 import sys
@@ -11,22 +10,18 @@ import IFD_write_input_file
 import IFD_find_info
 import IFD_default
 
+#Import TCM functionality
+import tcm_job_runner
+
 ###Initiate logger###
 logger = logging.getLogger(__name__)
 
 def run_job(command):
-    #Run provided command, joining list with space. Pipe stdout and sdterror to log file
-    process = subprocess.run(' '.join(command), stdout=subprocess.PIPE, \
-        stderr=subprocess.STDOUT, shell=True, text=True)
-    
-    #Iterate over sdtout and sdterror
-    for line in process.stdout.split('\n'):
-        #Ignore blank lines
-        if line != "":
-            #Ignore ExitStatus
-            if "ExitStatus" not in line:
-                #Write to log file for debugging
-                logger.debug(line)
+    """ Runs specific linux command (see tcm_job_runner.run_job)
+
+    Return: JobResult (exit code, duration and output tail) """
+    #Run provided command without a shell, streaming stdout and sdterror to log file as it is written
+    return tcm_job_runner.run_job(command, log = logger)
 
 # building run command from params dictionary
 def build_params_command(params, cmd_line = ['NGLIDECPU','NPRIMECPU', 'NOLOCAL', 'HOST', 'SUBHOST', 'TMPLAUNCHDIR', 'DEBUG']):
@@ -125,15 +120,15 @@ def make_input_file(args, ifd_dir):
     return args, input_file_path
 
 
-def ifd(args, params, SCHRODINGER, ifd_dir, input_file_name):
-    """ Runs Induced Fit Docking job 
+def build_command(params, SCHRODINGER, input_file_name):
+    """ Builds the command launching the Induced Fit Docking job (run from the directory of the .inp file)
 
     Input:
-    - args: original user-parsed arguments
     - params: dict of parsed args that correspond to job settings
     - SCHRODINGER: directory of schrodinger installation
-    - ifd_dir: directory containing job results and log 
-    - input_file_name: name of .inp file in ifd_dir """
+    - input_file_name: name of .inp file in ifd_dir
+
+    Return: list of run command """
 
     # get run command
     run_cmd = [f'{SCHRODINGER}/ifd']
@@ -146,7 +141,23 @@ def ifd(args, params, SCHRODINGER, ifd_dir, input_file_name):
 
     # log the cmd
     logger.info("Running IFD: %s"%' '.join(command))
+
+    return command
+
+def ifd(args, params, SCHRODINGER, ifd_dir, input_file_name):
+    """ Runs Induced Fit Docking job 
+
+    Input:
+    - args: original user-parsed arguments
+    - params: dict of parsed args that correspond to job settings
+    - SCHRODINGER: directory of schrodinger installation
+    - ifd_dir: directory containing job results and log 
+    - input_file_name: name of .inp file in ifd_dir
+
+    Return: JobResult of the submission command (exit code, duration and output tail) """
+
+    command = build_command(params, SCHRODINGER, input_file_name)
     
     # entering ifd_dir to run job 
     os.chdir(ifd_dir)
-    run_job(command)
+    return run_job(command)
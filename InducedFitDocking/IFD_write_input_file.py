@@ -398,19 +398,14 @@ def write_h_bond_constraints(hydrogen_bond_constraints):
 
     return h_bond_lines
     
-def write_input_file_from_template(template_inp, input_file_path, binding_site, ligand_file, hydrogen_bond_constraints, file_out_path = os.path.join(os.getcwd(), 'InducedFitDocking.inp')):
-    """ Writes an .inp file containing all the necessary stages of protein-protein docking to the specified directory (default is cwd).
-    Uses the stages and settings stored from template .inp file (either institutional with default setting or user-defined template setting).
-    Parses template .inp file and automatically fills out INPUT FILE, LIGAND_FILE (UNDER GLIDE_DOCKING2), HYDROGEN_BOND_CONSTRAINTS_INFORMATION
+def read_template_stages(template_inp):
+    """ Reads template .inp file and organizes lines by sections (by STAGE or INPUT_FILE). Lines before the first section
+    (comments) are dropped.
     
     Input:
-    - template_inp: path to template input file with pre-defined stages and settings but missing input file, ligand file, and hydrogen bond constraints and docking patterns
-    - input_file_path: path to input protein file for IFD
-    - binding_site: the position number of the co-crystallized ligand in the protein input file (e.g. C:502)
-    - ligand_file: the file path to .mae file containing ligand to dock
-    - hydrogen_bond_constraints: list of tuples containing constraints information on the CRBN protein when docking with ligand; each tuple contains the atom number and 'acceptor' or 'donor' 
-                                 (e.g. [(8440, 'acceptor'), (8479, 'donor'), (8451, ''donor')])
-    - file_out_path: path to output file (not directory containing file)"""
+    - template_inp: path to template input file
+    
+    Returns: list of sections, each a list of lines starting with the STAGE or INPUT_FILE line """
 
     stages = []
     current_stage = []
@@ -436,6 +431,62 @@ def write_input_file_from_template(template_inp, input_file_path, binding_site,
         # add last stage to stages
         if current_stage:
             stages.append(current_stage)
+
+    return stages
+
+def template_error(template_inp):
+    """ Checks that the template .inp file can be filled in automatically: it must have an empty INPUT_FILE, a GLIDE_DOCKING2 stage
+    and empty BINDING_SITE / LIGAND_FILE arguments in TRIM_SIDECHAINS and GLIDE_DOCKING2 stages (these are filled in from the inputs).
+    
+    Input:
+    - template_inp: path to template input file
+    
+    Return: boolean (True if error, False if no error) """
+
+    error = False
+    stages = read_template_stages(template_inp)
+    
+    # checking INPUT_FILE section
+    input_files = [stage for stage in stages if stage[0].lstrip().startswith("INPUT_FILE")]
+    if len(input_files) != 1:
+        logger.critical("IFD .inp template file must have exactly one INPUT_FILE")
+        error = True
+    elif len(input_files[0][0].strip().split()) != 1:
+        logger.critical("IFD .inp template file cannot have existing argument after INPUT_FILE")
+        error = True
+
+    # checking GLIDE_DOCKING2 stages exist
+    if not any(stage[0].lstrip().startswith("STAGE GLIDE_DOCKING2") for stage in stages):
+        logger.critical("IFD .inp template file must have at least one STAGE GLIDE_DOCKING2")
+        error = True
+
+    # checking arguments that are filled in are empty
+    for stage in stages:
+        stage_name = stage[0].strip()
+        if stage_name.startswith("STAGE TRIM_SIDECHAINS") or stage_name.startswith("STAGE GLIDE_DOCKING2"):
+            for line in stage[1:]:
+                if line.lstrip().startswith(("BINDING_SITE", "LIGAND_FILE")) and len(line.strip().split()) != 1:
+                    logger.critical(f"IFD .inp template file cannot have existing argument after {line.split()[0]} under {stage_name}")
+                    error = True
+
+    return error
+
+def write_input_file_from_template(template_inp, input_file_path, binding_site, ligand_file, hydrogen_bond_constraints, file_out_path = os.path.join(os.getcwd(), 'InducedFitDocking.inp')):
+    """ Writes an .inp file containing all the necessary stages of protein-protein docking to the specified directory (default is cwd).
+    Uses the stages and settings stored from template .inp file (either institutional with default setting or user-defined template setting).
+    Parses template .inp file and automatically fills out INPUT FILE, LIGAND_FILE (UNDER GLIDE_DOCKING2), HYDROGEN_BOND_CONSTRAINTS_INFORMATION
+    
+    Input:
+    - template_inp: path to template input file with pre-defined stages and settings but missing input file, ligand file, and hydrogen bond constraints and docking patterns
+    - input_file_path: path to input protein file for IFD
+    - binding_site: the position number of the co-crystallized ligand in the protein input file (e.g. C:502)
+    - ligand_file: the file path to .mae file containing ligand to dock
+    - hydrogen_bond_constraints: list of tuples containing constraints information on the CRBN protein when docking with ligand; each tuple contains the atom number and 'acceptor' or 'donor' 
+                                 (e.g. [(8440, 'acceptor'), (8479, 'donor'), (8451, ''donor')])
+    - file_out_path: path to output file (not directory containing file)"""
+
+    # organizing template lines by sections
+    stages = read_template_stages(template_inp)
     
     # initializing count of the total number (and current number) of glide stages
     glide_docking_stage_num = 0 
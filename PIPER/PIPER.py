@@ -9,6 +9,15 @@ import piper_check_input
 import piper_default    
 import piper_run
 import piper_constraints
+import piper_shards
+import piper_trim
+import piper_crop
+import piper_adaptive
+
+#Import TCM functionality
+import tcm_preflight
+import tcm_job_control
+import tcm_errors
 
 ###Initiate logger###
 logger = logging.getLogger()
@@ -16,6 +25,10 @@ logger = logging.getLogger()
 #Getting PIPER installation path 
 PIPER_path = os.path.dirname(__file__)
 
+# PIPER settings deciding the poses of a job (other settings decide where and how the job is run)
+DOCKING_SETTINGS = ['poses', 'rotations', 'refinement_protocol', 'raw', 'use_nonstandard_residue', 'shards', 'rotation_set', 'cluster_radius', 'trim_inputs', 'crop_radius',
+    'adaptive', 'coarse_rotations', 'refine_top', 'refine_angle', 'cluster_overlap', 'score_gap']
+
 def update_default_w_args(default, args):
     """ Updates the default arguments with user-inputted arguments to get
     final PIPER settings
@@ -30,16 +43,92 @@ def update_default_w_args(default, args):
 
     return default 
 
-def run_piper(piper_dir, SCHRODINGER, piper_args = None):
-    """ Runs PIPER job and associated tasks. 
+def get_default(args):
+    """ Gets default PIPER settings (from user json if argument passed in, otherwise institutional settings)
+    
+    Returns: dict containing default args """
+
+    institutional_path = 'None'
+    user_defined_path = None if args.default is None else args.default
+    return piper_default.main(PIPER_path, institutional_path, user_defined_path)
+
+def get_settings(args):
+    """ Gets final PIPER settings: default settings (see get_default) updated with the arguments. Used both to run the job
+    and to describe its docking (see docking_inputs), so both always see the same settings.
+
+    Returns: dictionary with final PIPER settings """
+
+    return update_default_w_args(get_default(args), args)
+
+def docking_inputs(piper_args):
+    """ Gets the inputs and settings deciding the poses of a PIPER job: protein files, chains, compiled constraints and
+    docking settings (not HOST, processors or job control settings), e.g. to find identical dockings of other runs (see
+    tcm_piper_store).
+
+    Input:
+    - piper_args: piper specific args (used in args passed into module)
+
+    Returns: tuple of (dict of input name to file path, dict of docking settings) """
+
+    #Getting final settings (same settings the job is run with, see prepare_piper)
+    params = get_settings(piper_args)
+
+    #Getting compiled constraints (same content as constraints.json of the job)
+    constraints = piper_constraints.parse_constraint_file(piper_args.constraint) if piper_args.constraint is not None else None
+
+    docking_settings = {k: params.get(k) for k in DOCKING_SETTINGS}
+    docking_settings.update(receptor_chain = piper_args.receptor_chain, ligand_chain = piper_args.ligand_chain, constraints = constraints)
+
+    return {'receptor': piper_args.receptor_prot, 'ligand': piper_args.ligand_prot}, docking_settings
+
+def preflight(piper_args = None):
+    """ Runs every check of a PIPER job (argument parsing, input validation, constraint validation and default settings) without
+    submitting the job, and prints a json report with the time spent in each check.
+    
+    Input:
+    - piper_args: piper specific args (used in args passed into module); parsed from command line if None
+    
+    Returns: boolean (True if a check failed, False if every check passed) """
+
+    report = tcm_preflight.Preflight('PIPER')
+
+    #Parsing the arguments
+    if piper_args is None:
+        parser = piper_parseargs.build_parser()
+        parsed = report.run('argument parsing', parser.parse_known_args, failed = lambda result: False)
+        if parsed is None: # can't run other checks without arguments
+            report.print_report()
+            return True
+        args, unknowns = parsed
+    else:
+        args = piper_args
+
+    #Checking receptor and ligand proteins
+    report.run('receptor validation', piper_check_input.invalid_protein_error, args.receptor_prot, args.receptor_chain)
+    report.run('ligand validation', piper_check_input.invalid_protein_error, args.ligand_prot, args.ligand_chain)
+
+    #Checking and compiling constraints if passed in
+    if args.constraint is not None:
+        report.run('constraint validation', piper_check_input.invalid_constraints_error, args, args.constraint)
+        report.run('constraint compilation', piper_constraints.parse_constraint_file, args.constraint, failed = lambda result: False)
+    else:
+        report.skip('constraint validation', 'no constraints file passed in')
+
+    #Getting default settings
+    report.run('default settings', get_default, args, failed = lambda result: not result)
+
+    report.print_report()
+    return not report.ok
+
+def prepare_piper(piper_dir, SCHRODINGER, piper_args = None):
+    """ Parses and checks arguments, builds constraints and gets final settings of PIPER job. 
     
     Requires:
     - piper_dir: directory of PIPER job (to store info and results of current PIPER job)
     - SCHRODINGER: location of SCHRODINGER installation
-    - piper_args: piper specific args (used in args passed into module)"""
-
-    #Logging the start of PIPER module
-    logger.info(f'PIPER started. Results and information in {piper_dir}')
+    - piper_args: piper specific args (used in args passed into module)
+    
+    Returns: tuple of (args, params) where params is dict of final PIPER settings """
 
     #Parsing and checking the arguments
     if piper_args is None: # if no arguments are passed in, parse and check
@@ -48,26 +137,97 @@ def run_piper(piper_dir, SCHRODINGER, piper_args = None):
     else: # o.w. check args and exit if error
         args = piper_args
         if piper_check_input.check_inputted_args(args):
-            sys.exit(0)
+            raise tcm_errors.InputError('PIPER inputs failed checks. See log for more detail.')
 
     #Building constraints and incorporating file into args if passed in
     if args.constraint is not None: 
         args = piper_constraints.main(args, piper_dir)
 
-    #Getting default settings (from user if argument passed in)
-    institutional_path = 'None'
-    user_defined_path = None if args.default is None else args.default
-    default = piper_default.main(PIPER_path, institutional_path, user_defined_path)
+    #Getting default settings (from user if argument passed in) updated with arguments to get final input
+    params = get_settings(args)
+
+    #Giving PIPER the selected chains without waters (trimmed files are cached across runs, see piper_trim); ligands of
+    #the receptor are kept when cropping, as cropping is anchored on its cocrystallized ligand, whatever its chain
+    if params.get('trim_inputs', True):
+        args = piper_trim.trim_inputs(args, piper_dir, keep_receptor_ligands = bool(params.get('crop_radius')))
 
-    #Updating default with arguments to get final input
-    params = update_default_w_args(default, args)
+    #Cropping proteins to residues around the interface anchors if asked (poses are mapped back onto the full-length
+    #proteins once the job completes, see piper_crop)
+    if params.get('crop_radius'):
+        args = piper_crop.crop_inputs(args, piper_dir, params['crop_radius'])
+
+    return args, params
+
+def run_piper(piper_dir, SCHRODINGER, piper_args = None):
+    """ Runs PIPER job and associated tasks. 
+    
+    Requires:
+    - piper_dir: directory of PIPER job (to store info and results of current PIPER job)
+    - SCHRODINGER: location of SCHRODINGER installation
+    - piper_args: piper specific args (used in args passed into module)
+    
+    Returns: JobResult of the PIPER submission (exit code, duration and output tail) """
+
+    #Logging the start of PIPER module
+    logger.info(f'PIPER started. Results and information in {piper_dir}')
+
+    #Getting final arguments and settings
+    args, params = prepare_piper(piper_dir, SCHRODINGER, piper_args)
+    if params.get('crop_radius'):
+        logger.warning(f'PIPER is not waited for, so poses of cropped proteins are not mapped back onto full-length proteins (see piper_crop.map_poses and {piper_dir}/{piper_crop.CROP_RECORD})')
+    if piper_adaptive.is_adaptive(params):
+        logger.warning('PIPER is not waited for, so the full rotation set is docked instead of adaptive sampling (see piper_adaptive.run_adaptive)')
 
     #Getting run command and running PIPER job
-    piper_run.piper(args, params, SCHRODINGER, piper_dir)
+    result = piper_run.piper(args, params, SCHRODINGER, piper_dir)
+    if result.returncode != 0:
+        logger.critical(f'PIPER job submission failed with exit code {result.returncode}. Last output: ' + ' | '.join(result.output_tail[-5:]))
+        return result
 
     #Logging run submission
     logger.info(f'PIPER protein-protein docking started. Results and more information found in {piper_dir}')
 
+    return result
+
+async def submit_piper(piper_dir, SCHRODINGER, piper_args = None):
+    """ Launches PIPER job under job control and waits for it to finish without blocking other jobs
+    (see tcm_job_control; many PIPER jobs can be driven at once with asyncio.gather).
+    
+    Requires:
+    - piper_dir: directory of PIPER job (to store info and results of current PIPER job)
+    - SCHRODINGER: location of SCHRODINGER installation
+    - piper_args: piper specific args (used in args passed into module)
+    
+    Returns: job dictionary with final job control status """
+
+    logger.info(f'PIPER started. Results and information in {piper_dir}')
+
+    args, params = prepare_piper(piper_dir, SCHRODINGER, piper_args)
+
+    # docking a coarse rotation set first, then refining around converged poses (or the rest of the rotation set) if asked
+    if piper_adaptive.is_adaptive(params):
+        job = await piper_adaptive.run_adaptive(piper_dir, SCHRODINGER, args, params, log = logger)
+        logger.info(f'Adaptive PIPER {job["job_id"]} finished with status {job["status"]}. Results found in {piper_dir}')
+
+    # splitting rotations into shards run on several hosts if asked (poses of the shards are merged into one output)
+    elif piper_shards.is_sharded(params):
+        job = await piper_shards.run_sharded(piper_dir, SCHRODINGER, args, params, log = logger)
+        logger.info(f'PIPER shards {job["job_id"]} finished with status {job["status"]}. Results found in {piper_dir}')
+    else:
+        command = piper_run.build_command(args, params, SCHRODINGER)
+        job = await tcm_job_control.run_job(command, cwd = piper_dir, log = logger, watch_paths = [piper_dir])
+        logger.info(f'PIPER job {job["job_id"]} finished with status {job["status"]}. Results found in {piper_dir}')
+
+    # mapping poses of cropped proteins back onto the full-length proteins
+    out_path = os.path.join(piper_dir, f'{args.jobname if args.jobname is not None else "prot_prot_docking"}-out.maegz')
+    if params.get('crop_radius') and tcm_job_control.succeeded(job) and os.path.isfile(out_path):
+        try:
+            piper_crop.map_poses(piper_dir, out_path)
+        except tcm_errors.StageError as e:
+            job.update(status = 'failed', output_tail = [str(e)])
+
+    return job
+
 def set_up(jobname = 'prot_prot_docking', output_directory = None):
     """ Initial setup of defining paths and loggers if the script is called as a standalaone function. 
     
@@ -108,6 +268,10 @@ def set_up(jobname = 'prot_prot_docking', output_directory = None):
 if __name__ == '__main__':
     """ If the script is called in by name (as a standalone module), it will define necessary paths and logger info and run the job. """
 
+    # Only running checks (no directories, loggers or job submission)
+    if '--preflight' in sys.argv:
+        sys.exit(1 if preflight() else 0)
+
     # Initially parsing user arguments to find whether an output directory and jobname was inputted
     jobname = 'prot_prot_docking'
     output_directory = None
@@ -121,5 +285,8 @@ if __name__ == '__main__':
     # Setting up paths and loggers with specific output directory or None
     master_dir, piper_dir, SCHRODINGER = set_up(jobname, output_directory)
 
-    # Running the piper job 
-    run_piper(piper_dir, SCHRODINGER)
\ No newline at end of file
+    # Running the piper job (argument errors are logged by the parser)
+    try:
+        run_piper(piper_dir, SCHRODINGER)
+    except tcm_errors.ArgumentError:
+        sys.exit(2)
\ No newline at end of file
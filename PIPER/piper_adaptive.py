@@ -0,0 +1,206 @@
+#Import Python modules
+import logging
+import math
+import os
+
+#Import optional modules (orientations of poses are only compared if numpy is installed)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#Import PIPER modules
+import piper_shards
+import piper_crop
+
+#Import TCM functionality
+import tcm_fast_reader
+import tcm_job_control
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# Adaptive (coarse-to-fine) rotation sampling of PIPER: the proteins are first docked with an evenly spread subset of the
+# rotation set. If the top poses have converged (most poses fall in a few clusters, clearly better scored than the other
+# clusters), only the rotations within refine_angle of the orientations of these promising clusters are docked next;
+# otherwise the rest of the rotation set is docked. Poses of both passes are merged into the final top poses (see
+# piper_shards.merge_shards). Adaptive sampling is set in the PIPER settings (json file or arguments):
+#   adaptive - dock coarse then fine (default false)
+#   coarse_rotations - number of rotations of the coarse pass
+#   refine_top - number of best clusters of the coarse pass refined
+#   refine_angle - rotations within this angle (degrees) of the orientation of a refined cluster are docked
+#   cluster_overlap - smallest fraction of coarse poses in the refined clusters for the coarse pass to have converged
+#   score_gap - smallest score gap between the refined clusters and the next cluster (fraction of best score) for the
+#   coarse pass to have converged
+# Rotations are passed to PIPER as rotation files (see piper_shards.rotation_set_of).
+ADAPTIVE_DEFAULTS = {'adaptive': False, 'coarse_rotations': 5000, 'refine_top': 5, 'refine_angle': 15.0, 'cluster_overlap': 0.5, 'score_gap': 0.05}
+
+def adaptive_settings(params):
+    """ Adaptive sampling settings of PIPER job (PIPER settings with ADAPTIVE_DEFAULTS for missing keys) """
+
+    return {key: params.get(key) if params.get(key) is not None else default for key, default in ADAPTIVE_DEFAULTS.items()}
+
+def is_adaptive(params):
+    """ True if the PIPER job docks a coarse rotation set before refining """
+
+    return bool(adaptive_settings(params)['adaptive'])
+
+def coarse_indexes(total, count):
+    """ Indexes of count rotations evenly spread over the rotation set (every rotation if count is not smaller than total)
+
+    Return: sorted list of indexes """
+
+    if count >= total:
+        return list(range(total))
+
+    return sorted({int(position * total / count) for position in range(count)})
+
+def rotation_matrices(rotations):
+    """ Rotation matrices of rotation lines (last 9 numbers of each line, row by row)
+
+    Return: numpy array of shape (rotations, 3, 3) """
+
+    return np.array([[float(value) for value in line.split()[-9:]] for line in rotations]).reshape(-1, 3, 3)
+
+def ca_xyz(protein_file):
+    """ Coordinates of the CA atoms of the first structure of a protein file (numpy array) """
+
+    title, atoms = next(tcm_fast_reader.read_structures(protein_file))
+    return atoms['xyz'][atoms['name'] == 'CA'].astype(float)
+
+def orientation(pose, receptor_xyz, ligand_xyz):
+    """ Orientation of the ligand protein relative to the receptor in a pose: rotation superposing the ligand input onto
+    the pose, in the frame of the receptor (see piper_crop.superpose)
+
+    Return: 3x3 rotation matrix """
+
+    receptor_part, ligand_part = piper_crop.split_pose(np.array(pose['ca'], dtype = float), receptor_xyz, ligand_xyz)
+    receptor_rotation = piper_crop.superpose(receptor_xyz, receptor_part)[0]
+    ligand_rotation = piper_crop.superpose(ligand_xyz, ligand_part)[0]
+
+    return receptor_rotation.T @ ligand_rotation
+
+def assess(out_paths, receptor_file, ligand_file, settings, cluster_radius):
+    """ Checks whether the top poses of the coarse pass have converged (cluster overlap and score gap, see settings) and
+    finds the orientations of the promising clusters.
+
+    Return: dictionary with converged (boolean), overlap, gap and orientations (rotation matrices of the promising clusters) """
+
+    poses = []
+    for shard, out_path in enumerate(out_paths, start = 1):
+        poses.extend(piper_shards.read_poses(out_path, shard)[1])
+    clusters = piper_shards.cluster_poses(piper_shards.rank_poses(poses), cluster_radius, len(poses))
+    promising = clusters[:settings['refine_top']]
+
+    # fraction of coarse poses in the promising clusters
+    overlap = sum(size for pose, size in promising) / len(poses) if poses else 0.0
+
+    # score gap between the worst promising cluster and the next cluster (relative to best score)
+    scores = [pose['score'] for pose, size in clusters]
+    if None in scores or not scores:
+        gap = 0.0
+    elif len(clusters) <= len(promising):
+        gap = math.inf
+    else:
+        gap = (scores[len(promising)] - scores[len(promising) - 1]) / max(abs(scores[0]), 1e-6)
+
+    receptor_xyz, ligand_xyz = ca_xyz(receptor_file), ca_xyz(ligand_file)
+    orientations = [orientation(pose, receptor_xyz, ligand_xyz) for pose, size in promising]
+
+    return {'converged': overlap >= settings['cluster_overlap'] and gap >= settings['score_gap'], 'overlap': overlap, 'gap': gap,
+        'orientations': orientations}
+
+def neighbour_indexes(matrices, orientations, angle):
+    """ Indexes of rotations within angle (degrees) of any of the orientations. Rotation sets may store a rotation or its
+    transpose, so rotations near either are kept.
+
+    Return: sorted list of indexes """
+
+    cos_limit = math.cos(math.radians(angle))
+    near = np.zeros(len(matrices), dtype = bool)
+    for rotation in orientations:
+        for target in (rotation, rotation.T):
+            # cosine of the rotation angle between the target and every rotation of the set: (trace(target^T M) - 1) / 2
+            cosines = (np.einsum('ij,nij->n', target, matrices) - 1) / 2
+            near |= cosines >= cos_limit
+
+    return np.flatnonzero(near).tolist()
+
+async def run_adaptive(piper_dir, SCHRODINGER, args, params, log = None):
+    """ Docks a coarse rotation set, then refines around promising orientations if the top poses converged (or docks the
+    rest of the rotation set if not), and merges the poses of both passes into {jobname}-out.maegz in piper_dir. The fine
+    pass is split into the shards of the PIPER settings (see piper_shards).
+
+    Input:
+    - piper_dir: directory of PIPER job
+    - SCHRODINGER: location of SCHRODINGER installation
+    - args: PIPER arguments (see PIPER.prepare_piper)
+    - params: final PIPER settings (see PIPER.prepare_piper)
+    - log: logger (default is logger of this module)
+
+    Return: job dictionary of both passes (see piper_shards.merged_job) with 'adaptive' (rotations docked and convergence
+    of the coarse pass) added
+
+    Raises: tcm_errors.InputError if the rotation set or the piper.py option to pass it is not set """
+
+    log = logger if log is None else log
+    settings = adaptive_settings(params)
+    cluster_radius = piper_shards.shard_settings(params)['cluster_radius']
+    jobname = args.jobname if args.jobname is not None else 'prot_prot_docking'
+
+    rotation_set = piper_shards.rotation_set_of(params, SCHRODINGER, log)
+    rotations = piper_shards.read_rotations(rotation_set, params['rotations'])
+
+    # docking the coarse rotation set as a single job
+    coarse = coarse_indexes(len(rotations), settings['coarse_rotations'])
+    log.info(f'Docking {len(coarse)} of {len(rotations)} rotations of {rotation_set} (coarse pass)')
+    coarse_job, out_paths = await piper_shards.run_rotations(os.path.join(piper_dir, 'coarse'), SCHRODINGER, args, params,
+        [rotations[index] for index in coarse], f'{jobname}_coarse', shards = 1, log = log)
+    if not tcm_job_control.succeeded(coarse_job):
+        return coarse_job
+    jobs = [coarse_job]
+
+    # choosing rotations of the fine pass: around promising orientations if the coarse pass converged, otherwise every rotation
+    remaining = sorted(set(range(len(rotations))) - set(coarse))
+    assessment = {'converged': False, 'overlap': None, 'gap': None}
+    if remaining and np is not None:
+        try:
+            assessment = assess(out_paths, args.receptor_prot, args.ligand_prot, settings, cluster_radius)
+        except (OSError, ValueError, StopIteration) as e: # docking the full rotation set is always correct, only slower
+            log.warning(f'Could not assess convergence of coarse PIPER poses ({e}); docking every rotation')
+    elif remaining:
+        log.warning('numpy is not installed; docking every rotation after the coarse pass')
+
+    if remaining and assessment['converged']:
+        near = set(neighbour_indexes(rotation_matrices(rotations), assessment['orientations'], settings['refine_angle']))
+        fine = [index for index in remaining if index in near]
+        log.info(f'Coarse PIPER poses converged ({assessment["overlap"]:.0%} of poses in {len(assessment["orientations"])} best clusters, '
+            f'score gap {assessment["gap"]:.1%}); refining {len(fine)} rotations within {settings["refine_angle"]} degrees of their orientations')
+    else:
+        fine = remaining
+        if remaining:
+            log.info('Coarse PIPER poses did not converge' + (f' ({assessment["overlap"]:.0%} of poses in best clusters, score gap {assessment["gap"]:.1%})'
+                if assessment['overlap'] is not None else '') + f'; docking the remaining {len(fine)} rotations')
+
+    # docking the fine pass (split into shards if asked)
+    if fine:
+        fine_job, fine_paths = await piper_shards.run_rotations(os.path.join(piper_dir, 'fine'), SCHRODINGER, args, params,
+            [rotations[index] for index in fine], f'{jobname}_fine', log = log)
+        jobs.append(fine_job)
+        out_paths = out_paths + fine_paths
+
+    job = piper_shards.merged_job(jobs, piper_dir)
+    job['adaptive'] = {'rotations': len(rotations), 'coarse': len(coarse), 'fine': len(fine), 'converged': assessment['converged'],
+        'overlap': assessment['overlap'], 'gap': assessment['gap']}
+    if not tcm_job_control.succeeded(job):
+        return job
+
+    # merging poses of both passes
+    try:
+        piper_shards.merge_shards(out_paths, os.path.join(piper_dir, f'{jobname}-out.maegz'), params['poses'], cluster_radius)
+    except (OSError, ValueError, StopIteration) as e:
+        log.critical(f'Could not merge poses of coarse and fine PIPER passes: {e}')
+        job.update(status = 'failed', output_tail = [f'merge of coarse and fine poses failed: {e}'])
+
+    log.info(f'Adaptive PIPER docked {len(coarse) + len(fine)} of {len(rotations)} rotations')
+    return job
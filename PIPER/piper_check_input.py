@@ -2,9 +2,8 @@
 import logging
 import re
 
-# #Import Schrodinger modules 
-from schrodinger.structure import StructureReader, StructureWriter
-from schrodinger.application.prepwizard2.diagnostics import get_problems
+#Import TCM functionality
+import tcm_structure_scan
 
 ###Initiate logger###
 logger = logging.getLogger(__name__)
@@ -39,29 +38,21 @@ def protein_loading_error(protein_file, chain):
     Logs more specific error messages related to loading the protein
     
     Return: boolean (True if error occurs, False if no error)"""
-<<<<<<< Updated upstream
 
-=======
->>>>>>> Stashed changes
     error = False
-    # tries loading in the protein and catches specific errors
-    try:
-        protein_chains = set() 
-        for structure in StructureReader(protein_file): # reads all the structures in file 
-            structure_exists = True # structures do exist in the file
-            for atom in structure.atom: # adds in all chains in the file 
-                protein_chains.add(atom.chain)
-
-        if not structure_exists: # no structure found
-            logger.critical(f'No protein structure exists within the file.')
-            return True # critical error and can't check other conditions
-        
-        if (chain is not None) and (chain not in protein_chains): # user-inputted chain doesn't exist in the file 
-            logger.critical(f'Selected chain does not exist in protein file. Please select another chain from {protein_chains} or upload another file')
-            error = True
+    # single scan of the protein file shared with the other checks (and with TCM checks on the same file)
+    summary = tcm_structure_scan.get_summary(protein_file)
+
+    if not summary['loaded']: # exceptions / error arise in trying to load protein file
+        logger.critical(f'Error occured in loading protein: {summary["error"]}. ')
+        return True
 
-    except Exception as e: # other exceptions / error arise in trying to load and check protein file
-        logger.critical(f'Error occured in loading protein: {e}. ')
+    if summary['structures'] == 0: # no structure found
+        logger.critical(f'No protein structure exists within the file.')
+        return True # critical error and can't check other conditions
+    
+    if (chain is not None) and (chain not in summary['chains']): # user-inputted chain doesn't exist in the file 
+        logger.critical(f'Selected chain does not exist in protein file. Please select another chain from {set(summary["chains"])} or upload another file')
         error = True
     
     # returns error boolean
@@ -74,31 +65,30 @@ def protein_diagnostics_error(protein_file_path):
     Return: boolean (True if issues are found, False if no issues) """
 
     error = False 
-    structures = StructureReader(protein_file_path) # reading in the protein file 
+    summary = tcm_structure_scan.get_summary(protein_file_path) # diagnostics results from the single scan of the protein file 
 
-    for st in structures: # iterating through the protein file
-        problems = get_problems(st) # getting problems
+    for problems in summary['problems'] or []: # iterating through the diagnostics of each structure in the protein file
 
-        valences = problems.invalid_types # checking valence error and raising error if not empty list
-        if valences:
-            logger.critical('Protein not correctly prepared, issues with valence identified.')
+        if problems['invalid_types']: # checking valence error
+            logger.critical(f'Protein not correctly prepared, issues with valence identified in structure {problems["structure"]}.')
             error = True 
 
-        missing = problems.missing # checking missing atom error and raising error if not empty list 
-        if missing:
-            logger.critical('Protein not correctly prepared, issues with missing atoms identified')
+        if problems['missing']: # checking missing atom error
+            logger.critical(f'Protein not correctly prepared, issues with missing atoms identified in structure {problems["structure"]}')
             error = True
 
-        overlapping = problems.overlapping # checking overlapping positions error and raising error if not empty list
-        if overlapping:
-            logger.critical('Protein not correctly prepared, issues with overlapping positions')
+        if problems['overlapping']: # checking overlapping positions error
+            logger.critical(f'Protein not correctly prepared, issues with overlapping positions in structure {problems["structure"]}')
             error = True
 
-        alternates = problems.alternates # checking alternate conformations error and raising error if not empty list 
-        if alternates:
-            logger.critical('Protein not correctly prepared, issues with alternate conformations')
+        if problems['alternates']: # checking alternate conformations error
+            logger.critical(f'Protein not correctly prepared, issues with alternate conformations in structure {problems["structure"]}')
             error = True 
 
+    # diagnostics stopped at first structure with issues
+    if summary['partial']:
+        logger.critical(f'Diagnostics stopped at the first structure with issues (fail fast); later structures of {protein_file_path} were not checked')
+
     return error
 
 def invalid_protein_error(protein_file, chain):
@@ -116,13 +106,8 @@ def invalid_protein_error(protein_file, chain):
         return True
 
     # checks protein preparation
-<<<<<<< Updated upstream
     if protein_diagnostics_error(protein_file):
         return True
-=======
-    # if protein_diagnostics_error(protein_file):
-       # return True
->>>>>>> Stashed changes
 
 # checking the constraints .txt file inputs
 
@@ -169,12 +154,15 @@ def residue_error(residue_info, protein_type, args):
     else:
         raise AssertionError("protein type can only be receptor or ligand")
     
-    for st in StructureReader(protein_file):
-        for chain in st.chain:
-            for residue in chain.residue:
-                if (residue.pdbres.replace(" ", "") == residue_info[:3]) and (residue.resnum == int(residue_info[3:])): # sometimes pdbres has empty spaces, so remove those
-                    if (protein_chain is None) or (residue.chain == protein_chain):
-                        return False # residue correctly found
+    # splitting residue info into residue type and number (e.g. 'HIS375' -> 'HIS', 375)
+    try:
+        residue_key = (protein_chain, residue_info[:3], int(residue_info[3:]))
+    except ValueError:
+        return True # residue number is not an integer so residue can't exist
+
+    # looking up residue in the index built once from the protein file
+    if residue_key in tcm_structure_scan.get_residue_index(protein_file):
+        return False # residue correctly found
     
     return True # residue not found 
                 
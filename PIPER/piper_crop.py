@@ -0,0 +1,250 @@
+#Import Python modules
+import logging
+import json
+import os
+
+#Import TCM functionality
+import tcm_errors
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# Interface cropping of PIPER inputs: the cost of PIPER grows with the size of the proteins while only the binding site of
+# CRBN and one face of the POI matter for a molecular glue complex. Cropping keeps the residues within crop_radius (A) of
+# an anchor (the cocrystallized ligand of the receptor, and residues of distance and attraction constraints), caps the cut
+# ends, and docks the cropped proteins. As PIPER moves the proteins as rigid bodies, every docked pose is then mapped back
+# onto the full-length proteins by superposing the CA atoms of the cropped proteins onto the pose.
+
+# name of file in PIPER directory recording the full-length and cropped proteins (read when mapping poses back)
+CROP_RECORD = 'crop.json'
+
+# kept residues of a chain separated by at most this many residues are joined (fewer, larger fragments to cap)
+GAP_FILL = 3
+
+# largest RMSD (A) of the superposition of a cropped protein onto a pose for the pose to be mapped back
+MAX_MAPPING_RMSD = 1.0
+
+def constraint_anchors(constraint_file):
+    """ Reads the residues named in distance and attraction constraints of a PIPER constraints file (repulsion residues are
+    kept away from the interface, so they are not anchors)
+
+    Return: dictionary of protein type (receptor or ligand) to set of (resnum, pdbres) """
+
+    anchors = {'receptor': set(), 'ligand': set()}
+    if constraint_file is None:
+        return anchors
+
+    def residue(text): # e.g. 'HIS238' -> (238, 'HIS')
+        return int(text[3:]), text[:3]
+
+    with open(constraint_file, 'r') as f:
+        for line in f:
+            split_line = line.strip().split()
+            if not split_line:
+                continue
+            if split_line[0] == 'distance':
+                anchors['receptor'].add(residue(split_line[3]))
+                anchors['ligand'].add(residue(split_line[4]))
+            elif split_line[0] == 'attraction':
+                anchors[split_line[2]].update(residue(text) for text in split_line[3:])
+
+    return anchors
+
+def anchor_atoms(st, residues, include_ligands, chain = None):
+    """ Indexes of anchor atoms of a structure: atoms of the given residues on the docked chain (constraint residues are
+    numbered on the chain given to PIPER; any chain if None) and, if include_ligands, of the ligands found in the structure
+    on any chain (e.g. the cocrystallized IMiD of CRBN)
+
+    Return: list of atom indexes """
+
+    atoms = [atom.index for residue in st.residue if (chain is None or residue.chain == chain) and (residue.resnum, residue.pdbres.strip()) in residues
+        for atom in residue.atom]
+    if include_ligands:
+        from schrodinger.structutils.analyze import find_ligands # imported when first needed (slow to import)
+        atoms.extend(index for ligand in find_ligands(st) for index in ligand.atom_indexes)
+
+    return atoms
+
+def interface_atoms(st, anchors, radius):
+    """ Atoms of the residues within radius of an anchor atom, joining kept residues of a chain separated by at most
+    GAP_FILL residues
+
+    Return: list of atom indexes """
+
+    import numpy as np
+
+    xyz = st.getXYZ()
+    anchor_xyz = xyz[np.array(anchors) - 1]
+    residues = list(st.residue)
+
+    # keeping residues with any atom within radius of an anchor atom
+    keep = []
+    for residue in residues:
+        indexes = np.array([atom.index for atom in residue.atom]) - 1
+        distances = np.linalg.norm(xyz[indexes][:, None, :] - anchor_xyz[None, :, :], axis = 2)
+        keep.append(bool((distances <= radius).any()))
+
+    # joining short gaps between kept residues of the same chain
+    kept = [position for position, kept_residue in enumerate(keep) if kept_residue]
+    for before, after in zip(kept, kept[1:]):
+        if 1 < after - before <= GAP_FILL + 1 and residues[before].chain == residues[after].chain:
+            for position in range(before + 1, after):
+                keep[position] = True
+
+    return [atom.index for residue, kept_residue in zip(residues, keep) if kept_residue for atom in residue.atom]
+
+def cap_ends(st):
+    """ Caps the cut ends of a cropped structure with ACE / NMA groups (left uncapped if capping is not available) """
+
+    try:
+        from schrodinger.protein.captermini import CapTermini # imported when first needed (slow to import)
+        CapTermini(st)
+    except Exception as e: # cropping still works without caps, the cut ends are only left charged
+        logger.warning(f'Could not cap cut ends of cropped protein: {e}')
+
+    return st
+
+def crop_protein(protein_file, anchors, include_ligands, radius, out_path, chain = None):
+    """ Writes the cropped version of a protein (interface residues around its anchors, with capped ends; see anchor_atoms)
+
+    Return: tuple of (number of atoms of full protein, number of atoms kept), or None if the protein has no anchor (not cropped) """
+
+    from schrodinger import structure # imported when first needed (slow to import)
+
+    st = structure.StructureReader.read(protein_file)
+    atoms = anchor_atoms(st, anchors, include_ligands, chain)
+    if not atoms:
+        return None
+
+    kept = interface_atoms(st, atoms, radius)
+    cropped = cap_ends(st.extract(kept, copy_props = True))
+    cropped.write(out_path)
+
+    return st.atom_total, len(kept)
+
+def crop_inputs(args, piper_dir, radius):
+    """ Replaces the receptor and ligand proteins of the PIPER arguments with their cropped versions and records the
+    full-length proteins in piper_dir (see map_poses). Proteins without anchor are docked in full.
+
+    Input:
+    - args: PIPER arguments (receptor_prot, ligand_prot, their chains and constraint)
+    - piper_dir: directory of PIPER job
+    - radius: distance (A) from anchors within which residues are kept
+
+    Return: args with cropped receptor_prot and ligand_prot """
+
+    anchors = constraint_anchors(getattr(args, 'constraint', None))
+    record = {'radius': radius, 'cropped': []}
+
+    for protein_type, arg in [('receptor', 'receptor_prot'), ('ligand', 'ligand_prot')]:
+        full_path = getattr(args, arg)
+        cropped_path = os.path.join(os.path.abspath(piper_dir), f'{protein_type}_cropped.mae')
+
+        sizes = crop_protein(full_path, anchors[protein_type], protein_type == 'receptor', radius, cropped_path, getattr(args, f'{protein_type}_chain', None))
+        if sizes is None:
+            logger.info(f'No anchor found on {protein_type} {full_path} (cocrystallized ligand or constraint residues); docking full protein')
+            record[protein_type] = {'full': full_path, 'cropped': full_path}
+            continue
+
+        logger.info(f'Cropped {protein_type} {full_path} to residues within {radius} A of its anchors ({sizes[1]} of {sizes[0]} atoms kept) in {cropped_path}')
+        record[protein_type] = {'full': full_path, 'cropped': cropped_path}
+        record['cropped'].append(protein_type)
+        setattr(args, arg, cropped_path)
+
+    with open(os.path.join(piper_dir, CROP_RECORD), 'w') as f:
+        json.dump(record, f, indent = 2)
+
+    return args
+
+def ca_xyz(st):
+    """ Coordinates of the CA atoms of a structure in atom order (numpy array) """
+
+    import numpy as np
+
+    return np.array([atom.xyz for atom in st.atom if atom.pdbname.strip() == 'CA' and atom.element == 'C'], dtype = float)
+
+def superpose(mobile, target):
+    """ Rigid transform best superposing mobile coordinates onto target coordinates (Kabsch)
+
+    Return: tuple of (rotation matrix, translation, RMSD after superposition) """
+
+    import numpy as np
+
+    mobile_center, target_center = mobile.mean(axis = 0), target.mean(axis = 0)
+    u, s, vt = np.linalg.svd((mobile - mobile_center).T @ (target - target_center))
+    d = np.sign(np.linalg.det(u @ vt))
+    rotation = (u @ np.diag([1.0, 1.0, d]) @ vt).T
+    translation = target_center - rotation @ mobile_center
+    rmsd = float(np.sqrt((((mobile @ rotation.T + translation) - target) ** 2).sum(axis = 1).mean()))
+
+    return rotation, translation, rmsd
+
+def split_pose(pose_xyz, receptor_xyz, ligand_xyz):
+    """ Finds the CA atoms of the receptor and ligand in the CA atoms of a pose (receptor first or ligand first, whichever
+    superposes best)
+
+    Return: tuple of (receptor CA coordinates, ligand CA coordinates) of the pose """
+
+    receptor_total, ligand_total = len(receptor_xyz), len(ligand_xyz)
+    if len(pose_xyz) != receptor_total + ligand_total:
+        raise ValueError(f'pose has {len(pose_xyz)} CA atoms, cropped proteins have {receptor_total} and {ligand_total}')
+
+    orders = [(pose_xyz[:receptor_total], pose_xyz[receptor_total:]), (pose_xyz[ligand_total:], pose_xyz[:ligand_total])]
+    return min(orders, key = lambda order: superpose(receptor_xyz, order[0])[2] + superpose(ligand_xyz, order[1])[2])
+
+def map_poses(piper_dir, out_path):
+    """ Maps the poses of cropped proteins back onto the full-length proteins: the full-length receptor and ligand are moved
+    by the rigid transforms superposing the cropped proteins onto each pose, merged and given the properties of the pose
+    (e.g. PIPER scores). Poses of cropped proteins are kept in -cropped-out.maegz.
+
+    Input:
+    - piper_dir: directory of PIPER job (holding the crop record, see crop_inputs)
+    - out_path: -out.maegz of the PIPER job (replaced by full-length poses)
+
+    Return: number of poses mapped
+
+    Raises: tcm_errors.StageError if a pose can't be mapped back """
+
+    from schrodinger import structure # imported when first needed (slow to import)
+
+    with open(os.path.join(piper_dir, CROP_RECORD), 'r') as f:
+        record = json.load(f)
+    if not record['cropped']:
+        return 0 # poses are already full-length
+
+    # full-length proteins and CA atoms of the docked (cropped) proteins (a protein that was not cropped is its own cropped version)
+    proteins = {}
+    for protein_type in ('receptor', 'ligand'):
+        full = structure.StructureReader.read(record[protein_type]['full'])
+        proteins[protein_type] = (full, ca_xyz(full if record[protein_type]['cropped'] == record[protein_type]['full'] else structure.StructureReader.read(record[protein_type]['cropped'])))
+
+    cropped_out = out_path.replace('-out.maegz', '-cropped-out.maegz')
+    os.replace(out_path, cropped_out)
+
+    mapped = 0
+    with structure.StructureWriter(out_path) as writer:
+        for number, pose in enumerate(structure.StructureReader(cropped_out), start = 1):
+            try:
+                pose_parts = dict(zip(('receptor', 'ligand'), split_pose(ca_xyz(pose), proteins['receptor'][1], proteins['ligand'][1])))
+
+                # moving every full-length protein as its cropped version was moved in the pose
+                complex_st = None
+                for protein_type, (full, cropped_xyz) in proteins.items():
+                    rotation, translation, rmsd = superpose(cropped_xyz, pose_parts[protein_type])
+                    if rmsd > MAX_MAPPING_RMSD:
+                        raise ValueError(f'{protein_type} superposes with RMSD {rmsd:.2f} A')
+                    moved = full.copy()
+                    moved.setXYZ(full.getXYZ() @ rotation.T + translation)
+                    complex_st = moved if complex_st is None else complex_st.merge(moved, copy_props = True)
+
+            except ValueError as e:
+                logger.critical(f'Could not map PIPER pose {number} of {cropped_out} back onto full-length proteins: {e}')
+                raise tcm_errors.StageError(f'Could not map PIPER pose {number} onto full-length proteins')
+
+            for key in pose.property:
+                complex_st.property[key] = pose.property[key]
+            writer.append(complex_st)
+            mapped += 1
+
+    logger.info(f'Mapped {mapped} PIPER poses of cropped proteins onto full-length proteins in {out_path}')
+    return mapped
@@ -3,12 +3,14 @@ import logging
 import textwrap
 import argparse
 import sys
-import subprocess
 import os
 
 #Import PIPER functionality scripts
 import piper_check_input
 
+#Import TCM functionality
+import tcm_errors
+
 ###Initiate logger###
 logger = logging.getLogger(__name__)
 
@@ -19,10 +21,9 @@ PIPER_path = os.path.dirname(__file__)
 class ArgumentParser(argparse.ArgumentParser):
     
     def error(self, message):
-        """Logs error and tells user to check the log file. Triggers a termination command"""
+        """Logs error and raises it (instead of exiting) so callers decide how to stop"""
         logger.critical(message)
-        print("An error has occurred. Check log file for information.")
-        subprocess.run(['kill', '0'])
+        raise tcm_errors.ArgumentError(message)
 
     """Disables prefix matching in ArgumentParser."""
     def _get_option_tuples(self, option_string):
@@ -52,8 +53,8 @@ def build_parser():
     - parser: object of class argparse.ArgumentParser with defined user inputs
     - cmd_line: list of dest in parser that actually correspond to flags passed to PIPER on linux cmd line """
 
-    # creating object of class ArgumentParser with program name and description
-    parser = argparse.ArgumentParser(
+    # creating object of class ArgumentParser (raising ArgumentError on bad arguments) with program name and description
+    parser = ArgumentParser(
         prog = 'PIPER Protein-Protein Docking', 
         formatter_class=argparse.RawDescriptionHelpFormatter,
         usage='%(prog)s [options]',
@@ -74,15 +75,9 @@ def build_parser():
     default = parser.add_argument_group('DEFAULT SETTINGS') # arguments related to changing default PIPER settings (impt for module in TCM)
 
     # adding specific arguments to our input group
-<<<<<<< Updated upstream
-    input.add_argument('-r', '--receptor', '--rec', dest = 'receptor', required = True, type = full_path, help = 'protein file acting as receptor in PIPER docking; must be .mae or .pdb')
-    input.add_argument('--r_chain','--receptor_chain', dest = 'receptor_chain', type = str, help = 'specific chain in receptor protein to use as receptor')
-    input.add_argument('-l', '--ligand', '--lig', dest = 'ligand', required = True, type = full_path, help = 'protein file acting as ligand in PIPER docking; must be .mae or .pdb')
-=======
     input.add_argument('-r', '--receptor', '--rec', dest = 'receptor_prot', required = True, type = full_path, help = 'protein file acting as receptor in PIPER docking; must be .mae or .pdb')
     input.add_argument('--r_chain','--receptor_chain', dest = 'receptor_chain', type = str, help = 'specific chain in receptor protein to use as receptor')
     input.add_argument('-l', '--ligand', '--lig', dest = 'ligand_prot', required = True, type = full_path, help = 'protein file acting as ligand in PIPER docking; must be .mae or .pdb')
->>>>>>> Stashed changes
     input.add_argument('--l_chain', '--ligand_chain', dest = 'ligand_chain', type = str, help = 'specific chain in ligand protein to use as ligand')
     
     # adding specific arguments to change job settings / options 
@@ -90,38 +85,53 @@ def build_parser():
     options.add_argument('--refinement_protocol', '--refinement', choices = ['none', 'interface', 'vacuum_minimize', 'minimize'], dest = 'refinement_protocol', help = 'Refinement protocol to run after docking')
     options.add_argument('--rotations', dest = 'rotations', type = int, help = 'number of rotation matrices to use from rotation file')
     options.add_argument('--poses', dest = 'poses', type = int, help = 'max number of different poses to return from docking')
+    options.add_argument('--trim_inputs', dest = 'trim_inputs', type = str2bool, help = 'dock copies of the proteins with only the selected chains and no waters (cached across runs; default true); requires bool')
+    options.add_argument('--crop_radius', dest = 'crop_radius', type = float, help = 'dock only residues within this distance (A) of the cocrystallized ligand of the receptor and of constraint residues, then map poses back onto full-length proteins (default is no cropping)')
+    options.add_argument('--adaptive', dest = 'adaptive', type = str2bool, help = 'dock an evenly spread subset of the rotations first, then only rotations near the best poses if they converged (otherwise the rest of the rotations); see piper_adaptive.py; requires bool')
+    options.add_argument('--coarse_rotations', dest = 'coarse_rotations', type = int, help = 'number of rotations docked first in adaptive mode (default 5000)')
+    options.add_argument('--refine_angle', dest = 'refine_angle', type = float, help = 'rotations within this angle (degrees) of the best coarse poses are docked in adaptive mode (default 15)')
     options.add_argument('--raw', dest = 'raw', type = str2bool, help = 'store all poses in pose-viewer format without refinement (overrides refinement protocol to none); requires bool')
 
     # adding specific arguments to change server/job info group
-<<<<<<< Updated upstream
-    job_control.add_argument('--host', dest = 'HOST', type = str, help = 'specific host on BMS RHEL8 cluster to submit job to')
-    job_control.add_argument('--jobname', dest = 'jobname', type = str, help = 'custom name for job to display on BMS RHEL8 cluster')
-    job_control.add_argument('--ompi', dest = 'OMPI', type = int, help = 'number of processors to run job on')
-    job_control.add_argument('-d, --debug', dest = 'DEBUG', type = str2bool, help = 'shows details of job control to help with debugging; requires bool')
-    job_control.add_argument('--job_id', dest = 'JOBID', type = str2bool, help = 'runs the job through job control layer; requires bool')
-=======
     job_control.add_argument('--host','--HOST', dest = 'HOST', type = str, help = 'specific host on BMS RHEL8 cluster to submit job to')
     job_control.add_argument('--jobname','--JOBNAME', dest = 'jobname', type = str, help = 'custom name for job to display on BMS RHEL8 cluster')
     job_control.add_argument('--ompi', '--OMPI', dest = 'OMPI', type = int, help = 'number of processors to run job on')
     job_control.add_argument('-d, --debug', '--DEBUG', dest = 'DEBUG', type = str2bool, help = 'shows details of job control to help with debugging; requires bool')
     job_control.add_argument('--job_id', '--JOBID', dest = 'JOBID', type = str2bool, help = 'runs the job through job control layer; requires bool')
->>>>>>> Stashed changes
     job_control.add_argument('--TMPLAUNCHDIR', dest = 'TMPLAUNCHDIR', type = str2bool, help = 'launches temporary directory to store the data used by system; requires bool')
+    job_control.add_argument('--shards', dest = 'shards', type = int, help = 'number of ranges the rotation set is split into, each docked by its own PIPER job (poses are merged; see piper_shards.py)')
+    job_control.add_argument('--shard_hosts', dest = 'shard_hosts', nargs = '+', help = 'HOSTs the PIPER shards are submitted to, in turn (default is HOST)')
     job_control.add_argument('-o', '--output', dest = 'output', type = full_path, help = 'directory to place results and loggers in; must already exist')
 
     # adding specific arguments to add constraints
-<<<<<<< Updated upstream
-    constraints.add_argument('--constraint', dest = 'constraints_file', type = full_path, 
-=======
     constraints.add_argument('--constraint', '--constraints', dest = 'constraint', type = full_path, 
->>>>>>> Stashed changes
         help = f"Input .txt file containing all constraints information (see example input at {PIPER_path}/example_PIPER_constraints.txt")
     
     # adding specific arguments to change default settings (also for use in modules in which TCM workflow requires default json files to change settings of jobs)
     default.add_argument('--default', dest = 'default', type = full_path, help = 'json file containing the default settings for IFD job')
+
+    # adding specific argument to only run checks
+    job_control.add_argument('--preflight', dest = 'preflight', action = 'store_true', help = 'run every check (inputs, constraints, default settings) and print a timed json report without submitting the PIPER job')
     
     return parser
 
+def build_args(**values):
+    """ Builds PIPER arguments for callers passing arguments in instead of parsing the command line (e.g. TCM): every
+    argument of the parser at its default, updated with values, so checks and settings find every argument they read
+    (e.g. receptor_chain, constraint, default).
+
+    Input:
+    - values: argument dest to value (e.g. receptor_prot, ligand_prot, default)
+
+    Return: Namespace of PIPER arguments """
+
+    parser = build_parser()
+    args = argparse.Namespace(**{action.dest: action.default for action in parser._actions if action.dest != 'help'})
+    for dest, value in values.items():
+        setattr(args, dest, value)
+
+    return args
+
 def parse_and_check_args():
     """ Builds parser and parse user's inputs. Then, runs checks on user inputs and exits if fatal error found.
     
@@ -129,7 +139,7 @@ def parse_and_check_args():
     args - recognized user-parsed arguments """
 
     # building parser with defined user inputs
-    parser, cmd_line = build_parser() 
+    parser = build_parser() 
 
     # using parser to parse user inputs
     # collecting known and unknown arguments
@@ -138,7 +148,7 @@ def parse_and_check_args():
     if piper_check_input.check_parsed_args(parser ,sys.argv, args, unknowns) is True:
         sys.exit(0) # exits because fatal error found
     
-    return args, cmd_line
+    return args
 
 ## DEPRECATED
     # constraints.add_argument('--dist', '--distance_constraint', nargs = '+', dest = 'distance_constraint', 
@@ -1,35 +1,26 @@
 #Import Python modules
 import logging
-import subprocess
 import textwrap
 import argparse
 import sys
 import os
 
+#Import TCM functionality
+import tcm_job_runner
+
 ###Initiate logger###
 logger = logging.getLogger(__name__)
 
 def run_job(command):
-    #Run provided command, joining list with space. Pipe stdout and sdterror to log file
-    process = subprocess.run(' '.join(command), stdout=subprocess.PIPE, \
-        stderr=subprocess.STDOUT, shell=True, text=True)
-    
-    #Iterate over sdtout and sdterror
-    for line in process.stdout.split('\n'):
-        #Ignore blank lines
-        if line != "":
-            #Ignore ExitStatus
-            if "ExitStatus" not in line:
-                #Write to log file for debugging
-                logger.debug(line)
+    """ Runs specific linux command (see tcm_job_runner.run_job)
+
+    Return: JobResult (exit code, duration and output tail) """
+    #Run provided command without a shell, streaming stdout and sdterror to log file as it is written
+    return tcm_job_runner.run_job(command, log = logger)
 
 # building run command from params dictionary
 def build_params_command(params, cmd_line = ['poses', 'rotations', 'refinement_protocol', 'raw', 'OMPI', 
-<<<<<<< Updated upstream
-                'JOBID', 'use_non_standard_residue', 'HOST', 'TMPLAUNCHDIR', 'DEBUG', 'constraints_file']):
-=======
                 'JOBID', 'use_nonstandard_residue', 'HOST', 'TMPLAUNCHDIR', 'DEBUG', 'constraints_file']):
->>>>>>> Stashed changes
     """ Builds terminal commands from params dictionary.
 
     Input: 
@@ -94,13 +85,15 @@ def get_inputs(args):
     
     return input
 
-def piper(args, params, SCHRODINGER, piper_dir):
-    """ Runs piper job.
+def build_command(args, params, SCHRODINGER):
+    """ Builds the command launching the piper job.
     
     Input:
     - args: original user-parsed arguments
     - params: dict of parsed args that correspond to job settings
-    - SCHRODINGER: directory of schrodinger installation """
+    - SCHRODINGER: directory of schrodinger installation
+
+    Return: list of run command """
 
     #get run command
     run_cmd = [f'{SCHRODINGER}/run -FROM psp piper.py']
@@ -120,9 +113,23 @@ def piper(args, params, SCHRODINGER, piper_dir):
     #log the cmd
     logger.info("Running PIPER protein-protein docking: %s"%' '.join(command))
 
+    return command
+
+def piper(args, params, SCHRODINGER, piper_dir):
+    """ Runs piper job.
+    
+    Input:
+    - args: original user-parsed arguments
+    - params: dict of parsed args that correspond to job settings
+    - SCHRODINGER: directory of schrodinger installation
+
+    Return: JobResult of the submission command (exit code, duration and output tail) """
+
+    command = build_command(args, params, SCHRODINGER)
+
     # enter into piper_dir (to store results there) and run 
     os.chdir(piper_dir)
-    run_job(command)
+    return run_job(command)
 
 
 
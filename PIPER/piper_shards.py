@@ -0,0 +1,363 @@
+#Import Python modules
+import logging
+import argparse
+import gzip
+import glob
+import re
+import os
+
+#Import optional modules (merged poses are only clustered if numpy is installed)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#Import PIPER modules
+import piper_run
+
+#Import TCM functionality
+import tcm_records
+import tcm_fast_reader
+import tcm_job_control
+import tcm_speculation
+import tcm_errors
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# Sharded PIPER: the rotation set is split into contiguous ranges, each range is docked by an independent PIPER job on its
+# own HOST, and the poses of every shard are clustered into the final top poses, ranked by cluster population (number of
+# shard poses in the cluster) as PIPER ranks its own clusters. Sharding is set in the PIPER settings (json file or arguments):
+#   shards - number of rotation ranges (1 runs a single PIPER job)
+#   shard_hosts - HOSTs the shards are submitted to, in turn (default is HOST)
+#   rotation_set - rotation set file split into ranges (default is the rot70k set found in the Schrodinger installation)
+#   rotation_set_flag - piper.py option given the rotation file of a shard (differs between Schrodinger releases, so it
+#   must be set to shard)
+#   cluster_radius - RMSD (A) of ligand protein CA atoms under which merged poses belong to the same cluster
+SHARD_DEFAULTS = {'shards': 1, 'shard_hosts': [], 'rotation_set': None, 'rotation_set_flag': None, 'cluster_radius': 9.0}
+
+# pose properties holding the PIPER score (lower is better)
+SCORE_PROPERTY = re.compile(r'^r_\w*piper\w*_(score|energy)$', re.IGNORECASE)
+
+# smallest displacement (A) of a CA atom between poses for it to be counted as part of the (moving) ligand protein
+MOVING_ATOM_CUTOFF = 0.1
+
+def shard_settings(params):
+    """ Sharding settings of PIPER job (PIPER settings with SHARD_DEFAULTS for missing keys) """
+
+    return {key: params.get(key) if params.get(key) is not None else default for key, default in SHARD_DEFAULTS.items()}
+
+def is_sharded(params):
+    """ True if the PIPER job is split into more than one rotation range """
+
+    return shard_settings(params)['shards'] > 1
+
+def rotation_ranges(total, shards):
+    """ Splits rotations 0 to total into contiguous ranges of (almost) equal size.
+
+    Return: list of (start, end) tuples (end excluded) """
+
+    shards = max(1, min(shards, total))
+    size, extra = divmod(total, shards)
+
+    ranges = []
+    start = 0
+    for index in range(shards):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append((start, end))
+        start = end
+
+    return ranges
+
+def find_rotation_set(SCHRODINGER):
+    """ Finds the rot70k rotation set shipped with the PSP module of the Schrodinger installation
+
+    Return: path to rotation set file or None if not found """
+
+    found = sorted(glob.glob(os.path.join(SCHRODINGER or '', 'psp-v*', 'data', '**', 'rot70k*'), recursive = True))
+    return found[0] if found else None
+
+def read_rotations(rotation_set, count):
+    """ Reads the first count rotations (non-empty, non-comment lines) of a rotation set file
+
+    Return: list of rotation lines """
+
+    rotations = []
+    with open(rotation_set, 'r') as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            rotations.append(line)
+            if len(rotations) == count:
+                break
+
+    return rotations
+
+def write_rotation_shards(rotations, ranges, piper_dir):
+    """ Writes the rotations of every range into its own shard directory
+
+    Return: list of (shard directory, rotation file) tuples """
+
+    shard_files = []
+    for index, (start, end) in enumerate(ranges, start = 1):
+        shard_dir = os.path.join(piper_dir, f'shard_{index}')
+        os.makedirs(shard_dir, exist_ok = True)
+        rotation_file = os.path.join(shard_dir, f'rotations_{start}-{end}.prm')
+        with open(rotation_file, 'w') as f:
+            f.writelines(rotations[start:end])
+        shard_files.append((shard_dir, rotation_file))
+
+    return shard_files
+
+def shard_command(args, params, SCHRODINGER, jobname, rotations, rotation_file, host = None):
+    """ Builds the command launching the PIPER job of one shard (same settings, own job name, rotations and HOST)
+
+    Return: list of run command """
+
+    shard_args = argparse.Namespace(**vars(args))
+    shard_args.jobname = jobname
+    shard_params = dict(params, rotations = rotations)
+    if host is not None:
+        shard_params['HOST'] = host
+
+    return piper_run.build_command(shard_args, shard_params, SCHRODINGER) + [f'{shard_settings(params)["rotation_set_flag"]} {rotation_file}']
+
+def read_poses(out_path, shard):
+    """ Reads the poses written by one shard without Schrodinger (pose text, PIPER score and CA coordinates)
+
+    Input:
+    - out_path: path to -out.maegz of the shard
+    - shard: index of the shard
+
+    Return: tuple of (file header text, list of pose dictionaries in PIPER rank order) """
+
+    header = ''
+    poses = []
+    with tcm_records.open_text(out_path) as lines:
+        for header, text in tcm_records.maestro_blocks(lines):
+            tokens = tcm_fast_reader.maestro_tokens(text.splitlines(True))
+            next(tokens) # f_m_ct
+            next(tokens) # opening brace
+            ct = tcm_fast_reader.read_maestro_block(tokens)
+
+            scores = [float(value) for key, value in ct.items() if isinstance(value, str) and SCORE_PROPERTY.match(key)]
+            atoms = ct.get('m_atom', {})
+            names = [name.strip() for name in atoms.get('s_m_pdb_atom_name', [])]
+            coordinates = [(float(x), float(y), float(z)) for name, x, y, z in zip(names, atoms.get('r_m_x_coord', []),
+                atoms.get('r_m_y_coord', []), atoms.get('r_m_z_coord', [])) if name == 'CA']
+
+            poses.append({'text': text, 'shard': shard, 'rank': len(poses), 'score': scores[0] if scores else None, 'ca': coordinates})
+
+    return header, poses
+
+def rank_poses(poses):
+    """ Orders the poses of every shard by PIPER score (poses without score keep their rank within their shard, taking
+    turns between shards) """
+
+    if all(pose['score'] is not None for pose in poses):
+        return sorted(poses, key = lambda pose: (pose['score'], pose['shard'], pose['rank']))
+
+    logger.warning('PIPER score not found in every pose; merging shards by rank of poses within each shard')
+    return sorted(poses, key = lambda pose: (pose['rank'], pose['shard']))
+
+def cluster_poses(poses, radius, limit):
+    """ Greedily clusters ranked poses: a pose starts a new cluster unless the ligand protein is within radius (RMSD of CA
+    atoms) of a better ranked cluster center. Only CA atoms moving between poses (the ligand protein, as the receptor is
+    fixed by PIPER) are compared.
+
+    Return: list of (center pose, cluster size) tuples of at most limit clusters in rank order """
+
+    sizes = [len(pose['ca']) for pose in poses]
+    if np is None or not poses or min(sizes) != max(sizes) or not sizes[0]:
+        if np is None:
+            logger.warning('numpy is not installed; merged PIPER poses are not clustered')
+        return [(pose, 1) for pose in poses[:limit]]
+
+    coordinates = np.array([pose['ca'] for pose in poses], dtype = float)
+    moving = (np.linalg.norm(coordinates - coordinates[0], axis = 2) > MOVING_ATOM_CUTOFF).any(axis = 0)
+    if moving.sum() >= 3:
+        coordinates = coordinates[:, moving]
+
+    centers = []
+    sizes = []
+    for index in range(len(poses)):
+        if centers:
+            rmsd = np.sqrt(((coordinates[centers] - coordinates[index]) ** 2).sum(axis = 2).mean(axis = 1))
+            closest = int(rmsd.argmin())
+            if rmsd[closest] < radius:
+                sizes[closest] += 1
+                continue
+        if len(centers) < limit:
+            centers.append(index)
+            sizes.append(1)
+
+    return [(poses[center], size) for center, size in zip(centers, sizes)]
+
+def rank_clusters(clusters):
+    """ Orders clusters by population (largest first), as PIPER ranks its clusters; clusters of the same size keep the
+    rank of their centers (best PIPER score first) """
+
+    return sorted(clusters, key = lambda cluster: -cluster[1])
+
+def merge_shards(out_paths, merged_path, poses, cluster_radius):
+    """ Merges the poses of every shard into the final top poses written as one .maegz file, so later stages read a single
+    PIPER output: poses are clustered (centers are the best scored poses, see cluster_poses) and the largest clusters kept
+    (see rank_clusters).
+
+    Input:
+    - out_paths: -out.maegz of every shard
+    - merged_path: path to write merged poses to
+    - poses: number of poses to keep
+    - cluster_radius: RMSD (A) under which poses belong to the same cluster
+
+    Return: number of poses written """
+
+    header = ''
+    shard_poses = []
+    for shard, out_path in enumerate(out_paths, start = 1):
+        shard_header, found = read_poses(out_path, shard)
+        header = header or shard_header
+        shard_poses.extend(found)
+        logger.info(f'Shard {shard} of PIPER wrote {len(found)} poses')
+
+    clusters = rank_clusters(cluster_poses(rank_poses(shard_poses), cluster_radius, len(shard_poses)))[:poses]
+
+    # writing next to the final file then moving it, so a merge that stops halfway never leaves a truncated output
+    with gzip.open(merged_path + '.tmp', 'wt') as f:
+        f.write(header)
+        for pose, size in clusters:
+            f.write(pose['text'])
+    os.replace(merged_path + '.tmp', merged_path)
+
+    logger.info(f'Merged {len(shard_poses)} poses of {len(out_paths)} shards into {len(clusters)} poses (cluster sizes: '
+        + ', '.join(str(size) for pose, size in clusters) + f'). Results found in {merged_path}')
+
+    return len(clusters)
+
+def merged_job(shard_jobs, piper_dir):
+    """ Builds one job dictionary for the shards of a PIPER job: completed if every shard completed, otherwise the status,
+    exit code and output of the first failed shard (so failures are classified and retried as a single job)
+
+    Return: job dictionary (with 'shards', the job dictionary of every shard) """
+
+    job = tcm_job_control.new_job([], piper_dir)
+    job.update(
+        job_id = ','.join(str(shard_job['job_id']) for shard_job in shard_jobs),
+        status = 'completed',
+        exit_status = tcm_job_control.SUCCESS_EXIT_STATUS,
+        submitted = min((shard_job['submitted'] for shard_job in shard_jobs if shard_job['submitted'] is not None), default = None),
+        finished = max((shard_job['finished'] for shard_job in shard_jobs if shard_job['finished'] is not None), default = None),
+        shards = shard_jobs)
+
+    failed = [shard_job for shard_job in shard_jobs if not tcm_job_control.succeeded(shard_job)]
+    if failed:
+        job.update({key: failed[0][key] for key in ('status', 'exit_code', 'exit_status', 'launch_returncode', 'output_tail', 'command')})
+
+    return job
+
+def rotation_set_of(params, SCHRODINGER, log = None):
+    """ Finds the rotation set split into rotation files, checking the piper.py option given a rotation file is set
+
+    Return: path to rotation set file
+
+    Raises: tcm_errors.InputError if the rotation set or the piper.py option to pass it is not set """
+
+    log = logger if log is None else log
+    settings = shard_settings(params)
+
+    if settings['rotation_set_flag'] is None:
+        log.critical('Docking subsets of rotations needs rotation_set_flag (the piper.py option given a rotation file) in the PIPER settings')
+        raise tcm_errors.InputError('rotation_set_flag is not set in the PIPER settings')
+    rotation_set = settings['rotation_set'] or find_rotation_set(SCHRODINGER)
+    if rotation_set is None or not os.path.isfile(rotation_set):
+        log.critical(f'Rotation set {rotation_set} not found. Set rotation_set in the PIPER settings.')
+        raise tcm_errors.InputError(f'Rotation set {rotation_set} not found')
+
+    return rotation_set
+
+async def run_rotations(work_dir, SCHRODINGER, args, params, rotations, jobname, shards = None, log = None):
+    """ Docks a list of rotations split into shards, each an independent PIPER job on its own HOST (straggler shards are
+    duplicated, see tcm_speculation).
+
+    Input:
+    - work_dir: directory the shard directories are made in
+    - SCHRODINGER: location of SCHRODINGER installation
+    - args: PIPER arguments (see PIPER.prepare_piper)
+    - params: final PIPER settings (see PIPER.prepare_piper)
+    - rotations: rotation lines to dock (see read_rotations)
+    - jobname: name of the jobs (shards are named {jobname}_shard<number>)
+    - shards: number of shards (default is shards of the PIPER settings)
+    - log: logger (default is logger of this module)
+
+    Return: tuple of (job dictionary of the shards (see merged_job), list of -out.maegz of the shards) """
+
+    log = logger if log is None else log
+    settings = shard_settings(params)
+
+    ranges = rotation_ranges(len(rotations), settings['shards'] if shards is None else shards)
+    shard_files = write_rotation_shards(rotations, ranges, work_dir)
+
+    # running every shard on its own HOST
+    hosts = settings['shard_hosts'] or [params.get('HOST')]
+    shard_list = []
+    for index, ((start, end), (shard_dir, rotation_file)) in enumerate(zip(ranges, shard_files)):
+        shard_jobname = f'{jobname}_shard{index + 1}'
+        default_host = hosts[index % len(hosts)]
+        shard_list.append({
+            'name': shard_jobname,
+            'command': lambda host, shard_jobname = shard_jobname, size = end - start, rotation_file = rotation_file, default_host = default_host:
+                shard_command(args, params, SCHRODINGER, shard_jobname, size, rotation_file, host or default_host),
+            'cwd': shard_dir,
+            'host': default_host,
+            'other_hosts': [host for host in hosts[index % len(hosts) + 1:] + hosts[:index % len(hosts)] if host != default_host]}) # duplicates go to the next HOST
+
+    shard_jobs = await tcm_speculation.run_shards(shard_list, log = log)
+    job = merged_job(shard_jobs, work_dir)
+    if not tcm_job_control.succeeded(job):
+        log.critical(f'PIPER shard job {job["job_id"]} ended with status {job["status"]}')
+        return job, []
+
+    # outputs are in the directory the winning copy of each shard was launched from
+    out_paths = [os.path.join(shard_job['cwd'], f'{shard["name"]}-out.maegz') for shard, shard_job in zip(shard_list, shard_jobs)]
+    missing = [out_path for out_path in out_paths if not os.path.isfile(out_path)]
+    if missing:
+        log.critical(f'PIPER shards completed but did not write {", ".join(missing)}')
+        job.update(status = 'failed', output_tail = [f'missing shard output {out_path}' for out_path in missing])
+        return job, []
+
+    return job, out_paths
+
+async def run_sharded(piper_dir, SCHRODINGER, args, params, log = None):
+    """ Runs a PIPER job as shards of its rotation set (see run_rotations), then merges the poses of the shards into
+    {jobname}-out.maegz in piper_dir.
+
+    Input:
+    - piper_dir: directory of PIPER job
+    - SCHRODINGER: location of SCHRODINGER installation
+    - args: PIPER arguments (see PIPER.prepare_piper)
+    - params: final PIPER settings (see PIPER.prepare_piper)
+    - log: logger (default is logger of this module)
+
+    Return: job dictionary of the sharded job (see merged_job)
+
+    Raises: tcm_errors.InputError if the rotation set or the piper.py option to pass it is not set """
+
+    log = logger if log is None else log
+    jobname = args.jobname if args.jobname is not None else 'prot_prot_docking'
+
+    # splitting the rotation set and docking every range
+    rotation_set = rotation_set_of(params, SCHRODINGER, log)
+    rotations = read_rotations(rotation_set, params['rotations'])
+    log.info(f'Splitting {len(rotations)} rotations of {rotation_set} into {shard_settings(params)["shards"]} PIPER shards')
+    job, out_paths = await run_rotations(piper_dir, SCHRODINGER, args, params, rotations, jobname, log = log)
+    if not tcm_job_control.succeeded(job):
+        return job
+
+    # merging poses of every shard
+    try:
+        merge_shards(out_paths, os.path.join(piper_dir, f'{jobname}-out.maegz'), params['poses'], shard_settings(params)['cluster_radius'])
+    except (OSError, ValueError, StopIteration) as e:
+        log.critical(f'Could not merge poses of PIPER shards: {e}')
+        job.update(status = 'failed', output_tail = [f'merge of shard poses failed: {e}'])
+
+    return job
@@ -0,0 +1,169 @@
+#Import Python modules
+import logging
+import hashlib
+import shutil
+import os
+
+#Import TCM functionality
+import tcm_validation_cache
+import tcm_structure_scan
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# Trimming of PIPER inputs: PIPER only docks the selected chain of each protein, so the receptor and ligand files are
+# written once without other chains (e.g. DDB1 in CRBN files) and waters, cached by content hash of the input file and
+# chain, and the trimmed files are given to PIPER. Later runs on the same files reuse the cached trimmed files. Ligands
+# can be kept whatever their chain (e.g. the cocrystallized IMiD cropping is anchored on, see piper_crop).
+
+# settings of the trimmed input cache (see configure); TCM_PIPER_TRIM_CACHE_MB sets the size limit of the cache
+settings = {
+    'cache_dir': os.path.join(tcm_validation_cache.cache_root, 'piper_inputs'),
+    'max_mb': float(os.getenv('TCM_PIPER_TRIM_CACHE_MB', 1024)) # least recently used files are evicted past this size
+}
+
+# residue names of waters removed from the inputs
+WATER_RESIDUES = {'HOH', 'WAT', 'SOL', 'DOD', 'H2O', 'TIP', 'TIP3', 'TIP4', 'T3P', 'T4P', 'SPC'}
+
+#Version of the trimmed files (files of other versions are never reused)
+trim_version = 1
+
+def configure(**kwargs):
+    """ Changes trimmed input cache settings for the rest of the run (arguments left as None are unchanged) """
+
+    for key, value in kwargs.items():
+        if key not in settings:
+            raise KeyError(f'Unknown trimmed input cache setting {key}')
+        if value is not None:
+            settings[key] = value
+
+def needs_trimming(protein_file, chain):
+    """ Checks from the scan summary of the protein file (see tcm_structure_scan) whether it has waters or chains other
+    than the selected chain
+
+    Return: boolean """
+
+    summary = tcm_structure_scan.get_summary(protein_file, diagnostics = False)
+    if not summary['loaded']:
+        return False # left to PIPER to report
+
+    other_chains = chain is not None and any(name != chain for name in summary['chains'])
+    waters = any(pdbres in WATER_RESIDUES for residue_chain, pdbres, resnum in summary['residues'])
+
+    return other_chains or waters
+
+def cached_path(protein_file, chain, keep_ligands = False):
+    """ Path of the trimmed file of a protein file and chain in the cache (keyed by content hash of the file, chain, whether
+    ligands are kept and Schrodinger release, so renamed files still hit while edited files miss) """
+
+    key = hashlib.sha256(f'{tcm_validation_cache.file_hash(protein_file)}:{chain}:{keep_ligands}:{tcm_validation_cache.get_schrodinger_release()}:{trim_version}'.encode()).hexdigest()
+    stem = os.path.basename(protein_file).split('.')[0]
+
+    return os.path.join(settings['cache_dir'], f'{stem}_{chain or "all"}{"_ligands" if keep_ligands else ""}_{key[:24]}.mae')
+
+def write_trimmed(protein_file, chain, out_path, keep_ligands = False):
+    """ Writes every structure of the protein file keeping only atoms of the selected chain (all chains if None) that are
+    not waters, and atoms of ligands on any chain if keep_ligands
+
+    Return: number of atoms kept """
+
+    from schrodinger import structure # imported when first needed (slow to import)
+    from schrodinger.structutils.analyze import find_ligands
+
+    kept = 0
+    tmp_path = f'{out_path[:-len(".mae")]}.{os.getpid()}.tmp.mae'
+    with structure.StructureWriter(tmp_path) as writer:
+        for st in structure.StructureReader(protein_file):
+            ligand_atoms = {index for ligand in find_ligands(st) for index in ligand.atom_indexes} if keep_ligands else set()
+            atoms = [atom.index for atom in st.atom if ((chain is None or atom.chain == chain) and atom.pdbres.strip() not in WATER_RESIDUES)
+                or atom.index in ligand_atoms]
+            writer.append(st.extract(atoms, copy_props = True))
+            kept += len(atoms)
+
+    # renaming when complete so concurrent runs never read partial files
+    os.replace(tmp_path, out_path)
+
+    return kept
+
+def trimmed_input(protein_file, chain, piper_dir, keep_ligands = False):
+    """ Gets the trimmed (selected chain, no waters) version of a PIPER input, from the cache or by writing it, linked
+    into piper_dir.
+
+    Input:
+    - protein_file: receptor or ligand protein file
+    - chain: selected chain (None keeps every chain and only removes waters)
+    - piper_dir: directory of PIPER job
+    - keep_ligands: whether ligands of other chains are kept
+
+    Return: path to trimmed file in piper_dir, or protein_file if nothing is trimmed (or trimming failed) """
+
+    if not needs_trimming(protein_file, chain):
+        return protein_file
+
+    try:
+        cache_path = cached_path(protein_file, chain, keep_ligands)
+        if os.path.isfile(cache_path):
+            os.utime(cache_path) # refreshing the last use time for LRU eviction
+            logger.info(f'Using cached trimmed input {cache_path} for {protein_file}' + (f' (chain {chain})' if chain else ''))
+        else:
+            os.makedirs(settings['cache_dir'], exist_ok = True)
+            kept = write_trimmed(protein_file, chain, cache_path, keep_ligands)
+            logger.info(f'Trimmed {protein_file} (' + (f'chain {chain}' + (' and ligands, ' if keep_ligands else ', ') if chain else '')
+                + f'no waters; {kept} atoms kept) into {cache_path}')
+            evict()
+
+        # linking into the job directory so the job input is never evicted while the job runs
+        job_path = os.path.join(os.path.abspath(piper_dir), os.path.basename(cache_path))
+        if os.path.lexists(job_path):
+            os.remove(job_path)
+        try:
+            os.link(cache_path, job_path)
+        except OSError: # cache on another file system
+            shutil.copy2(cache_path, job_path)
+
+    except Exception as e: # trimming is an optimization, so failing to trim gives PIPER the original file
+        logger.warning(f'Could not trim {protein_file}: {e}. Using original file.')
+        return protein_file
+
+    return job_path
+
+def trim_inputs(args, piper_dir, keep_receptor_ligands = False):
+    """ Replaces the receptor and ligand proteins of the PIPER arguments with their trimmed versions (see trimmed_input).
+    The selected chains are kept, as the trimmed files keep chain names. Ligands of the receptor on other chains are kept
+    if keep_receptor_ligands (e.g. the cocrystallized IMiD anchoring the cropping of the receptor, see piper_crop).
+
+    Return: args with receptor_prot and ligand_prot replaced """
+
+    args.receptor_prot = trimmed_input(args.receptor_prot, getattr(args, 'receptor_chain', None), piper_dir, keep_receptor_ligands)
+    args.ligand_prot = trimmed_input(args.ligand_prot, getattr(args, 'ligand_chain', None), piper_dir)
+
+    return args
+
+def evict(max_mb = None):
+    """ Removes least recently used trimmed files until the cache is within max_mb (default from settings) """
+
+    max_bytes = (settings['max_mb'] if max_mb is None else max_mb) * 1024 * 1024
+
+    # collecting (last use time, size, path) of every trimmed file
+    entries = []
+    for name in os.listdir(settings['cache_dir']):
+        if name.endswith('.mae') and '.tmp' not in name:
+            path = os.path.join(settings['cache_dir'], name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError: # removed by another run
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(entry[1] for entry in entries)
+
+    # removing oldest files first
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        logger.debug(f'Evicted trimmed input {path}')
@@ -3,19 +3,36 @@ import logging
 import sys
 import os
 import shutil
-import subprocess
 import time
 import tarfile
 import glob
 import argparse
+import collections
+import contextlib
+import copy
 
 #Import necessary modules for TCM functionality
 import tcm_parseargs
 import tcm_check_input
-
-#Import necessary modules for parts of workflow (PIPER, IFD, etc.)
-from PIPER import PIPER
-from InducedFitDocking import IFD
+import tcm_preflight
+import tcm_maegz_index
+import tcm_job_runner
+import tcm_job_control
+import tcm_checkpoint
+import tcm_piper_store
+import tcm_retry
+import tcm_watchdog
+import tcm_speculation
+import tcm_scheduler
+import tcm_manifest
+import tcm_errors
+import tcm_structure_scan
+import tcm_ligand_check
+import tcm_fast_reader
+import tcm_service
+
+# parts of workflow (PIPER, IFD, etc.) import Schrodinger modules, so they are only imported by the functions running them
+# (keeps --help and argument errors fast; see tcm_importtime.py)
 
 #Get TCM installation path 
 TCM_path = os.path.dirname(__file__)
@@ -28,7 +45,7 @@ SCHRODINGER = os.getenv('SCHRODINGER')
 
 #Get Schrodinger release version. Assumes pathname has version
 #E.g., "/schrodinger/2023-2/"
-schrodinger_version = os.path.basename(SCHRODINGER)
+schrodinger_version = os.path.basename(SCHRODINGER) if SCHRODINGER else None
 
 #Get home path environmental variable
 homepath = os.getenv('HOME')
@@ -36,37 +53,77 @@ homepath = os.getenv('HOME')
 #Initiate logger
 logger = logging.getLogger()
 
-# Initially looking at sys.argv to use user input of name to create custom directory
-for i,item in enumerate(sys.argv):
-    if item in ['-n', '--name']:
-        name = sys.argv[i+1]
-        break
+# Result of a run of the workflow from Python (see run_tcm)
+RunResult = collections.namedtuple('RunResult', ['name', 'status', 'tcm_dir', 'log_path', 'stages', 'artifacts'])
+
+# settings of the modules configured by a run (restored after every run_tcm call)
+RUN_SETTINGS = [tcm_job_control.settings, tcm_retry.policies, tcm_watchdog.settings, tcm_speculation.settings, tcm_scheduler.settings,
+    tcm_structure_scan.settings, tcm_ligand_check.settings, tcm_fast_reader.settings, tcm_piper_store.settings]
+
+# size and modification time of input files when last checked in this process (see forget_changed_inputs)
+_input_stamps = {}
+
+def forget_changed_inputs(paths):
+    """ Drops check results kept in memory for input files that changed since they were last checked in this process,
+    so long-running processes (see tcm_service) keep their caches for unchanged files """
+
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamp = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            stamp = None
+        if _input_stamps.get(path) != stamp:
+            tcm_structure_scan.forget(path)
+            tcm_ligand_check.forget(path)
+            _input_stamps[path] = stamp
+
+def name_from_argv(argv):
+    """ Looks at command line arguments for the name of the job (used to create custom directory before parsing) 
+    
+    Return: name or None """
+
+    for i,item in enumerate(argv[:-1]):
+        if item in ['-n', '--name']:
+            return argv[i+1]
+    return None
+
+def add_log_file(log_path):
+    """ Writes the log of the run (all levels) to log_path 
+    
+    Return: handler writing the log file """
+
+    fh = logging.FileHandler(log_path)
 
-#Creating directory for TCM workflow and results
-tcm_dir = os.path.join(master_dir, f'TernaryComplexModeling_{name}')
-os.makedirs(tcm_dir, exist_ok=True)
-fh = logging.FileHandler(os.path.join(tcm_dir, f'TernaryComplexModeling_{name}.log'))
-logger.info(f'TCM Workflow started. Results and info can be found in {tcm_dir}')
+    #Logger settings
+    fh.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')) #Create writing format for logging
+    logger.addHandler(fh) #adding handler 
+    logger.setLevel(logging.DEBUG) #Set logger default to debug (all warning lvls allowed)
 
-#Logger settings
-fh.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')) #Create writing format for logging
-logger.addHandler(fh) #adding handler 
-logger.setLevel(logging.DEBUG) #Set logger default to debug (all warning lvls allowed)
+    return fh
+
+def set_up(name):
+    """ Creates directory for TCM workflow and results and the log file of the job (no name means argument parsing will 
+    exit, e.g. --help)
+    
+    Return: tcm_dir - directory of tcm job (None if no name) """
+
+    if name is None:
+        return None
+
+    tcm_dir = os.path.join(master_dir, f'TernaryComplexModeling_{name}')
+    os.makedirs(tcm_dir, exist_ok=True)
+    add_log_file(os.path.join(tcm_dir, f'TernaryComplexModeling_{name}.log'))
+    logger.info(f'TCM Workflow started. Results and info can be found in {tcm_dir}')
+
+    return tcm_dir
 
 def run_job(command):
-    """ Runs specific linux command """
-    #Run provided command, joining list with space. Pipe stdout and sdterror to log file
-    process = subprocess.run(' '.join(command), stdout=subprocess.PIPE, \
-        stderr=subprocess.STDOUT, shell=True, text=True)
-    
-    #Iterate over sdtout and sdterror
-    for line in process.stdout.split('\n'):
-        #Ignore blank lines
-        if line != "":
-            #Ignore ExitStatus
-            if "ExitStatus" not in line:
-                #Write to log file for debugging
-                logger.debug(line)
+    """ Runs specific linux command (see tcm_job_runner.run_job)
+
+    Return: JobResult (exit code, duration and output tail) """
+    #Run provided command without a shell, streaming stdout and sdterror to log file as it is written
+    return tcm_job_runner.run_job(command, log = logger)
 
 def parsing_and_checking():
     """ Parsing user arguments to TCM Workflow and Checking Protein / Ligand Inputs """
@@ -78,6 +135,21 @@ def parsing_and_checking():
     
     logger.info(f'Parsing complete with no fatal errors. The following arguments were recognized: {vars(args)}')
 
+def stage_fingerprint_of(stage_args, input_files):
+    """ Fingerprint of a stage from its arguments (see tcm_checkpoint.fingerprint). Arguments that are input files are hashed
+    by content; all other arguments are settings.
+    
+    Input:
+    stage_args - arguments of the stage (Namespace)
+    input_files - dictionary of input name to name of the argument holding the file path
+    
+    Return: fingerprint (str) """
+
+    files = {name: getattr(stage_args, arg) for name, arg in input_files.items()}
+    settings = {k: v for k, v in vars(stage_args).items() if k not in input_files.values()}
+
+    return tcm_checkpoint.fingerprint(files, settings)
+
 def run_piper(SCHRODINGER, tcm_dir, args, args_by_group):
     """ Runs PIPER protein-protein docking with user-parsed arguments.
     
@@ -89,27 +161,70 @@ def run_piper(SCHRODINGER, tcm_dir, args, args_by_group):
      
     Return: piper_dir - directory of results from PIPER """
 
-    # making piper directory
-    piper_dir = os.path.join(tcm_dir, f'prot_prot_docking_{args.name}')
-    os.makedirs(piper_dir, exist_ok=False)
+    from PIPER import PIPER, piper_parseargs # imported when needed (imports Schrodinger modules)
 
-    # entering piper directory
-    os.chdir(piper_dir)
+    # making piper directory (existing directory is reused when resuming)
+    piper_dir = os.path.join(tcm_dir, f'prot_prot_docking_{args.name}')
+    os.makedirs(piper_dir, exist_ok=args.resume)
 
     # adding necessary arguments for PIPER (defining the input protein files as receptors and ligands, etc)
     args.receptor_prot = args.cereblon
     args.ligand_prot = args.protein
 
-    # getting all arguments for PIPER + adding custom job name with input naming scheme
-    args_piper = argparse.Namespace(**{k: getattr(args,k) for k in args_by_group['piper']})
-    args_piper.jobname = f'prot_prot_docking_{args.name}'
+    # getting all arguments for PIPER (arguments TCM does not set are left at their PIPER defaults) + adding custom job
+    # name with input naming scheme; piper_settings is the settings json of PIPER (default)
+    piper_values = {k: getattr(args,k) for k in args_by_group['piper']}
+    piper_values['default'] = piper_values.pop('piper_settings')
+    args_piper = piper_parseargs.build_args(**piper_values, jobname = f'prot_prot_docking_{args.name}')
+    piper_out = os.path.join(piper_dir, f'{args_piper.jobname}-out.maegz')
+
+    # skipping PIPER if resuming and the stage already completed with the same inputs and settings
+    stage_fingerprint = stage_fingerprint_of(args_piper, {'receptor': 'receptor_prot', 'ligand': 'ligand_prot', 'piper_settings': 'default'})
+    if args.resume and tcm_checkpoint.is_complete(piper_dir, 'PIPER', stage_fingerprint):
+        logger.info(f"Skipping PIPER Protein-Protein Docking (already completed). Results found in {piper_dir}")
+        return piper_dir
+    tcm_checkpoint.remove_marker(piper_dir)
     
-    # logging the start
-    logger.info(f"Initiating PIPER Protein-Protein Docking. Results will be found in {piper_dir}")
-
-    # calling and running PIPER 
-    PIPER.run_piper(piper_dir, SCHRODINGER, args_piper)
-
+    # linking poses of an identical docking of an earlier run (same proteins, chains, constraints and docking settings)
+    # from the PIPER result store instead of running PIPER again
+    store_key = tcm_piper_store.key(*PIPER.docking_inputs(args_piper)) if tcm_piper_store.enabled() else None
+    stored_path = tcm_piper_store.lookup(store_key) if store_key is not None else None
+    if stored_path is not None:
+        tcm_piper_store.link(stored_path, piper_out)
+        logger.info(f"Linked PIPER poses of identical docking from the PIPER result store ({stored_path}) into {piper_dir}")
+
+    else:
+        # removing poses (and their index and blocked copy) left by an earlier run, which may be hard links into the PIPER
+        # result store that PIPER would otherwise write over
+        for path in [piper_out] + tcm_maegz_index.sidecar_paths(piper_out):
+            if os.path.lexists(path):
+                os.remove(path)
+
+        # logging the start
+        logger.info(f"Initiating PIPER Protein-Protein Docking. Results will be found in {piper_dir}")
+
+        # calling and running PIPER under job control (waiting for poses before IFD), retrying transient cluster failures
+        job = tcm_job_control.wait(tcm_retry.run_with_retries('PIPER', lambda host: PIPER.submit_piper(piper_dir, SCHRODINGER, tcm_retry.with_host(args_piper, host)),
+            log_path = os.path.join(piper_dir, f'{args_piper.jobname}.log')))
+        if not tcm_job_control.succeeded(job):
+            logger.critical(f'PIPER Protein-Protein Docking job {job["job_id"]} ended with status {job["status"]}. See {piper_dir} for more detail.')
+            raise tcm_errors.StageError(f'PIPER job {job["job_id"]} ended with status {job["status"]}')
+    if not os.path.isfile(piper_out):
+        logger.critical(f'PIPER Protein-Protein Docking completed but {piper_out} was not written. See {piper_dir} for more detail.')
+        raise tcm_errors.StageError(f'PIPER did not write {piper_out}')
+
+    # indexing PIPER poses so single poses can be read without decompressing the whole file (the output itself is never
+    # changed; the index and any blocked copy are sidecar files)
+    try:
+        tcm_maegz_index.get_index(piper_out)
+    except (OSError, ValueError) as e: # index is an optimization, so failing to build it never fails the run
+        logger.warning(f'Could not index PIPER poses in {piper_out}: {e}')
+
+    # storing poses for later runs docking the same proteins with the same settings
+    if store_key is not None and stored_path is None:
+        tcm_piper_store.store(store_key, piper_out, {'receptor': args_piper.receptor_prot, 'ligand': args_piper.ligand_prot, 'piper_dir': piper_dir})
+
+    tcm_checkpoint.write_marker(piper_dir, 'PIPER', stage_fingerprint, [piper_out])
     logger.info(f"Completed PIPER Protein-Protein Docking. Results found in {piper_dir}")
 
     return piper_dir
@@ -122,36 +237,278 @@ def run_IFD(SCHRODINGER, tcm_dir, piper_dir, args, args_by_group):
     tcm_dir - directory of tcm job
     piper dir - directory of piper job results
     args - user-parsed arguments 
-    args_by_group - dictionary mapping arguments by group """
+    args_by_group - dictionary mapping arguments by group 
+    
+    Return: ifd_dir - directory of results from IFD """
 
-    # making IFD directory
-    ifd_dir = os.path.join(tcm_dir, f'InducedFitDocking_{args.name}')
-    os.makedirs(ifd_dir, exist_ok=False)
+    from InducedFitDocking import IFD # imported when needed (imports Schrodinger modules)
 
-    # entering ifd directory
-    os.chdir(ifd_dir)
+    # making IFD directory (existing directory is reused when resuming)
+    ifd_dir = os.path.join(tcm_dir, f'InducedFitDocking_{args.name}')
+    os.makedirs(ifd_dir, exist_ok=args.resume)
 
     # getting all arguments for IFD + adding custom job name with input naming scheme + input files
     args_ifd = argparse.Namespace(**{k: getattr(args,k) for k in args_by_group['ifd']})
     args_ifd.jobname = f'InducedFitDocking_{args.name}'
-    args_ifd.proteins = os.path.join(piper_dir, f'prot_prot_docking_{args.name}-out.maegz')
+    args_ifd.proteins = os.path.join(piper_dir, f'{os.path.basename(piper_dir)}-out.maegz') # PIPER job is named after its directory (may be shared by triples of a campaign)
     args_ifd.ligand = args.ligand
+    ifd_out = os.path.join(ifd_dir, f'{args_ifd.jobname}-out.maegz')
+
+    # skipping IFD if resuming and the stage already completed with the same inputs (including PIPER poses) and settings
+    stage_fingerprint = stage_fingerprint_of(args_ifd, {'poses': 'proteins', 'ligand': 'ligand', 'ifd_settings': 'ifd_settings'})
+    if args.resume and tcm_checkpoint.is_complete(ifd_dir, 'IFD', stage_fingerprint):
+        logger.info(f"Skipping Induced Fit Docking (already completed). Results found in {ifd_dir}")
+        return ifd_dir
+    tcm_checkpoint.remove_marker(ifd_dir)
     
     # logging the start
     logger.info(f"Initiating Induced Fit Docking. Results will be found in {ifd_dir}")
 
-    # calling and running PIPER 
-    IFD.run_ifd(ifd_dir, SCHRODINGER, args_ifd)
+    # calling and running IFD under job control, retrying transient cluster failures
+    job = tcm_job_control.wait(tcm_retry.run_with_retries('IFD', lambda host: IFD.submit_ifd(ifd_dir, SCHRODINGER, tcm_retry.with_host(args_ifd, host)),
+        log_path = os.path.join(ifd_dir, f'{args_ifd.jobname}.log')))
+    if not tcm_job_control.succeeded(job):
+        logger.critical(f'Induced Fit Docking job {job["job_id"]} ended with status {job["status"]}. See {ifd_dir} for more detail.')
+        raise tcm_errors.StageError(f'IFD job {job["job_id"]} ended with status {job["status"]}')
+    if not os.path.isfile(ifd_out):
+        logger.critical(f'Induced Fit Docking completed but {ifd_out} was not written. See {ifd_dir} for more detail.')
+        raise tcm_errors.StageError(f'IFD did not write {ifd_out}')
+
+    # marking stage complete with its outputs
+    tcm_checkpoint.write_marker(ifd_dir, 'IFD', stage_fingerprint, [ifd_out])
 
     logger.info(f"Completed Induced Fit Docking. Results found in {ifd_dir}")
 
+    return ifd_dir
+
+# stages of the workflow run by tcm_scheduler (every stage gets the run context: SCHRODINGER, tcm_dir, args, args_by_group
+# and the artifacts produced so far); new stages (e.g. MDFit on the IFD poses) only need to be registered here
+def piper_stage(context):
+    """ PIPER stage: docks the protein of interest onto cereblon """
+    return {'piper_dir': run_piper(context['SCHRODINGER'], context['tcm_dir'], context['args'], context['args_by_group'])}
+
+def ifd_stage(context):
+    """ IFD stage: docks the ligand into the PIPER poses """
+    return {'ifd_dir': run_IFD(context['SCHRODINGER'], context['tcm_dir'], context['artifacts']['piper_dir'], context['args'], context['args_by_group'])}
+
+tcm_scheduler.register('PIPER', piper_stage, inputs = ['cereblon', 'protein', 'piper_settings'], outputs = ['piper_dir'], resources = {'cluster_jobs': 1})
+tcm_scheduler.register('IFD', ifd_stage, inputs = ['piper_dir', 'ligand', 'ifd_settings'], outputs = ['ifd_dir'], resources = {'cluster_jobs': 1})
+
+def preflight():
+    """ Runs every check of the TCM workflow (argument parsing, input validation, CRBN landmark detection on cereblon and 
+    PIPER / IFD default settings) without submitting any job, and prints a json report with the time spent in each check.
+    
+    Return: boolean (True if a check failed, False if every check passed) """
+
+    # importing parts of workflow only needed for the checks
+    from PIPER import piper_default
+    from InducedFitDocking import IFD_find_info, IFD_default
+
+    report = tcm_preflight.Preflight('TCM')
+
+    # parsing arguments
+    parsed = report.run('argument parsing', tcm_parseargs.parse_known_args, master_dir, failed = lambda result: False)
+    if parsed is None: # can't run other checks without arguments
+        report.print_report()
+        return True
+    parser, args, unknowns, args_by_group = parsed
+
+    # checking cereblon, protein of interest and ligand
+    report.run('input validation', tcm_check_input.check_args, parser, sys.argv, args, unknowns)
+
+    # constraints and templates are not inputs of the TCM workflow yet
+    report.skip('constraint validation', 'no constraints file passed in')
+    report.skip('template parsing', 'no template passed in, IFD input file is written from scratch')
+
+    # finding cocrystallized ligand and hydrogen bonding sites on CRBN (used for IFD constraints)
+    report.run('landmark detection', IFD_find_info.parse_structure, args.cereblon, failed = tcm_preflight.landmarks_missing)
+
+    # getting PIPER and IFD default settings
+    report.run('PIPER default settings', piper_default.main, os.path.join(TCM_path, 'PIPER'), 'None', args.piper_settings, failed = lambda result: not result)
+    report.run('IFD default settings', IFD_default.main, os.path.join(TCM_path, 'InducedFitDocking'), 'ADD_HERE', args.ifd_settings, failed = lambda result: not result)
+
+    report.print_report()
+    return not report.ok
+
+def configure_run(args):
+    """ Applies the job control settings of the user arguments (concurrency, retries, stall watchdog, speculative execution
+    and stage scheduling) """
+
+    # applying limit of jobs running on the cluster at once
+    tcm_job_control.configure(max_concurrent = args.max_concurrent_jobs)
+
+    # applying retry policy of cluster stages
+    tcm_retry.configure(max_attempts = args.max_attempts, backoff = args.retry_backoff, hosts = args.retry_hosts)
+
+    # applying stall watchdog settings (window given in hours)
+    tcm_watchdog.configure(stall_window = args.stall_window * 3600 if args.stall_window is not None else None, on_stall = args.on_stall)
+
+    # applying speculative execution settings of sharded stages (minimum runtime given in minutes)
+    tcm_speculation.configure(slowdown = args.speculative_slowdown, hosts = args.speculative_hosts,
+        min_runtime = args.speculative_min_runtime * 60 if args.speculative_min_runtime is not None else None)
+
+    # applying global limits of concurrently running stages
+    tcm_scheduler.configure(max_parallel = args.max_parallel_stages, cluster_jobs = tcm_job_control.settings['max_concurrent'])
+
+    # turning off the PIPER result store if asked (PIPER always runs)
+    if args.no_piper_store:
+        tcm_piper_store.configure(enabled = False)
+
 def main():
 
+    # creating job directory and log file first so argument errors are logged in the job directory
+    tcm_dir = set_up(name_from_argv(sys.argv))
+
     # parsing arguments 
-    args, args_by_group = tcm_parseargs.parse_args()
+    args, args_by_group = tcm_parseargs.parse_args(master_dir)
+
+    # applying job control settings
+    configure_run(args)
+
+    # running every registered stage (PIPER, then IFD on its poses), independent stages concurrently
+    context = {'SCHRODINGER': SCHRODINGER, 'tcm_dir': tcm_dir, 'args': args, 'args_by_group': args_by_group, 'artifacts': dict(vars(args))}
+    results = tcm_scheduler.run(context, log = logger)
+    if tcm_scheduler.failed(results):
+        logger.critical('TCM Workflow did not complete: ' + ', '.join(f'{name} {result["status"]}' for name, result in results.items()))
+        sys.exit(1)
+
+def run_manifest():
+    """ Runs every (cereblon, protein, ligand) triple of the manifest as one campaign (see tcm_manifest.run_campaign), with
+    the log and campaign summary in TCM_campaign_<name>.
+
+    Return: boolean (True if a triple did not complete, False if every triple completed) """
+
+    # parsing arguments (inputs come from the manifest)
+    parser, args, unknowns, args_by_group = tcm_manifest.parse_args(master_dir)
+
+    # writing log in campaign directory
+    campaign_dir = tcm_manifest.campaign_dir_of(args, master_dir)
+    os.makedirs(campaign_dir, exist_ok=True)
+    add_log_file(os.path.join(campaign_dir, f'{os.path.basename(campaign_dir)}.log'))
+    if unknowns:
+        logger.warning('Ignoring unrecognized arguments: %s'%unknowns)
+
+    # stages of the campaign run as many jobs at once as allowed on the cluster unless limited
+    configure_run(args)
+    tcm_scheduler.configure(max_parallel = args.max_parallel_stages or tcm_job_control.settings['max_concurrent'])
+
+    return tcm_manifest.run_campaign(args, args_by_group, parser, SCHRODINGER, master_dir)
+
+@contextlib.contextmanager
+def run_settings():
+    """ Restores the settings of the modules configured by a run (job control, retries, watchdog, scheduler, checks) and
+    the level of the root logger when the run ends, so runs in one process don't change each other """
+
+    saved = [copy.deepcopy(settings) for settings in RUN_SETTINGS]
+    level = logger.level
+    try:
+        yield
+    finally:
+        for settings, values in zip(RUN_SETTINGS, saved):
+            settings.clear()
+            settings.update(values)
+        logger.setLevel(level)
+
+def run_tcm(config, master_dir = None, SCHRODINGER = SCHRODINGER):
+    """ Runs the TCM workflow in this process (e.g. from a notebook or a service driving many runs), without reading the
+    command line or exiting: errors are raised and module settings are restored after the run. Runs are not thread safe
+    (run one at a time per process).
+    
+    Input:
+    config - dictionary of TCM arguments by dest (e.g. {'cereblon': 'crbn.mae', 'protein': 'poi.mae', 'ligand': 'lig.sdf',
+    'name': 'poi_lig', 'piper_settings': 'piper.json', 'ifd_settings': 'ifd.json', 'max_attempts': 2}); strings are converted
+    to the type of their argument
+    master_dir - directory relative paths are resolved from and the job directory is made in (default is current working directory)
+    SCHRODINGER - path to schrodinger installation (default from environment)
+    
+    Return: RunResult (name, status (completed or failed), tcm_dir, log_path, stages (status, seconds and outputs of every
+    stage) and artifacts (inputs and outputs of the run))
+    
+    Raises: tcm_errors.ArgumentError for unknown or missing arguments, tcm_errors.InputError if input files fail checks """
+
+    master_dir = os.path.abspath(master_dir or os.getcwd())
+
+    # building arguments from defaults of the parser and the configuration
+    parser, args_by_group = tcm_parseargs.build_parser()
+    actions = {action.dest: action for action in parser._actions if action.dest != 'help'}
+    unknown = sorted(set(config) - set(actions))
+    if unknown:
+        raise tcm_errors.ArgumentError(f'Unknown TCM arguments: {", ".join(unknown)}')
+    args = argparse.Namespace(**{dest: action.default for dest, action in actions.items()})
+    for dest, value in config.items():
+        try:
+            setattr(args, dest, tcm_manifest.convert(actions[dest], value, master_dir))
+        except (TypeError, ValueError, argparse.ArgumentTypeError) as e:
+            raise tcm_errors.ArgumentError(f'Invalid value of {dest}: {value} ({e})')
+    missing = [action.dest for action in actions.values() if action.required and getattr(args, action.dest) is None]
+    if missing:
+        raise tcm_errors.ArgumentError(f'Missing TCM arguments: {", ".join(missing)}')
+
+    # making job directory and log file of this run
+    tcm_dir = os.path.join(master_dir, f'TernaryComplexModeling_{args.name}')
+    os.makedirs(tcm_dir, exist_ok=True)
+    log_path = os.path.join(tcm_dir, f'TernaryComplexModeling_{args.name}.log')
+
+    with run_settings():
+        handler = add_log_file(log_path)
+        try:
+            logger.info(f'TCM Workflow started. Results and info can be found in {tcm_dir}')
+
+            # checking inputs (check results of files changed since an earlier run of this process are dropped)
+            forget_changed_inputs([args.cereblon, args.protein, args.ligand])
+            tcm_check_input.configure_checks(args, tcm_dir)
+            if tcm_check_input.check_inputs(args):
+                raise tcm_errors.InputError(f'TCM inputs failed checks. See {log_path} for more detail.')
+
+            # running every registered stage
+            configure_run(args)
+            context = {'SCHRODINGER': SCHRODINGER, 'tcm_dir': tcm_dir, 'args': args, 'args_by_group': args_by_group, 'artifacts': dict(vars(args))}
+            results = tcm_scheduler.run(context, log = logger)
+            if tcm_scheduler.failed(results):
+                logger.critical('TCM Workflow did not complete: ' + ', '.join(f'{name} {result["status"]}' for name, result in results.items()))
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+
+    return RunResult(args.name, 'failed' if tcm_scheduler.failed(results) else 'completed', tcm_dir, log_path, results, context['artifacts'])
+
+def submit_to_service():
+    """ Submits the run of the command line to the TCM service (see tcm_service) instead of running it here, and prints
+    its run id. Inputs are checked by the service.
+    
+    Return: boolean (True if the run could not be submitted, False if submitted) """
+
+    # parsing arguments without checking inputs
+    parser, args, unknowns, args_by_group = tcm_parseargs.parse_known_args(master_dir)
+    if unknowns:
+        logger.warning('Ignoring unrecognized arguments: %s'%unknowns)
+    config = {dest: value for dest, value in vars(args).items() if value is not None and value is not False and dest not in ('service', 'preflight')}
+
+    try:
+        run_id = tcm_service.submit(config, master_dir)
+    except (OSError, tcm_errors.TCMError) as e:
+        print(f'Could not submit run to TCM service on {tcm_service.SOCKET_PATH} ({e}). Start it with: python {os.path.join(TCM_path, "tcm_service.py")} serve')
+        return True
+
+    print(run_id)
+    return False
+
+if __name__ == '__main__':
+
+    try:
+        # submitting run to the TCM service
+        if '--service' in sys.argv:
+            sys.exit(1 if submit_to_service() else 0)
+
+        # running many triples from a manifest
+        if '--manifest' in sys.argv:
+            sys.exit(1 if run_manifest() else 0)
+
+        # only running checks (no job submission)
+        if '--preflight' in sys.argv:
+            sys.exit(1 if preflight() else 0)
 
-    # running PIPER
-    piper_dir = run_piper(SCHRODINGER, tcm_dir, args, args_by_group)
+        main()
 
-    # running IFD 
-    run_IFD(SCHRODINGER, tcm_dir, piper_dir, args, args_by_group)
\ No newline at end of file
+    except tcm_errors.ArgumentError: # already logged by the parser; exiting with the usage error status of argparse
+        sys.exit(2)
@@ -4,14 +4,22 @@ import textwrap
 import argparse
 import sys
 import os
+import concurrent.futures
 
-#Import Schrodinger modules 
-from schrodinger.structure import StructureReader, StructureWriter
-from schrodinger.application.prepwizard2.diagnostics import get_problems
+#Import TCM functionality
+import tcm_structure_scan
+import tcm_ligand_check
+import tcm_fast_reader
 
 ###Initiate logger###
 logger = logging.getLogger(__name__)
 
+#Number of worker processes used to check inputs concurrently
+CHECK_WORKERS = 3
+
+#Maximum number of failed ligands logged individually (all are found in the per-ligand validation table)
+MAX_LOGGED_LIGANDS = 20
+
 def file_type_error(file_path, allowed_file_type):
     """ Given the user input of a file path (or name if in current working directory), a file_type_error 
     arises when the file ext of the input file is not in the allowed file type inputs
@@ -40,28 +48,24 @@ def protein_loading_error(protein_file_path, chain = None):
     
     Return: boolean (True if error occurs, False if no error)"""
 
-    # tries loading in the protein and catches specific errors
-    try:
-        protein_chains = set() 
-        for structure in StructureReader(protein_file_path): # reads all the structures in file 
-            structure_exists = True # structures do exist in the file and are loaded
-            for atom in structure.atom: # adds in all chains in the file 
-                protein_chains.add(atom.chain)
-
-        if not structure_exists: # no structure found
-            logger.critical(f'No structure exists within the protein file.')
-            return True
-        
-        if chain is not None and chain not in protein_chains: # user-inputted chain doesn't exist in the file 
-            logger.critical(f'Selected chain does not exist in protein file. Please select another chain from {protein_chains} or upload another file')
-            return True
-        
-    except FileNotFoundError as fnf: # file not found / invalid path
-        logger.critical(f'FileNotFoundError: The protein file path is invalid and file was not found: {fnf}. Please check the path {protein_file_path}')
+    # single scan of the protein file shared with the other checks
+    summary = tcm_structure_scan.get_summary(protein_file_path)
+
+    # catches specific errors that occured while loading the protein
+    if summary['error_type'] == 'FileNotFoundError': # file not found / invalid path
+        logger.critical(f'FileNotFoundError: The protein file path is invalid and file was not found: {summary["error"]}. Please check the path {protein_file_path}')
         return True
     
-    except Exception as e: # other exceptions / error arise in trying to load and check protein file
-        logger.critical(f'Unknown error occured in loading protein: {e}. ')
+    if not summary['loaded']: # other exceptions / error arise in trying to load and check protein file
+        logger.critical(f'Unknown error occured in loading protein: {summary["error"]}. ')
+        return True
+
+    if summary['structures'] == 0: # no structure found
+        logger.critical(f'No structure exists within the protein file.')
+        return True
+    
+    if chain is not None and chain not in summary['chains']: # user-inputted chain doesn't exist in the file 
+        logger.critical(f'Selected chain does not exist in protein file. Please select another chain from {set(summary["chains"])} or upload another file')
         return True
     
     # returns false if no errors found 
@@ -74,31 +78,30 @@ def protein_diagnostics_error(protein_file_path):
     Return: boolean (True if issues are found, False if no issues) """
 
     error = False 
-    structures = StructureReader(protein_file_path) # reading in the protein file 
+    summary = tcm_structure_scan.get_summary(protein_file_path) # diagnostics results from the single scan of the protein file 
 
-    for st in structures: # iterating through the protein file
-        problems = get_problems(st) # getting problems
+    for problems in summary['problems'] or []: # iterating through the diagnostics of each structure in the protein file
 
-        valences = problems.invalid_types # checking valence error and raising error if not empty list
-        if valences:
-            logger.critical('Protein not correctly prepared, issues with valence identified.')
+        if problems['invalid_types']: # checking valence error
+            logger.critical(f'Protein not correctly prepared, issues with valence identified in structure {problems["structure"]}.')
             error = True 
 
-        missing = problems.missing # checking missing atom error and raising error if not empty list 
-        if missing:
-            logger.critical('Protein not correctly prepared, issues with missing atoms identified')
+        if problems['missing']: # checking missing atom error
+            logger.critical(f'Protein not correctly prepared, issues with missing atoms identified in structure {problems["structure"]}')
             error = True
 
-        overlapping = problems.overlapping # checking overlapping positions error and raising error if not empty list
-        if overlapping:
-            logger.critical('Protein not correctly prepared, issues with overlapping positions')
+        if problems['overlapping']: # checking overlapping positions error
+            logger.critical(f'Protein not correctly prepared, issues with overlapping positions in structure {problems["structure"]}')
             error = True
 
-        alternates = problems.alternates # checking alternate conformations error and raising error if not empty list 
-        if alternates:
-            logger.critical('Protein not correctly prepared, issues with alternate conformations')
+        if problems['alternates']: # checking alternate conformations error
+            logger.critical(f'Protein not correctly prepared, issues with alternate conformations in structure {problems["structure"]}')
             error = True 
 
+    # diagnostics stopped at first structure with issues
+    if summary['partial']:
+        logger.critical(f'Diagnostics stopped at the first structure with issues (fail fast); later structures of {protein_file_path} were not checked')
+
     return error
 
 def protein_invalid_error(protein_file_path, chain = None):
@@ -133,37 +136,65 @@ def ligand_file_type_error(ligand_file_path):
     
 def ligand_loading_error(ligand_file_path):
     """ Given the user input of a ligand file path (or name if in current working directory), cehsks whether the ligand file is loadable
+    and every ligand record in the file loads. Failed records are listed in the per-ligand validation table.
     
     Return: boolean (True if file-type-error, False if no error) """
 
-    # tries loading in the ligand and catches specific errors
+    # tries validating the ligand library (single streaming pass shared with ligand diagnostics) and catches specific errors
     try:
-        for structure in StructureReader(ligand_file_path): # reads all the structures in file 
-            structure_exists = True # structures do exist in the file and are loaded
-
-        if not structure_exists: # no structure found
-            logger.critical(f'No structure exists within the ligand file.')
-            return True
+        rows = tcm_ligand_check.get_report(ligand_file_path)
         
     except FileNotFoundError as fnf: # file not found / invalid path
         logger.critical(f'FileNotFoundError: The ligand file path is invalid and file was not found: {fnf}. Please check the path {ligand_file_path}')
         return True
     
-    except Exception as e: # other exceptions / error arise in trying to load and check protein file
+    except Exception as e: # other exceptions / error arise in trying to load and check ligand file
         logger.critical(f'Unknown error occured in loading ligand: {e}. ')
         return True
+
+    if not rows: # no structure found
+        logger.critical(f'No structure exists within the ligand file.')
+        return True
+
+    # checks every ligand record loaded
+    failed = [row for row in rows if not row['loaded']]
+    log_failed_ligands(failed, len(rows), ligand_file_path)
     
     # returns false if no errors found 
-    return False 
+    return len(failed) > 0 
 
 def ligand_diagnostics_error(ligand_file_path):
     """ Given the user input of a ligand file path (or name if in cwd), checks whether the 
-    ligand was successfully run through LigPrep and doesn't have any errors.
+    ligand was successfully run through LigPrep and doesn't have any errors (every loaded record has 3D coordinates
+    and explicit hydrogens). SMILES records (status warn) are only logged as needing LigPrep.
     
     Return: boolean (True if ligand diagnostic error, False if no error)"""
 
-    return False 
-    #MUST ADD 
+    rows = tcm_ligand_check.get_report(ligand_file_path) # results of single validation pass of the ligand file
+
+    # warns of records that still need LigPrep (e.g. SMILES)
+    unprepared = [row for row in rows if row['status'] == 'warn']
+    if unprepared:
+        logger.warning(f'{len(unprepared)} of {len(rows)} ligands in {ligand_file_path} need LigPrep ({unprepared[0]["reason"]}). '
+            f'See {tcm_ligand_check.report_path(ligand_file_path)}')
+
+    # checks every other loaded ligand record was prepared
+    failed = [row for row in rows if row['loaded'] and row['status'] == 'fail']
+    log_failed_ligands(failed, len(rows), ligand_file_path)
+
+    return len(failed) > 0
+
+def log_failed_ligands(failed, total, ligand_file_path):
+    """ Logs failed ligand records (up to MAX_LOGGED_LIGANDS, the rest are found in the per-ligand validation table) """
+
+    for row in failed[:MAX_LOGGED_LIGANDS]:
+        logger.critical(f'Ligand {row["index"]} ({row["title"]}) failed checks: {row["reason"]}')
+
+    if len(failed) > MAX_LOGGED_LIGANDS:
+        logger.critical(f'{len(failed) - MAX_LOGGED_LIGANDS} more ligands failed checks. See {tcm_ligand_check.report_path(ligand_file_path)}')
+
+    if failed:
+        logger.critical(f'{len(failed)} of {total} ligands in {ligand_file_path} failed checks.')
 
 def ligand_invalid_error(ligand_file_path):
     """ Given the user input of a ligand file path (or name if in cwd), performs multiple checks to ensure the input is valid 
@@ -185,11 +216,110 @@ def ligand_invalid_error(ligand_file_path):
     # returns false if no errors found
     return False
 
+# running independent checks concurrently
+class RecordCollector(logging.Handler):
+    """ Logging handler that keeps log records in memory so records of a check run in another process
+    can be sent back and logged in order by the main process """
+
+    def __init__(self):
+        super().__init__(level = logging.DEBUG)
+        self.records = []
+
+    def emit(self, record):
+        # formatting the message now so the record can be pickled back to the main process
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
+def run_check_collecting_logs(check, file_path, check_settings = None):
+    """ Runs a single check on file_path, collecting its log records instead of writing them to the
+    log handlers (used in worker processes). Also returns the structure summary of the file so the main
+    process does not scan it again. check_settings (dictionary of settings of tcm_structure_scan, tcm_ligand_check and tcm_fast_reader) are
+    applied first as worker processes don't always inherit the settings of the main process.
+    
+    Return: tuple of (check result, list of log records, summary dictionary or None) """
+
+    root = logging.getLogger()
+    handlers, level = root.handlers, root.level
+    collector = RecordCollector()
+    root.handlers = [collector] # workers inherit the main process handlers, so replacing them avoids duplicate/interleaved output
+    root.setLevel(logging.DEBUG)
+
+    if check_settings is not None:
+        tcm_structure_scan.configure(**check_settings['scan'])
+        tcm_ligand_check.configure(**check_settings['ligand'])
+        tcm_fast_reader.configure(**check_settings['reader'])
+
+    try:
+        check_error = check(file_path)
+    except Exception as e: # unexpected error in a check is reported as failed check
+        logger.critical(f'Unknown error occured in checking {file_path}: {e}')
+        check_error = True
+    finally:
+        root.handlers = handlers
+        root.setLevel(level)
+
+    return check_error, collector.records, tcm_structure_scan.lookup(file_path)
+
+def replay_records(records):
+    """ Logs records collected in another process through the loggers of the main process """
+
+    for record in records:
+        record_logger = logging.getLogger(record.name)
+        if record_logger.isEnabledFor(record.levelno): # records are collected at every level in workers
+            record_logger.handle(record)
+
+def run_checks(checks, max_workers = CHECK_WORKERS):
+    """ Runs independent checks concurrently in a process pool. Each check is a tuple of (check function, file path)
+    and check functions must be module-level functions (sent to worker processes). Falls back to running the checks one
+    after another if a process pool can't be used. The worker processes of per-structure diagnostics and per-ligand
+    validation started inside each check share the CPUs evenly, so nested pools never start more processes than CPUs.
+    
+    Return: list of (check result, list of log records) in the same order as checks """
+
+    outcomes = None
+    if max_workers > 1 and len(checks) > 1:
+        workers = min(max_workers, len(checks))
+        inner_workers = max(1, (os.cpu_count() or 1) // workers) # share of the CPUs of every check
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+                check_settings = {'scan': dict(tcm_structure_scan.settings, workers = min(tcm_structure_scan.settings['workers'], inner_workers)),
+                    'ligand': dict(tcm_ligand_check.settings, workers = min(tcm_ligand_check.settings['workers'], inner_workers)),
+                    'reader': dict(tcm_fast_reader.settings)}
+                futures = [executor.submit(run_check_collecting_logs, check, file_path, check_settings) for check, file_path in checks]
+                outcomes = [future.result() for future in futures]
+        except (OSError, concurrent.futures.process.BrokenProcessPool) as e: # e.g. process limits on login nodes
+            logger.warning(f'Could not run checks concurrently ({e}); running checks one after another')
+
+    if outcomes is None:
+        outcomes = [run_check_collecting_logs(check, file_path) for check, file_path in checks]
+
+    # keeping summaries of files scanned in worker processes so later checks in this process reuse them
+    for check_error, records, summary in outcomes:
+        if summary is not None:
+            tcm_structure_scan.remember(summary)
+
+    return [(check_error, records) for check_error, records, summary in outcomes]
+
+def configure_checks(args, report_dir):
+    """ Applies the user settings of input checks (diagnostics workers / fail fast, structure reader backend and ligand
+    validation workers) and the directory the per-ligand validation tables are written to """
+
+    # applying diagnostics settings (number of worker processes per file and fail fast)
+    tcm_structure_scan.configure(workers = getattr(args, 'diagnostics_workers', None), fail_fast = getattr(args, 'fail_fast', None))
+
+    # applying reader settings (Schrodinger or numpy backend for checks that don't need diagnostics)
+    tcm_fast_reader.configure(backend = getattr(args, 'structure_backend', None))
+
+    # applying ligand validation settings
+    tcm_ligand_check.configure(workers = getattr(args, 'ligand_workers', None), report_dir = report_dir)
+
 # check parsed arguments 
-def check_args(parser, system_arg, args, unknowns):
+def check_args(parser, system_arg, args, unknowns, master_dir):
     """ Given the result of parsing user arguments, checks whether the arguments 
     are valid. Logs specific error messages and returns false if certain fatal issues are found. 
-    Otherwise, log warnings and proceeds with runs.
+    Otherwise, log warnings and proceeds with runs. The job directory is found in master_dir.
     
     Return: boolean (True if no fatal errors, False if fatal errors)"""
     
@@ -205,24 +335,40 @@ def check_args(parser, system_arg, args, unknowns):
 
         return True # fatal error (no arguments to check)
     
-    # checks if cereblon protein info is valid
-    if protein_invalid_error(args.cereblon) is True:
-        logger.critical('Cereblon protein failed checks. See above for more detail.')
-        error = True 
+    # applying check settings (per-ligand validation table is written in the TCM directory of the job)
+    configure_checks(args, os.path.join(master_dir, f'TernaryComplexModeling_{args.name}'))
 
-    # checks if protein of interest info is valid
-    if protein_invalid_error(args.protein) is True:
-        logger.critical('Target protein of interest failed checks. See above for more detail.')
-        error = True
-    
-    # checks if ligand is valid
-    if ligand_invalid_error(args.ligand):
-        logger.critical('Ligand failed checks. See above for more detail.')
-        error = True
+    # checks cereblon, protein of interest and ligand
+    error = check_inputs(args)
     
     # checks if unknown inputs exist
     if unknowns:
         #Document warning and ignore variables
         logger.warning('Ignoring unrecognized arguments: %s'%unknowns)
         
-    return error 
+    return error
+
+def check_inputs(args):
+    """ Checks the cereblon, protein of interest and ligand files of parsed arguments (with the settings applied by
+    configure_checks). Logs specific error messages of failed checks.
+    
+    Return: boolean (True if fatal errors, False if no fatal errors)"""
+
+    error = False
+
+    # checks cereblon, protein of interest and ligand concurrently (the checks are independent)
+    input_checks = [
+        (protein_invalid_error, args.cereblon, 'Cereblon protein failed checks. See above for more detail.'), # checks if cereblon protein info is valid
+        (protein_invalid_error, args.protein, 'Target protein of interest failed checks. See above for more detail.'), # checks if protein of interest info is valid
+        (ligand_invalid_error, args.ligand, 'Ligand failed checks. See above for more detail.') # checks if ligand is valid
+    ]
+    results = run_checks([(check, file_path) for check, file_path, _ in input_checks])
+
+    # reporting results in fixed order so log output reads as if checks ran one after another
+    for (check, file_path, failure_message), (check_error, records) in zip(input_checks, results):
+        replay_records(records)
+        if check_error is True:
+            logger.critical(failure_message)
+            error = True
+
+    return error
@@ -0,0 +1,94 @@
+#Import Python modules
+import logging
+import hashlib
+import json
+import time
+import os
+
+#Import TCM functionality
+import tcm_validation_cache
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# name of the completion marker written in the directory of every finished stage
+MARKER_NAME = 'tcm_stage_complete.json'
+
+#Version of the markers (markers of other versions never match, so the stage is run again)
+marker_version = 1
+
+def fingerprint(input_files, settings):
+    """ Fingerprint of a stage: hash of the content of its input files, its settings and the Schrodinger release.
+
+    Input:
+    - input_files: dictionary of input name to file path (None paths are allowed, e.g. optional inputs)
+    - settings: dictionary of settings of the stage (json serializable, other values are converted to str)
+
+    Return: hex digest (str) """
+
+    inputs = {name: tcm_validation_cache.file_hash(path) if path is not None else None for name, path in sorted(input_files.items())}
+    content = {'version': marker_version, 'release': tcm_validation_cache.get_schrodinger_release(), 'inputs': inputs, 'settings': settings}
+
+    return hashlib.sha256(json.dumps(content, sort_keys = True, default = str).encode()).hexdigest()
+
+def marker_path(stage_dir):
+    """ Path of the completion marker of a stage """
+
+    return os.path.join(stage_dir, MARKER_NAME)
+
+def write_marker(stage_dir, stage, stage_fingerprint, outputs):
+    """ Marks a stage complete, recording its fingerprint and the size and hash of its outputs.
+
+    Input:
+    - stage_dir: directory of the stage
+    - stage: name of the stage (e.g. PIPER)
+    - stage_fingerprint: fingerprint of the stage inputs and settings (see fingerprint)
+    - outputs: list of output file paths of the stage """
+
+    marker = {
+        'stage': stage,
+        'fingerprint': stage_fingerprint,
+        'completed': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'outputs': {os.path.relpath(path, stage_dir): {'size': os.path.getsize(path), 'sha256': tcm_validation_cache.file_hash(path)} for path in outputs}
+    }
+
+    # writing to temporary file then renaming so an interrupted write never leaves a partial marker
+    tmp_path = f'{marker_path(stage_dir)}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(marker, f, indent = 2)
+    os.replace(tmp_path, marker_path(stage_dir))
+
+    logger.info(f'{stage} stage marked complete in {stage_dir}')
+
+def remove_marker(stage_dir):
+    """ Removes the completion marker of a stage (e.g. before running it again) """
+
+    try:
+        os.remove(marker_path(stage_dir))
+    except FileNotFoundError:
+        pass
+
+def is_complete(stage_dir, stage, stage_fingerprint):
+    """ Checks whether a stage can be skipped on resume: its marker exists, its fingerprint matches and its outputs are
+    unchanged (same size and content hash). Logs the reason the stage has to run again otherwise.
+
+    Return: boolean """
+
+    try:
+        with open(marker_path(stage_dir), 'r') as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        logger.info(f'{stage} stage has no completion marker in {stage_dir}; running stage')
+        return False
+
+    if marker.get('fingerprint') != stage_fingerprint:
+        logger.info(f'{stage} stage inputs or settings changed since it completed; running stage again')
+        return False
+
+    for relative_path, recorded in marker.get('outputs', {}).items():
+        path = os.path.join(stage_dir, relative_path)
+        if not os.path.isfile(path) or os.path.getsize(path) != recorded['size'] or tcm_validation_cache.file_hash(path) != recorded['sha256']:
+            logger.info(f'{stage} stage output {path} is missing or changed; running stage again')
+            return False
+
+    return True
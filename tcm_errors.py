@@ -0,0 +1,13 @@
+#Exceptions raised by the TCM workflow instead of exiting, so runs can be driven from a long-lived Python process (see TCM.run_tcm)
+
+class TCMError(Exception):
+    """ Base of errors raised by the TCM workflow """
+
+class ArgumentError(TCMError):
+    """ Arguments (or run configuration) can't be parsed: unknown, missing or badly typed arguments """
+
+class InputError(TCMError):
+    """ Input files (proteins, ligand, settings) failed checks """
+
+class StageError(TCMError):
+    """ Stage of the workflow (e.g. PIPER, IFD) did not complete """
@@ -0,0 +1,259 @@
+#Import Python modules
+import logging
+import re
+import os
+
+#Import optional modules (fast reader is only used if numpy is installed)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#Import TCM functionality
+import tcm_records
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# fields of the atom arrays built by the fast reader (one row per atom)
+ATOM_DTYPE = [
+    ('index', 'i4'), # atom index in structure (starting at 1, same as schrodinger atom.index)
+    ('chain', 'U4'), # chain name
+    ('resname', 'U4'), # pdb residue name without spaces (e.g. HIS)
+    ('resnum', 'i4'), # residue number
+    ('inscode', 'U1'), # residue insertion code
+    ('name', 'U4'), # pdb atom name without spaces (e.g. HD1)
+    ('atomic_number', 'i2'), # element (0 if unknown)
+    ('xyz', 'f4', (3,)) # coordinates
+]
+
+# structure file types read by the fast reader and their format
+FAST_READER_FORMATS = {'pdb': 'pdb', 'ent': 'pdb', 'mae': 'maestro', 'maegz': 'maestro'}
+
+# backend used to read structures in the check and landmark code paths (schrodinger or numpy); can be set with TCM_STRUCTURE_BACKEND
+settings = {'backend': os.getenv('TCM_STRUCTURE_BACKEND', 'schrodinger')}
+
+# atomic numbers of elements found in prepared proteins and ligands (pdb files give element symbols)
+ATOMIC_NUMBERS = {'H': 1, 'D': 1, 'C': 6, 'N': 7, 'O': 8, 'F': 9, 'NA': 11, 'MG': 12, 'P': 15, 'S': 16, 'CL': 17, 'K': 19,
+    'CA': 20, 'MN': 25, 'FE': 26, 'CO': 27, 'NI': 28, 'CU': 29, 'ZN': 30, 'SE': 34, 'BR': 35, 'I': 53}
+
+# residues that are never ligands (amino acids, capping groups, waters and common ions)
+NON_LIGAND_RESIDUES = {'ALA', 'ARG', 'ASN', 'ASP', 'ASH', 'CYS', 'CYX', 'CYT', 'GLN', 'GLU', 'GLH', 'GLY', 'HIS', 'HID', 'HIE',
+    'HIP', 'ILE', 'LEU', 'LYS', 'LYN', 'MET', 'MSE', 'PHE', 'PRO', 'SER', 'THR', 'TRP', 'TYR', 'VAL', 'ACE', 'NMA', 'NME',
+    'HOH', 'WAT', 'SOL', 'DOD', 'NA', 'CL', 'K', 'MG', 'CA', 'ZN', 'MN', 'FE', 'CO', 'NI', 'CU', 'BR', 'IOD', 'SO4', 'PO4'}
+
+# smallest number of heavy atoms of a residue counted as a ligand
+MIN_LIGAND_HEAVY_ATOMS = 5
+
+# columns of the maestro m_atom block that are read
+MAESTRO_COLUMNS = {
+    's_m_chain_name': 'chain',
+    's_m_pdb_residue_name': 'resname',
+    'i_m_residue_number': 'resnum',
+    's_m_insertion_code': 'inscode',
+    's_m_pdb_atom_name': 'name',
+    'i_m_atomic_number': 'atomic_number',
+    'r_m_x_coord': 'x',
+    'r_m_y_coord': 'y',
+    'r_m_z_coord': 'z'
+}
+
+# tokens of maestro files: comments (skipped), quoted strings, braces and other values
+MAESTRO_TOKEN = re.compile(r'#[^#]*#|"(?:[^"\\]|\\.)*"|[{}]|[^\s{}]+')
+
+def configure(backend = None):
+    """ Changes the backend used to read structures in the check and landmark code paths (schrodinger or numpy) """
+
+    if backend is not None:
+        settings['backend'] = backend
+
+def get_file_format(file_path):
+    """ Given a structure file path, returns the format read by the fast reader (pdb or maestro) or None if not supported """
+
+    parts = os.path.basename(file_path).lower().split('.')
+    if parts[-1] == 'gz' and len(parts) > 2: # e.g. .pdb.gz or .mae.gz
+        return FAST_READER_FORMATS.get(parts[-2])
+    return FAST_READER_FORMATS.get(parts[-1])
+
+def use_fast_reader(file_path, backend = None):
+    """ Checks whether the structure file should be read with the fast reader: the numpy backend is selected (default from
+    configure), numpy is installed and the file type is supported. Otherwise schrodinger.structure is used. """
+
+    if (settings['backend'] if backend is None else backend) != 'numpy':
+        return False
+
+    if np is None:
+        logger.warning('numpy structure backend selected but numpy is not installed. Reading structures with Schrodinger.')
+        settings['backend'] = 'schrodinger' # only warns once
+        return False
+
+    return get_file_format(file_path) is not None
+
+def atom_number(element, name):
+    """ Atomic number from element symbol of a pdb atom line (or first letter of atom name if element is missing) """
+
+    element = element.strip().upper() or name.strip().lstrip('0123456789')[:1].upper()
+    return ATOMIC_NUMBERS.get(element, 0)
+
+def read_pdb(lines):
+    """ Reads the atoms of a .pdb file by column. Each MODEL (or END separated block) is a structure.
+
+    Yields: tuple of (title, list of atom rows) """
+
+    title = ''
+    rows = []
+    for line in lines:
+        record = line[:6]
+        if record in ('ATOM  ', 'HETATM'):
+            rows.append((len(rows) + 1, line[21].strip(), line[17:21].strip(), int(line[22:26]), line[26].strip(),
+                line[12:16].strip(), atom_number(line[76:78], line[12:16]), (float(line[30:38]), float(line[38:46]), float(line[46:54]))))
+        elif record == 'TITLE ' and not rows:
+            title = (title + ' ' + line[10:].strip()).strip()
+        elif record.startswith('END') and rows: # ENDMDL or END closes the structure
+            yield title, rows
+            rows = []
+
+    if rows:
+        yield title, rows
+
+def maestro_tokens(lines):
+    """ Splits lines of a maestro file into tokens, skipping comments """
+
+    for line in lines:
+        for token in MAESTRO_TOKEN.findall(line):
+            if not token.startswith('#'):
+                yield token
+
+def maestro_value(token):
+    """ Converts a maestro token into its string value (quoted strings unescaped, <> is empty) """
+
+    if token == '<>':
+        return ''
+    if token.startswith('"'):
+        return token[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    return token
+
+def read_maestro_block(tokens, rows = None):
+    """ Reads a maestro block after its opening brace (keys, :::, values and sub-blocks until the closing brace).
+
+    Input:
+    - tokens: iterator of maestro tokens
+    - rows: number of rows for indexed blocks (e.g. m_atom[120]), None for blocks with a single value per key
+
+    Return: dictionary of key to value (list of values per row for indexed blocks) with sub-blocks stored under their name """
+
+    keys = []
+    for token in tokens:
+        if token == ':::':
+            break
+        keys.append(token)
+
+    block = {}
+    if rows is None:
+        for key in keys:
+            block[key] = maestro_value(next(tokens))
+    else:
+        values = [[] for _ in keys]
+        for _ in range(rows):
+            next(tokens) # first column is the row index
+            for column in values:
+                column.append(maestro_value(next(tokens)))
+        block = dict(zip(keys, values))
+        next(tokens) # closing :::
+
+    # reading sub-blocks until the end of this block
+    for token in tokens:
+        if token == '}':
+            break
+        match = re.match(r'(\w+)\[(\d+)\]$', token)
+        next(tokens) # opening brace
+        block[match.group(1) if match else token] = read_maestro_block(tokens, int(match.group(2)) if match else None)
+
+    return block
+
+def read_maestro(lines):
+    """ Reads the atoms of a .mae file from the m_atom block of each structure (f_m_ct block).
+
+    Yields: tuple of (title, list of atom rows) """
+
+    tokens = maestro_tokens(lines)
+    for token in tokens:
+        if token == '{': # file header
+            read_maestro_block(tokens)
+            continue
+
+        next(tokens) # opening brace
+        ct = read_maestro_block(tokens)
+        atoms = ct.get('m_atom', {})
+
+        columns = {field: atoms.get(key) for key, field in MAESTRO_COLUMNS.items()}
+        total = len(columns['x'] or [])
+        empty = [''] * total
+        rows = [(index + 1, chain.strip(), resname.strip(), int(resnum), inscode.strip(), name.strip(), int(atomic_number or 0),
+                (float(x), float(y), float(z)))
+            for index, (chain, resname, resnum, inscode, name, atomic_number, x, y, z) in enumerate(zip(
+                columns['chain'] or empty, columns['resname'] or empty, columns['resnum'] or ['0'] * total,
+                columns['inscode'] or empty, columns['name'] or empty, columns['atomic_number'] or empty,
+                columns['x'] or [], columns['y'] or [], columns['z'] or []))]
+
+        yield ct.get('s_m_title', ''), rows
+
+# reading function for each fast reader format
+READERS = {'pdb': read_pdb, 'maestro': read_maestro}
+
+def read_structures(file_path):
+    """ Streams the structures of a .pdb, .mae or .maegz file as structured numpy arrays (see ATOM_DTYPE).
+
+    Input:
+    - file_path: path to structure file
+
+    Yields: tuple of (title, atom array) """
+
+    file_format = get_file_format(file_path)
+    if file_format is None:
+        raise ValueError(f'Unsupported file type for {os.path.basename(file_path)}')
+
+    with tcm_records.open_text(file_path) as lines:
+        for title, rows in READERS[file_format](lines):
+            yield title, np.array(rows, dtype = ATOM_DTYPE)
+
+def residue_starts(atoms):
+    """ Positions of the first atom of every residue (atoms of a residue are consecutive) """
+
+    if len(atoms) == 0:
+        return np.zeros(0, dtype = int)
+
+    # an atom starts a new residue if its residue fields differ from the atom before
+    same_residue = np.ones(len(atoms) - 1, dtype = bool)
+    for field in ('chain', 'resnum', 'inscode', 'resname'):
+        same_residue &= atoms[field][1:] == atoms[field][:-1]
+
+    return np.concatenate(([0], np.flatnonzero(~same_residue) + 1))
+
+def residues(atoms):
+    """ Residues of the structure in order.
+
+    Return: list of (chain, pdbres, resnum) """
+
+    starts = residue_starts(atoms)
+    return list(zip(atoms['chain'][starts].tolist(), atoms['resname'][starts].tolist(), atoms['resnum'][starts].tolist()))
+
+def find_ligands(atoms):
+    """ Finds ligands of the structure: residues that are not amino acids, waters or ions and have at least
+    MIN_LIGAND_HEAVY_ATOMS heavy atoms (similar to schrodinger.structutils.analyze.find_ligands for single residue ligands).
+
+    Return: list of (chain, pdbres, resnum) """
+
+    starts = residue_starts(atoms)
+    heavy_atoms = np.add.reduceat((atoms['atomic_number'] != 1).astype(int), starts) if len(starts) else []
+
+    return [(chain, resname, resnum) for (chain, resname, resnum), heavy in zip(residues(atoms), heavy_atoms)
+        if resname.upper() not in NON_LIGAND_RESIDUES and heavy >= MIN_LIGAND_HEAVY_ATOMS]
+
+def find_atom(atoms, resname, resnum, name):
+    """ Finds an atom by residue name, residue number and pdb atom name (names without spaces).
+
+    Return: atom index (starting at 1) or None if not found """
+
+    matches = np.flatnonzero((atoms['resnum'] == resnum) & (atoms['resname'] == resname) & (atoms['name'] == name))
+    return int(atoms['index'][matches[0]]) if len(matches) else None
@@ -0,0 +1,117 @@
+#Import Python modules
+import logging
+import argparse
+import subprocess
+import tempfile
+import json
+import sys
+import os
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+#Get TCM installation path
+TCM_path = os.path.dirname(os.path.abspath(__file__))
+
+# entry points of the workflow as (module imported by the entry point script, directory of the module in TCM installation)
+ENTRY_POINTS = {
+    'TCM': ('TCM', ''),
+    'PIPER': ('PIPER', 'PIPER'),
+    'IFD': ('IFD', 'InducedFitDocking')
+}
+
+# import time budget of each entry point in milliseconds (all can be changed with the TCM_IMPORT_BUDGET_MS environmental variable)
+IMPORT_BUDGETS_MS = {'TCM': 300, 'PIPER': 200, 'IFD': 200}
+if os.getenv('TCM_IMPORT_BUDGET_MS'):
+    IMPORT_BUDGETS_MS = {entry_point: float(os.getenv('TCM_IMPORT_BUDGET_MS')) for entry_point in IMPORT_BUDGETS_MS}
+
+# modules that must not be imported at startup (only by the code paths that need them)
+HEAVY_MODULES = ('schrodinger',)
+
+def parse_importtime(stderr):
+    """ Parses the output of python -X importtime.
+
+    Input:
+    - stderr: text written to stderr by python -X importtime
+
+    Return: dictionary of imported module name to cumulative import time in microseconds """
+
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line: # skipping header and other output
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(cumulative_us)
+
+    return times
+
+def measure(entry_point, budget_ms = None):
+    """ Imports the module of the entry point in a new python process (as running the entry point script with --help would)
+    and measures the import time against the budget of the entry point. Run in a temporary directory so module level
+    setup of the entry point does not write to the current directory.
+
+    Input:
+    - entry_point: name of entry point (key of ENTRY_POINTS)
+    - budget_ms: import time budget in milliseconds (default from IMPORT_BUDGETS_MS)
+
+    Return: dictionary with the import time (ms), budget (ms), heavy modules imported and status (pass, fail or error) """
+
+    module, module_dir = ENTRY_POINTS[entry_point]
+    budget_ms = IMPORT_BUDGETS_MS[entry_point] if budget_ms is None else budget_ms
+
+    # modules of the workflow are imported by name from the TCM, PIPER and IFD directories
+    # (directory of the entry point first, as when running the script, so PIPER.py is found before the PIPER package)
+    python_path = [os.path.join(TCM_path, module_dir), TCM_path, os.path.join(TCM_path, 'PIPER'), os.path.join(TCM_path, 'InducedFitDocking')]
+    if os.getenv('PYTHONPATH'):
+        python_path.append(os.getenv('PYTHONPATH'))
+    env = dict(os.environ, PYTHONPATH = os.pathsep.join(python_path))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd = tmp_dir, env = env,
+            stdout = subprocess.PIPE, stderr = subprocess.PIPE, text = True)
+
+    result = {'entry_point': entry_point, 'module': os.path.join(module_dir, f'{module}.py'), 'status': 'pass',
+        'milliseconds': None, 'budget_ms': budget_ms, 'heavy_modules': [], 'messages': []}
+
+    # import of entry point failed (e.g. missing dependency)
+    if process.returncode != 0:
+        result['status'] = 'error'
+        result['messages'] = process.stderr.strip().splitlines()[-1:]
+        return result
+
+    times = parse_importtime(process.stderr)
+    result['milliseconds'] = round(times.get(module, 0) / 1000, 1)
+    result['heavy_modules'] = sorted(name for name in times if name.split('.')[0] in HEAVY_MODULES)
+
+    # checking budget and imports of heavy modules
+    if result['milliseconds'] > budget_ms:
+        result['status'] = 'fail'
+        result['messages'].append(f'import took {result["milliseconds"]} ms (budget is {budget_ms} ms)')
+    if result['heavy_modules']:
+        result['status'] = 'fail'
+        result['messages'].append(f'heavy modules imported at startup: {result["heavy_modules"][:5]}')
+
+    return result
+
+def main(argv = None):
+    """ Measures the import time of the entry points and prints a json report.
+
+    Return: exit status (1 if an entry point is over budget or could not be imported, otherwise 0) """
+
+    parser = argparse.ArgumentParser(prog = 'tcm_importtime', description = 'Measures import time of TCM entry points against their budget')
+    parser.add_argument('entry_points', nargs = '*', help = f'entry points to measure: {", ".join(ENTRY_POINTS)} (default all)')
+    parser.add_argument('--budget', dest = 'budget', type = float, help = 'import time budget in milliseconds for every measured entry point')
+    args = parser.parse_args(argv)
+
+    # checking entry points (argparse choices can't be combined with an empty list default)
+    unknown = [entry_point for entry_point in args.entry_points if entry_point not in ENTRY_POINTS]
+    if unknown:
+        parser.error(f'unknown entry points {unknown} (choose from {list(ENTRY_POINTS)})')
+
+    results = [measure(entry_point, args.budget) for entry_point in args.entry_points or ENTRY_POINTS]
+    print(json.dumps(results, indent = 2))
+
+    return int(any(result['status'] != 'pass' for result in results))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+#Import Python modules
+import logging
+import asyncio
+import collections
+import re
+import sys
+import os
+import time
+
+#Import TCM functionality
+import tcm_job_runner
+import tcm_watchdog
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# line printed by Schrodinger job control when a job is launched (e.g. "JobId: cluster-0-6543a1b2")
+JOB_ID_PATTERN = re.compile(r'JobId:\s*(\S+)')
+
+# status line printed by the job status command (e.g. "Status: running")
+STATUS_PATTERN = re.compile(r'^\s*status\s*[:=]\s*(\w+)', re.IGNORECASE | re.MULTILINE)
+
+# exit code line printed by the job status command once the job finished (e.g. "ExitCode: 0")
+EXIT_CODE_PATTERN = re.compile(r'^\s*exit\s*code\s*[:=]\s*(-?\d+)', re.IGNORECASE | re.MULTILINE)
+
+# outcome line printed by the job status command once the job finished (e.g. "ExitStatus: died"). Job control reports
+# "Status: completed" for jobs that died or were killed too, so only this line tells whether the job succeeded
+EXIT_STATUS_PATTERN = re.compile(r'^\s*exit\s*status\s*[:=]\s*(\w+)', re.IGNORECASE | re.MULTILINE)
+
+# job control statuses that mean the job has finished
+COMPLETED_STATUSES = {'completed', 'finished'}
+FAILED_STATUSES = {'failed', 'died', 'killed', 'canceled', 'cancelled', 'stopped', 'exited'}
+
+# exit status of a job that finished successfully
+SUCCESS_EXIT_STATUS = 'finished'
+
+#Get Schrodinger environmental variable
+SCHRODINGER = os.getenv('SCHRODINGER', '')
+
+# settings of job submission and polling (see configure)
+settings = {
+    'submit_prefix': os.getenv('TCM_JOB_SUBMIT_PREFIX', ''), # command put before every submitted command (e.g. local stand-in)
+    'status_command': os.getenv('TCM_JOB_STATUS_COMMAND', f'{os.path.join(SCHRODINGER, "jsc")} info'), # command given a job id that prints its status
+    'poll_interval': 10.0, # seconds before first status poll (and after every status change)
+    'poll_max_interval': 300.0, # longest wait between status polls in seconds
+    'poll_factor': 2.0, # growth of the wait between polls while the status does not change
+    'max_concurrent': 8 # largest number of jobs submitted and polled at once by run_jobs
+}
+
+def configure(**kwargs):
+    """ Changes job submission and polling settings for the rest of the run (arguments left as None are unchanged) """
+
+    for key, value in kwargs.items():
+        if key not in settings:
+            raise KeyError(f'Unknown job control setting {key}')
+        if value is not None:
+            settings[key] = value
+
+def use_local_job_control():
+    """ Submits and polls jobs with the local stand-in of Schrodinger job control (tcm_local_jobcontrol.py), which runs
+    commands as local background processes. Used to test workflows without a Schrodinger installation. """
+
+    stand_in = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tcm_local_jobcontrol.py')
+    configure(submit_prefix = f'{sys.executable} {stand_in} submit --', status_command = f'{sys.executable} {stand_in} info')
+    tcm_watchdog.configure(kill_command = f'{sys.executable} {stand_in} kill')
+
+# use local stand-in if requested from the environment
+if os.getenv('TCM_LOCAL_JOB_CONTROL', '0') not in ('0', 'no', 'false'):
+    use_local_job_control()
+
+def new_job(command, cwd = None):
+    """ Builds the dictionary tracking a job.
+
+    Return: job dictionary """
+
+    return {
+        'job_id': None, # job control id (None until launched)
+        'command': tcm_job_runner.split_command(command), # submitted command
+        'cwd': cwd or os.getcwd(), # directory the job is launched from
+        'status': 'pending', # pending, launched, failed to launch (launch_failed) or last job control status
+        'submitted': None, # time the job was launched (seconds since epoch)
+        'finished': None, # time the job was seen finished (seconds since epoch)
+        'polls': 0, # number of status polls
+        'launch_returncode': None, # exit code of the launch command
+        'exit_code': None, # exit code of the job reported by job control (None if not reported)
+        'exit_status': None, # outcome of the job reported by job control (e.g. finished, died, killed; None if not reported)
+        'output_tail': [] # last lines printed by the launch command
+    }
+
+def is_finished(job):
+    """ True if the job failed to launch, was killed by the watchdog (stalled), could not be killed by the watchdog
+    (kill_failed) or job control reports it finished (successfully or not) """
+
+    return job['status'] in COMPLETED_STATUSES | FAILED_STATUSES | {'launch_failed', 'stalled', 'kill_failed'}
+
+def succeeded(job):
+    """ True if job control reports the job completed with exit status finished (and exit code 0 if an exit code is reported) """
+
+    return (job['status'] in COMPLETED_STATUSES and job['exit_status'] == SUCCESS_EXIT_STATUS
+        and job['exit_code'] in (None, 0))
+
+async def run_command(arguments, cwd = None, log = None, tail_lines = tcm_job_runner.TAIL_LINES):
+    """ Runs a command in an asyncio subprocess (without a shell), writing its output to the log as it arrives.
+
+    Return: tuple of (exit code, list of last output lines, job id printed by the command or None) """
+
+    log = logger if log is None else log
+    tail = collections.deque(maxlen = tail_lines)
+    job_id = None
+
+    try:
+        process = await asyncio.create_subprocess_exec(*arguments, cwd = cwd, stdout = asyncio.subprocess.PIPE,
+            stderr = asyncio.subprocess.STDOUT)
+    except OSError as e: # e.g. executable not found
+        log.critical(f'Could not run {" ".join(arguments)}: {e}')
+        return 127, [str(e)], None
+
+    async for line in process.stdout:
+        line = line.decode(errors = 'replace').rstrip('\n')
+        if line == '':
+            continue
+        tail.append(line)
+        match = JOB_ID_PATTERN.search(line)
+        if match:
+            job_id = match.group(1)
+        log.debug(line)
+
+    return await process.wait(), list(tail), job_id
+
+async def submit(command, cwd = None, log = None):
+    """ Launches a command under job control (e.g. $SCHRODINGER/run piper.py ... without -WAIT) and records its job id.
+
+    Input:
+    - command: list of strings (each may hold several arguments) or command string
+    - cwd: directory to launch the job from (default is current working directory)
+    - log: logger that launch output is written to (default is logger of this module)
+
+    Return: job dictionary (status is launched or launch_failed) """
+
+    log = logger if log is None else log
+    job = new_job(command, cwd)
+    arguments = tcm_job_runner.split_command(settings['submit_prefix']) + job['command']
+
+    job['launch_returncode'], job['output_tail'], job['job_id'] = await run_command(arguments, job['cwd'], log)
+    job['submitted'] = time.time()
+
+    if job['launch_returncode'] != 0 or job['job_id'] is None:
+        job['status'] = 'launch_failed'
+        log.critical(f'Could not launch {job["command"][0]} (exit code {job["launch_returncode"]}). Last output: ' + ' | '.join(job['output_tail'][-5:]))
+    else:
+        job['status'] = 'launched'
+        log.info(f'Launched job {job["job_id"]} from {job["cwd"]}')
+
+    return job
+
+async def get_status_info(job_id):
+    """ Asks job control for the status (and exit code and exit status once finished) of a job.
+
+    Return: tuple of (status in lower case (e.g. running, completed) or None if the status could not be read, exit code or None,
+    exit status in lower case (e.g. finished, died) or None) """
+
+    arguments = tcm_job_runner.split_command(settings['status_command']) + [job_id]
+    try:
+        process = await asyncio.create_subprocess_exec(*arguments, stdout = asyncio.subprocess.PIPE, stderr = asyncio.subprocess.STDOUT)
+        output, _ = await process.communicate()
+    except OSError as e:
+        logger.warning(f'Could not get status of job {job_id}: {e}')
+        return None, None, None
+
+    output = output.decode(errors = 'replace')
+    status = STATUS_PATTERN.search(output)
+    exit_code = EXIT_CODE_PATTERN.search(output)
+    exit_status = EXIT_STATUS_PATTERN.search(output)
+
+    return (status.group(1).lower() if status else None, int(exit_code.group(1)) if exit_code else None,
+        exit_status.group(1).lower() if exit_status else None)
+
+async def get_status(job_id):
+    """ Asks job control for the status of a job.
+
+    Return: status in lower case (e.g. running, completed) or None if the status could not be read """
+
+    status, exit_code, exit_status = await get_status_info(job_id)
+    return status
+
+async def poll(job, log = None, watch_paths = None, exclude_paths = ()):
+    """ Polls job control until the job finishes. The wait between polls starts at poll_interval and grows by poll_factor
+    (up to poll_max_interval) while the status does not change. If watch_paths are given, the stall watchdog kills the job
+    when none of them (except directories under exclude_paths) changes within the stall window (see tcm_watchdog).
+
+    Return: job dictionary with final status """
+
+    log = logger if log is None else log
+    delay = settings['poll_interval']
+
+    while not is_finished(job):
+        await asyncio.sleep(delay)
+        status, exit_code, exit_status = await get_status_info(job['job_id'])
+        job['polls'] += 1
+        if exit_code is not None:
+            job['exit_code'] = exit_code
+        if exit_status is not None:
+            job['exit_status'] = exit_status
+
+        if status is not None and status != job['status']:
+            log.info(f'Job {job["job_id"]} is {status}')
+            job['status'] = status
+            delay = settings['poll_interval'] # status changed, so polling again soon
+        else:
+            delay = min(delay * settings['poll_factor'], settings['poll_max_interval'])
+
+        # killing job if it stopped making progress
+        if watch_paths and not is_finished(job):
+            await tcm_watchdog.check(job, watch_paths, log, exclude_paths)
+
+    job['finished'] = time.time()
+    return job
+
+async def run_job(command, cwd = None, log = None, watch_paths = None):
+    """ Launches a command under job control and waits (without blocking other jobs) until it finishes.
+
+    Input:
+    - command: list of strings (each may hold several arguments) or command string
+    - cwd: directory to launch the job from (default is current working directory)
+    - log: logger (default is logger of this module)
+    - watch_paths: job log / output files or directories watched by the stall watchdog (None does not watch the job)
+
+    Return: job dictionary with final status """
+
+    job = await submit(command, cwd, log)
+    if job['status'] == 'launched':
+        await poll(job, log, watch_paths)
+
+    return job
+
+async def run_jobs(commands, max_concurrent = None, log = None):
+    """ Launches and polls many jobs concurrently, with at most max_concurrent jobs running at once.
+
+    Input:
+    - commands: list of (command, directory to launch from)
+    - max_concurrent: largest number of jobs running at once (default from configure)
+
+    Return: list of job dictionaries in the same order as commands """
+
+    semaphore = asyncio.Semaphore(settings['max_concurrent'] if max_concurrent is None else max_concurrent)
+
+    async def run_limited(command, cwd):
+        async with semaphore:
+            return await run_job(command, cwd, log)
+
+    return await asyncio.gather(*[run_limited(command, cwd) for command, cwd in commands])
+
+def wait(coroutine):
+    """ Runs a coroutine of this module (e.g. run_job or run_jobs) to completion from synchronous code """
+
+    return asyncio.run(coroutine)
@@ -0,0 +1,73 @@
+#Import Python modules
+import logging
+import collections
+import subprocess
+import shlex
+import time
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# result of a finished command
+JobResult = collections.namedtuple('JobResult', [
+    'command', # list of arguments that were run
+    'returncode', # exit code of the command (127 if it could not be started)
+    'duration', # wall time in seconds
+    'output_tail' # last lines of the combined stdout and stderr
+])
+
+# number of output lines kept for the result (the rest is only written to the log)
+TAIL_LINES = 50
+
+def split_command(command):
+    """ Splits a command given as a list of strings that may hold several arguments each
+    (e.g. ['$SCHRODINGER/run -FROM psp piper.py', '-jobname x']) into a list of single arguments.
+
+    Return: list of arguments """
+
+    if isinstance(command, str):
+        return shlex.split(command)
+    return [argument for part in command for argument in shlex.split(part)]
+
+def run_job(command, cwd = None, env = None, log = None, tail_lines = TAIL_LINES, ignore = ('ExitStatus',)):
+    """ Runs a command without a shell, streaming its combined stdout and stderr to the log line by line as it is
+    written (only the last tail_lines lines are held in memory).
+
+    Input:
+    - command: list of strings (each may hold several arguments) or command string
+    - cwd: directory to run the command in (default is current working directory)
+    - env: environmental variables of the command (default is inherited)
+    - log: logger that output lines are written to at debug level (default is logger of this module)
+    - tail_lines: number of last output lines kept in the result
+    - ignore: output lines containing any of these strings are not written to the log
+
+    Return: JobResult """
+
+    log = logger if log is None else log
+    arguments = split_command(command)
+    tail = collections.deque(maxlen = tail_lines)
+
+    start = time.monotonic()
+    try:
+        process = subprocess.Popen(arguments, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True,
+            bufsize = 1, cwd = cwd, env = env)
+    except OSError as e: # e.g. executable not found
+        log.critical(f'Could not run {" ".join(arguments)}: {e}')
+        return JobResult(arguments, 127, time.monotonic() - start, [str(e)])
+
+    # writing output to the log as it arrives
+    with process:
+        for line in process.stdout:
+            line = line.rstrip('\n')
+            if line == '': #Ignore blank lines
+                continue
+            tail.append(line)
+            if not any(text in line for text in ignore):
+                log.debug(line)
+
+    result = JobResult(arguments, process.returncode, time.monotonic() - start, list(tail))
+
+    if result.returncode != 0:
+        log.warning(f'{arguments[0]} exited with status {result.returncode} after {result.duration:.1f} s')
+
+    return result
@@ -0,0 +1,207 @@
+#Import Python modules
+import logging
+import itertools
+import concurrent.futures
+import csv
+import os
+
+#Import TCM functionality
+import tcm_records
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# columns of the per-ligand validation table
+REPORT_COLUMNS = ['index', 'title', 'status', 'loaded', 'prepared', 'reason']
+
+# settings of ligand validation (see configure); number of workers can be set with TCM_LIGAND_WORKERS
+settings = {
+    'workers': int(os.getenv('TCM_LIGAND_WORKERS', os.cpu_count() or 1)),
+    'chunk_size': 200, # number of ligands checked per task sent to a worker
+    'report_dir': None # directory to write the per-ligand table to (None is directory of the ligand file)
+}
+
+# validation rows of the ligand files already validated during this run (keyed by absolute file path)
+_reports = {}
+
+def configure(workers = None, chunk_size = None, report_dir = None):
+    """ Changes how ligand files are validated for the rest of the run (arguments left as None are unchanged) """
+
+    if workers is not None:
+        settings['workers'] = max(1, int(workers))
+    if chunk_size is not None:
+        settings['chunk_size'] = max(1, int(chunk_size))
+    if report_dir is not None:
+        settings['report_dir'] = report_dir
+
+def load_record(record_format, text):
+    """ Loads a single record of a ligand file into a structure.
+
+    Input:
+    - record_format: format of the record (sd, mol2, smiles or maestro)
+    - text: record text (SMILES string for smiles records)
+
+    Return: schrodinger.structure.Structure """
+
+    from schrodinger.structure import StructureReader, SmilesStructure # imported when first needed (slow to import)
+
+    if record_format == 'smiles':
+        return SmilesStructure(text).get2dStructure()
+
+    return next(iter(StructureReader.fromString(text, format = record_format)))
+
+def is_3d(st):
+    """ Checks whether the structure has 3D coordinates (2D structures have every z coordinate at 0) """
+
+    return any(abs(atom.z) > 1e-4 for atom in st.atom)
+
+def has_hydrogens(st):
+    """ Checks whether the structure has explicit hydrogens """
+
+    return any(atom.atomic_number == 1 for atom in st.atom)
+
+def has_ligprep_properties(st):
+    """ Checks whether the structure carries properties written by LigPrep (e.g. s_lp_Variant) """
+
+    return any('_lp_' in prop for prop in st.property)
+
+def validate_record(index, record_format, title, text):
+    """ Checks that a single ligand record loads and looks prepared by LigPrep (3D coordinates and explicit hydrogens).
+    SMILES records are never prepared, so they are reported with status warn (needs LigPrep) instead of failing.
+
+    Return: dictionary row of the validation table (see REPORT_COLUMNS) """
+
+    row = {'index': index, 'title': title, 'status': 'fail', 'loaded': False, 'prepared': False, 'reason': ''}
+
+    # checks loadability
+    try:
+        st = load_record(record_format, text)
+    except Exception as e:
+        row['reason'] = f'record could not be loaded: {e}'.replace('\n', ' ')
+        return row
+
+    row['loaded'] = True
+    row['title'] = title or st.title
+
+    # SMILES records hold no coordinates or hydrogens to check
+    if record_format == 'smiles':
+        row['status'] = 'warn'
+        row['reason'] = 'needs LigPrep (SMILES record has no 3D coordinates)'
+        return row
+
+    # checks ligand preparation
+    reasons = []
+    if not is_3d(st):
+        reasons.append('no 3D coordinates')
+    if not has_hydrogens(st):
+        reasons.append('no explicit hydrogens')
+
+    if reasons:
+        row['reason'] = f'not prepared by LigPrep ({", ".join(reasons)})'
+        return row
+
+    row['prepared'] = True
+    row['status'] = 'pass'
+    if not has_ligprep_properties(st): # prepared structure that may have been made by other tools than LigPrep
+        row['reason'] = 'no LigPrep properties found'
+
+    return row
+
+def validate_chunk(chunk):
+    """ Validates a chunk of ligand records (run in worker processes).
+
+    Input:
+    - chunk: list of (index, record format, title, record text)
+
+    Return: list of validation rows """
+
+    return [validate_record(*record) for record in chunk]
+
+def chunks(records, chunk_size):
+    """ Groups streamed records into lists of chunk_size records """
+
+    records = iter(records)
+    chunk = list(itertools.islice(records, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(records, chunk_size))
+
+def validate_library(ligand_file_path, workers = None, chunk_size = None):
+    """ Streams the ligand file and validates every record, sending chunks of records to worker processes. A bounded
+    number of chunks is held in memory at once so large libraries can be validated.
+
+    Input:
+    - ligand_file_path: path to ligand file (.sdf, .mol2, .smi, .mae or .maegz)
+    - workers: number of worker processes (default from configure)
+    - chunk_size: number of records per chunk (default from configure)
+
+    Return: list of validation rows sorted by record index """
+
+    workers = settings['workers'] if workers is None else workers
+    chunk_size = settings['chunk_size'] if chunk_size is None else chunk_size
+
+    record_chunks = chunks(tcm_records.stream_records(ligand_file_path), chunk_size)
+    first_chunks = list(itertools.islice(record_chunks, 2))
+
+    # libraries fitting in one chunk (or single worker) are validated in this process
+    if len(first_chunks) < 2 or workers <= 1:
+        return [row for chunk in itertools.chain(first_chunks, record_chunks) for row in validate_chunk(chunk)]
+
+    rows = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+        pending = set()
+        for chunk in itertools.chain(first_chunks, record_chunks):
+            pending.add(executor.submit(validate_chunk, chunk))
+
+            # waiting for results once enough chunks are queued (bounds records held in memory)
+            if len(pending) >= 2 * workers:
+                done, pending = concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    rows.extend(future.result())
+
+        for future in concurrent.futures.as_completed(pending):
+            rows.extend(future.result())
+
+    return sorted(rows, key = lambda row: row['index'])
+
+def report_path(ligand_file_path):
+    """ Path of the per-ligand validation table of the ligand file """
+
+    report_dir = settings['report_dir'] or os.path.dirname(os.path.abspath(ligand_file_path))
+    name = os.path.basename(ligand_file_path).split('.')[0]
+
+    return os.path.join(report_dir, f'{name}_ligand_validation.csv')
+
+def write_report(rows, path):
+    """ Writes the validation rows as a csv table """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline = '') as f:
+        writer = csv.DictWriter(f, fieldnames = REPORT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def forget(ligand_file_path = None):
+    """ Drops the validation rows of ligand_file_path (or of every ligand file if ligand_file_path is None), e.g. after a file is rewritten """
+
+    if ligand_file_path is None:
+        _reports.clear()
+    else:
+        _reports.pop(os.path.abspath(ligand_file_path), None)
+
+def get_report(ligand_file_path):
+    """ Returns the validation rows of the ligand file, validating it (and writing the validation table) only the first time
+    it is requested this run. Errors in reading the file itself are raised. """
+
+    key = os.path.abspath(ligand_file_path)
+    if key not in _reports:
+        rows = validate_library(ligand_file_path)
+        path = report_path(ligand_file_path)
+        try:
+            write_report(rows, path)
+            logger.info(f'Per-ligand validation table of {ligand_file_path} written to {path}')
+        except OSError as e: # table is informative, so failing to write it never fails the check
+            logger.warning(f'Could not write per-ligand validation table to {path}: {e}')
+        _reports[key] = rows
+
+    return _reports[key]
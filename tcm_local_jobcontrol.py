@@ -0,0 +1,180 @@
+#Import Python modules
+import logging
+import argparse
+import subprocess
+import signal
+import json
+import time
+import sys
+import os
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# Local stand-in for the Schrodinger job control commands used by tcm_job_control. Jobs are run as local background
+# processes and their status is kept in json files, e.g.:
+#   python tcm_local_jobcontrol.py submit -- sleep 10    (prints "JobId: local-...")
+#   python tcm_local_jobcontrol.py info local-...        (prints "Status: running", then "Status: completed" and
+#                                                        "ExitStatus: finished" (or died, killed) once the job ended)
+
+#Get directory storing status of local jobs (can be moved with the TCM_LOCAL_JOBS_DIR environmental variable)
+jobs_dir = os.getenv('TCM_LOCAL_JOBS_DIR', os.path.join(os.getenv('TCM_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.tcm_cache')), 'local_jobs'))
+
+def status_path(job_id):
+    """ Path of json file holding the status of a local job """
+
+    return os.path.join(jobs_dir, f'{job_id}.json')
+
+def write_status(job_id, **status):
+    """ Updates the status file of a local job (written to temporary file then renamed so readers never see partial files) """
+
+    path = status_path(job_id)
+    current = read_status(job_id) or {}
+    current.update(status)
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(current, f)
+    os.replace(tmp_path, path)
+
+def read_status(job_id):
+    """ Reads the status file of a local job (None if unknown job) """
+
+    try:
+        with open(status_path(job_id), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def submit(command):
+    """ Launches command as a detached local process (like a job under job control) and prints its job id.
+
+    Return: job id """
+
+    os.makedirs(jobs_dir, exist_ok = True)
+    job_id = f'local-{int(time.time() * 1000)}-{os.getpid()}'
+    write_status(job_id, status = 'launched', command = command, cwd = os.getcwd(), submitted = time.time())
+
+    # the job is run by a detached process of this script that records the exit status when the command finishes
+    with open(os.path.join(jobs_dir, f'{job_id}.log'), 'w') as log_file:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), 'execute', job_id, '--'] + command, stdout = log_file,
+            stderr = subprocess.STDOUT, stdin = subprocess.DEVNULL, start_new_session = True)
+
+    print(f'JobId: {job_id}')
+    return job_id
+
+def execute(job_id, command):
+    """ Runs command of a local job and records its status (running, then completed with exit status finished or died) """
+
+    write_status(job_id, status = 'running', pid = os.getpid(), started = time.time())
+    try:
+        returncode = subprocess.call(command)
+    except OSError as e:
+        print(e)
+        returncode = 127
+
+    # like Schrodinger job control, the status of a finished job is completed and its outcome is in the exit status
+    write_status(job_id, status = 'completed', exit_status = 'finished' if returncode == 0 else 'died', exit_code = returncode,
+        finished = time.time())
+
+def info(job_id):
+    """ Prints status of a local job as Schrodinger job control does ("Status: <status>", "ExitStatus: <exit status>")
+
+    Return: exit status (1 if job is unknown) """
+
+    status = read_status(job_id)
+    if status is None:
+        print(f'Unknown job {job_id}')
+        return 1
+
+    # job process ended without recording a final status (e.g. killed)
+    if status['status'] == 'running' and not pid_alive(status.get('pid')):
+        status = read_status(job_id) # may have finished since the first read
+        if status['status'] == 'running':
+            write_status(job_id, status = 'completed', exit_status = 'died')
+            status.update(status = 'completed', exit_status = 'died')
+
+    print(f'JobId: {job_id}')
+    print(f'Status: {status["status"]}')
+    if 'exit_status' in status:
+        print(f'ExitStatus: {status["exit_status"]}')
+    if 'exit_code' in status:
+        print(f'ExitCode: {status["exit_code"]}')
+
+    return 0
+
+def kill(job_id):
+    """ Kills a running local job (and the processes it started) and marks it killed
+
+    Return: exit status (1 if job is unknown or already finished) """
+
+    status = read_status(job_id)
+    if status is None or status['status'] not in ('launched', 'running'):
+        print(f'Job {job_id} is not running')
+        return 1
+
+    # job process leads its own session, so killing its process group also kills the command
+    if pid_alive(status.get('pid')):
+        os.killpg(os.getpgid(status['pid']), signal.SIGTERM)
+
+    write_status(job_id, status = 'completed', exit_status = 'killed', finished = time.time())
+    print(f'Killed job {job_id}')
+    return 0
+
+def pid_alive(pid):
+    """ Checks whether a process with this pid is running """
+
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError: # process exists but belongs to another user
+        return True
+
+    # reaped children of other processes may be left as zombies, which are not running
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            return f.read().split(')')[-1].split()[0] != 'Z'
+    except OSError:
+        return True
+
+def main(argv = None):
+    """ Command line of the local job control stand-in """
+
+    parser = argparse.ArgumentParser(prog = 'tcm_local_jobcontrol', description = 'Local stand-in for Schrodinger job control')
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+
+    submit_parser = subparsers.add_parser('submit', help = 'run command as a local background job and print its job id')
+    submit_parser.add_argument('job_command', nargs = argparse.REMAINDER, help = 'command to run (after --)')
+
+    info_parser = subparsers.add_parser('info', help = 'print status of a local job')
+    info_parser.add_argument('job_id', help = 'job id printed by submit')
+
+    kill_parser = subparsers.add_parser('kill', help = 'kill a local job')
+    kill_parser.add_argument('job_id', help = 'job id printed by submit')
+
+    execute_parser = subparsers.add_parser('execute', help = argparse.SUPPRESS)
+    execute_parser.add_argument('job_id')
+    execute_parser.add_argument('job_command', nargs = argparse.REMAINDER)
+
+    args = parser.parse_args(argv)
+    command = getattr(args, 'job_command', [])
+    if command[:1] == ['--']: # separator between options of this script and the command
+        command = command[1:]
+
+    if args.command == 'submit':
+        if not command:
+            parser.error('no command to submit')
+        submit(command)
+        return 0
+    if args.command == 'execute':
+        execute(args.job_id, command)
+        return 0
+    if args.command == 'kill':
+        return kill(args.job_id)
+    return info(args.job_id)
+
+if __name__ == '__main__':
+    sys.exit(main())
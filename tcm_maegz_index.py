@@ -0,0 +1,317 @@
+#Import Python modules
+import logging
+import argparse
+import bisect
+import gzip
+import zlib
+import json
+import sys
+import os
+
+#Import TCM functionality
+import tcm_records
+import tcm_fast_reader
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+#Version of the sidecar index (indexes of other versions are rebuilt)
+index_version = 2
+
+# bytes read from the compressed file at once while scanning it
+READ_SIZE = 1024 * 1024
+
+def index_path(file_path):
+    """ Path of the sidecar index of a .maegz file (e.g. poses.maegz has poses.maegz.idx) """
+
+    return f'{file_path}.idx'
+
+def blocks_path(file_path):
+    """ Path of the blocked copy of a .maegz file, written when its own gzip members are too large to read single structures from """
+
+    return f'{file_path}.blocks'
+
+def sidecar_paths(file_path):
+    """ Paths of the sidecar files of a .maegz file (index and blocked copy) """
+
+    return [index_path(file_path), blocks_path(file_path)]
+
+def scan(file_path):
+    """ Reads a .maegz (or .mae) file once without changing it, recording where every gzip member starts in the compressed
+    file and where the file header and every structure (top-level f_m_ct block) start in the decompressed text.
+
+    Return: tuple of (list of [compressed offset, compressed length, decompressed offset] of every gzip member (empty if the
+    file is not compressed), decompressed length of the file, list of decompressed offsets of structures)
+
+    Raises: ValueError for truncated gzip files or partial ct blocks (see tcm_records.maestro_blocks) """
+
+    members = []
+    starts = []
+    position = 0 # decompressed offset of the start of pending
+    pending = b'' # decompressed text after the last complete line
+
+    def feed(data, final = False):
+        """ Records the structures starting in the next decompressed data """
+        nonlocal position, pending
+        lines = (pending + data).split(b'\n')
+        pending = b'' if final else lines.pop()
+        for line in lines:
+            if line.startswith(b'f_m_ct'): # new top-level structure block
+                starts.append(position)
+            elif line.startswith(b'p_m_ct'):
+                raise ValueError(f'{file_path} has partial ct blocks (p_m_ct), which can not be read without the structure before them')
+            position += len(line) + 1
+
+    with open(file_path, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b' # gzip magic number
+        f.seek(0)
+
+        if not compressed:
+            for data in iter(lambda: f.read(READ_SIZE), b''):
+                feed(data)
+            feed(b'', final = True)
+            return members, position - 1 if position else 0, starts
+
+        offset = 0
+        while True:
+            # decompressing the gzip member starting at offset
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            member = [offset, 0, position + len(pending)]
+            while not decompressor.eof:
+                data = f.read(READ_SIZE)
+                if not data:
+                    raise ValueError(f'{file_path} is a truncated gzip file')
+                feed(decompressor.decompress(data))
+                offset += len(data)
+            offset -= len(decompressor.unused_data)
+            member[1] = offset - member[0]
+            members.append(member)
+
+            # next member, if any (gzip writers may pad the end of the file with zeros)
+            f.seek(offset)
+            if f.read(2) != b'\x1f\x8b':
+                break
+            f.seek(offset)
+
+    feed(b'', final = True)
+    return members, position - 1 if position else 0, starts
+
+def write_blocks(file_path, header_span, spans, block_size):
+    """ Writes the blocked copy of a .maegz file: the file header and every block of block_size structures compressed as
+    separate gzip members, so single structures are read by decompressing one small member. The copy decompresses to
+    the same text as the file, so structures are found at the same decompressed offsets.
+
+    Return: list of [compressed offset, compressed length, decompressed offset] of every gzip member of the copy """
+
+    path = blocks_path(file_path)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    members = []
+
+    with gzip.open(file_path, 'rb') as source, open(tmp_path, 'wb') as out:
+        groups = [header_span] + [[spans[i][0], sum(length for _, length in spans[i:i + block_size])] for i in range(0, len(spans), block_size)]
+        for decompressed_offset, length in groups:
+            data = gzip.compress(source.read(length))
+            members.append([out.tell(), len(data), decompressed_offset])
+            out.write(data)
+
+    os.replace(tmp_path, path)
+    return members
+
+def build_index(file_path, block_size = 1):
+    """ Writes the sidecar index of a .maegz file, recording the decompressed span of the file header and of every structure
+    and the gzip members they are read from. The .maegz file is never changed: if its own gzip members hold more than
+    block_size structures (e.g. a single member, as written by most tools), a blocked copy is written next to it (see
+    write_blocks) and structures are read from the copy. A single structure can then be read by decompressing the header
+    and one block only.
+
+    Input:
+    - file_path: path to .maegz file (e.g. PIPER output prot_prot_docking_<name>-out.maegz)
+    - block_size: largest number of structures per gzip member read
+
+    Return: index dictionary """
+
+    members, length, starts = scan(file_path)
+    ends = starts[1:] + [length]
+    spans = [[start, end - start] for start, end in zip(starts, ends)]
+    header_span = [0, starts[0] if starts else length]
+
+    # reading from the file itself if it is not compressed, or if its gzip members are small enough
+    data_path = file_path
+    member_offsets = [member[2] for member in members]
+    per_member = [0] * len(members)
+    for start in starts if members else []:
+        per_member[bisect.bisect_right(member_offsets, start) - 1] += 1
+    if members and max(per_member) > block_size:
+        members = write_blocks(file_path, header_span, spans, block_size)
+        data_path = blocks_path(file_path)
+
+    # recording the indexed file (and the copy read from) so stale indexes are detected
+    stat = os.stat(file_path)
+    index = {'version': index_version, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'structures': len(spans),
+        'block_size': block_size, 'blocked': data_path != file_path, 'data_size': os.path.getsize(data_path),
+        'members': members, 'header': header_span, 'spans': spans}
+
+    # written to temporary file then renamed, so an index hard linked from the PIPER result store is never changed
+    tmp_path = f'{index_path(file_path)}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path(file_path))
+
+    logger.info(f'Indexed {len(spans)} structures of {file_path}' + (f' (blocked copy in {data_path})' if data_path != file_path else ''))
+    return index
+
+def data_path_of(file_path, index):
+    """ Path of the file structures of an indexed .maegz file are read from (the file itself or its blocked copy) """
+
+    return blocks_path(file_path) if index['blocked'] else file_path
+
+def load_index(file_path):
+    """ Reads the sidecar index of a .maegz file.
+
+    Return: index dictionary or None if there is no index or the file (or its blocked copy) changed since it was indexed """
+
+    try:
+        with open(index_path(file_path), 'r') as f:
+            index = json.load(f)
+        stat = os.stat(file_path)
+        if index.get('version') != index_version:
+            return None
+        data_size = os.path.getsize(data_path_of(file_path, index))
+    except (OSError, ValueError):
+        return None
+
+    if index['size'] != stat.st_size or index['mtime_ns'] != stat.st_mtime_ns or index['data_size'] != data_size:
+        logger.debug(f'Index of {file_path} is out of date')
+        return None
+
+    return index
+
+def get_index(file_path, block_size = 1):
+    """ Returns the sidecar index of a .maegz file, building it (and a blocked copy if needed) if missing or out of date """
+
+    index = load_index(file_path)
+    if index is None:
+        index = build_index(file_path, block_size)
+
+    return index
+
+def read_span(f, index, span, cache):
+    """ Reads a span of the decompressed text of an indexed file, decompressing only the gzip members holding it.
+
+    Input:
+    - f: file the index reads from, open in binary mode
+    - index: index dictionary
+    - span: [decompressed offset, length]
+    - cache: dictionary holding the last decompressed member (member number and data), shared between calls
+
+    Return: text of the span """
+
+    start, length = span
+    if not index['members']: # file is not compressed
+        f.seek(start)
+        return f.read(length).decode()
+
+    member_offsets = [member[2] for member in index['members']]
+    number = bisect.bisect_right(member_offsets, start) - 1
+    skip = start - member_offsets[number] # start of the span in the first member read
+    data = b''
+    while len(data) < skip + length and number < len(member_offsets):
+        if cache.get('number') != number:
+            offset, compressed_length, _ = index['members'][number]
+            f.seek(offset)
+            cache.update(number = number, data = gzip.decompress(f.read(compressed_length)))
+        data += cache['data']
+        number += 1
+
+    return data[skip:skip + length].decode()
+
+def read_text(file_path, structure_indices, index = None):
+    """ Reads a subset of structures of an indexed .maegz file as .mae text, decompressing only the blocks containing them.
+
+    Input:
+    - file_path: path to .maegz file
+    - structure_indices: structure indices to read (starting at 1, same as the order in the file)
+    - index: index dictionary (default is read or built with get_index)
+
+    Return: .mae text with file header and the requested structures in the given order """
+
+    index = get_index(file_path) if index is None else index
+
+    records = []
+    cache = {} # last decompressed member, for consecutive structures
+    with open(data_path_of(file_path, index), 'rb') as f:
+        header = read_span(f, index, index['header'], cache)
+        for structure_index in structure_indices:
+            if not 1 <= structure_index <= index['structures']:
+                raise IndexError(f'Structure {structure_index} not in {file_path} ({index["structures"]} structures)')
+            records.append(read_span(f, index, index['spans'][structure_index - 1], cache))
+
+    return header + ''.join(records)
+
+def read_structures(file_path, structure_indices, index = None):
+    """ Reads a subset of structures of an indexed .maegz file (atom arrays if numpy backend is selected, see tcm_fast_reader).
+
+    Yields: schrodinger.structure.Structure (or tuple of (title, atom array) for numpy backend) of each requested structure """
+
+    text = read_text(file_path, structure_indices, index)
+
+    if tcm_fast_reader.use_fast_reader(file_path):
+        for title, rows in tcm_fast_reader.read_maestro(text.splitlines(True)):
+            yield title, tcm_fast_reader.np.array(rows, dtype = tcm_fast_reader.ATOM_DTYPE)
+        return
+
+    from schrodinger.structure import StructureReader # imported when first needed (slow to import)
+    yield from StructureReader.fromString(text, format = 'maestro')
+
+def extract(file_path, structure_indices, output_path, index = None):
+    """ Writes a subset of structures of an indexed .maegz file to a new .mae (or gzipped .maegz) file, e.g. a shard of PIPER poses
+
+    Return: output_path """
+
+    text = read_text(file_path, structure_indices, index)
+
+    opener = gzip.open if output_path.endswith('gz') else open
+    with opener(output_path, 'wt') as f:
+        f.write(text)
+
+    return output_path
+
+def parse_indices(text):
+    """ Parses structure indices given as comma separated numbers and ranges (e.g. 1,5,10-20) """
+
+    indices = []
+    for part in text.split(','):
+        start, _, end = part.partition('-')
+        indices.extend(range(int(start), int(end or start) + 1))
+
+    return indices
+
+def main(argv = None):
+    """ Command line to index .maegz files and pull structures out of them """
+
+    parser = argparse.ArgumentParser(prog = 'tcm_maegz_index', description = 'Random-access index of .maegz pose files')
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+
+    build = subparsers.add_parser('build', help = 'write the sidecar index of a .maegz file (and a blocked copy if its gzip members are too large)')
+    build.add_argument('file', help = 'path to .maegz file')
+    build.add_argument('--block_size', dest = 'block_size', type = int, default = 1, help = 'largest number of structures per compressed block read')
+
+    get = subparsers.add_parser('get', help = 'write some structures of an indexed .maegz file to a new file')
+    get.add_argument('file', help = 'path to .maegz file')
+    get.add_argument('structures', type = parse_indices, help = 'structure indices starting at 1 (e.g. 1,5,10-20)')
+    get.add_argument('-o', '--output', dest = 'output', required = True, help = 'output .mae or .maegz file')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        index = build_index(args.file, args.block_size)
+        print(f'{index["structures"]} structures indexed in {index_path(args.file)}')
+    else:
+        extract(args.file, args.structures, args.output)
+        print(f'{len(args.structures)} structures written to {args.output}')
+
+    return 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level = logging.INFO)
+    sys.exit(main())
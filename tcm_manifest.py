@@ -0,0 +1,329 @@
+#Import Python modules
+import logging
+import argparse
+import csv
+import os
+
+#Import TCM functionality
+import tcm_parseargs
+import tcm_check_input
+import tcm_scheduler
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# A manifest lists many (cereblon, protein of interest, ligand) triples run as one campaign, e.g. as csv:
+#   name,cereblon,protein,ligand
+#   5HXB-2_lenalidomide,crbn.mae,5HXB-2.mae,lenalidomide.sdf
+# or as yaml (needs PyYAML): a list of such mappings, or a mapping with 'defaults' and 'runs'. Any other column must be a
+# TCM argument, named as its destination (e.g. piper_settings, shard_hosts for --piper_shard_hosts), and overrides the
+# command line for that triple. File paths are relative to the manifest.
+
+# other accepted names of manifest columns
+COLUMN_ALIASES = {'poi': 'protein'}
+
+# columns holding file paths (resolved relative to the manifest)
+FILE_COLUMNS = ['cereblon', 'protein', 'ligand', 'piper_settings', 'ifd_settings']
+
+# columns every triple needs (from the manifest or the command line)
+REQUIRED_COLUMNS = ['cereblon', 'protein', 'ligand', 'piper_settings', 'ifd_settings']
+
+def parse_args(master_dir):
+    """ Builds the TCM parser and parses the user's inputs for a manifest run (inputs of single runs are optional, as they
+    come from the manifest; given ones are defaults of every triple).
+
+    Returns:
+    -parser: object of class argparse.ArgumentParser used to parse
+    -args: Namespace object containing user parsed args
+    -unknowns: list of unrecognized arguments
+    -args_by_group: dictionary grouping arguments by module in workflow """
+
+    parser, args_by_group = tcm_parseargs.build_parser()
+    for action in parser._actions:
+        action.required = False
+
+    args, unknowns = parser.parse_known_args()
+    args.manifest = os.path.join(master_dir, args.manifest)
+    for column in FILE_COLUMNS:
+        if getattr(args, column, None) is not None:
+            setattr(args, column, os.path.join(master_dir, getattr(args, column)))
+
+    return parser, args, unknowns, args_by_group
+
+def read_manifest(manifest_path):
+    """ Reads the rows of a csv or yaml manifest.
+
+    Return: list of dictionaries of column to value (empty values are left out)
+
+    Raises: ValueError for unknown manifest formats or yaml that isn't a list of triples, ImportError if PyYAML is not installed """
+
+    extension = os.path.splitext(manifest_path)[1].lower()
+
+    if extension == '.csv':
+        with open(manifest_path, 'r', newline = '') as f:
+            rows = [{column.strip(): value.strip() for column, value in row.items() if column and value and value.strip()} for row in csv.DictReader(f)]
+        return [row for row in rows if row]
+
+    if extension in ('.yaml', '.yml'):
+        try:
+            import yaml # optional dependency, only needed for yaml manifests
+        except ImportError:
+            raise ImportError('yaml manifests need PyYAML (pip install pyyaml); use a csv manifest instead')
+
+        with open(manifest_path, 'r') as f:
+            content = yaml.safe_load(f)
+
+        defaults = {}
+        if isinstance(content, dict):
+            defaults, content = content.get('defaults') or {}, content.get('runs')
+        if not isinstance(content, list) or not all(isinstance(row, dict) for row in content):
+            raise ValueError(f'{manifest_path} must hold a list of triples (or a mapping with a runs list)')
+
+        return [{str(column): value for column, value in dict(defaults, **row).items() if value is not None} for row in content]
+
+    raise ValueError(f'Unknown manifest format {extension}; must be .csv, .yaml or .yml')
+
+def convert(action, value, manifest_dir):
+    """ Converts a manifest value to the type of its argument (file paths are made relative to the manifest, lists are
+    split on whitespace and flags accept true/false) """
+
+    if action.dest in FILE_COLUMNS:
+        return os.path.join(manifest_dir, str(value))
+    if not isinstance(value, str):
+        return value
+    if action.nargs == 0: # flag (e.g. --resume)
+        return value.lower() in ('1', 'true', 'yes')
+    if action.nargs in ('+', '*'):
+        return [action.type(item) if callable(action.type) else item for item in value.split()]
+
+    return action.type(value) if callable(action.type) else value
+
+def campaign_dir_of(args, master_dir):
+    """ Directory of a campaign, named by the name argument or the manifest file """
+
+    name = args.name or os.path.basename(args.manifest).split('.')[0]
+    return os.path.join(master_dir, f'TCM_campaign_{name}')
+
+def build_runs(rows, args, parser, manifest_dir):
+    """ Builds the arguments of every triple of the manifest (command line arguments overridden by the manifest columns).
+
+    Return: list of run dictionaries with name, args (Namespace), columns (manifest columns overriding the command line)
+    and errors (list of reasons the triple can't run)
+
+    Raises: ValueError if a column is not a TCM argument or two triples have the same name """
+
+    actions = {action.dest: action for action in parser._actions}
+    runs = []
+    names = set()
+
+    for index, row in enumerate(rows, start = 1):
+        columns = {}
+        for column, value in row.items():
+            column = COLUMN_ALIASES.get(column, column)
+            if column not in actions or column == 'manifest':
+                raise ValueError(f'Manifest column {column} is not a TCM argument')
+            columns[column] = convert(actions[column], value, manifest_dir)
+
+        run_args = argparse.Namespace(**vars(args))
+        for column, value in columns.items():
+            setattr(run_args, column, value)
+
+        # naming triple by protein and ligand if no name is given (name on the command line is the name of the campaign)
+        stems = [os.path.basename(path).split('.')[0] for path in (run_args.protein, run_args.ligand) if path is not None]
+        run_args.name = str(columns.get('name') or '_'.join(stems) or f'run{index}')
+        if run_args.name in names:
+            raise ValueError(f'Manifest has more than one triple named {run_args.name}; add a name column')
+        names.add(run_args.name)
+
+        errors = [f'no {column}' for column in REQUIRED_COLUMNS if getattr(run_args, column, None) is None]
+        runs.append({'name': run_args.name, 'args': run_args, 'columns': columns, 'errors': errors})
+
+    return runs
+
+def validate_files(runs, workers = None):
+    """ Checks every unique protein and ligand file of the manifest once (concurrently), adding the failed files to the
+    errors of the triples using them. Settings files are checked to exist.
+
+    Return: dictionary of file path to boolean (True if the file failed checks) """
+
+    checks = {}
+    for run in runs:
+        for column in ('cereblon', 'protein'):
+            path = getattr(run['args'], column)
+            if path is not None:
+                checks.setdefault(path, tcm_check_input.protein_invalid_error)
+        if run['args'].ligand is not None:
+            checks.setdefault(run['args'].ligand, tcm_check_input.ligand_invalid_error)
+
+    logger.info(f'Checking {len(checks)} unique input files of {len(runs)} triples')
+    paths = list(checks)
+    results = tcm_check_input.run_checks([(checks[path], path) for path in paths], max_workers = workers or os.cpu_count() or 1)
+
+    failed = {}
+    for path, (check_error, records) in zip(paths, results):
+        tcm_check_input.replay_records(records)
+        failed[path] = check_error is True
+        if failed[path]:
+            logger.critical(f'{path} failed checks. See above for more detail.')
+
+    for run in runs:
+        run['errors'] += [f'{column} failed checks' for column in ('cereblon', 'protein', 'ligand') if failed.get(getattr(run['args'], column))]
+        run['errors'] += [f'{column} not found' for column in ('piper_settings', 'ifd_settings')
+            if getattr(run['args'], column, None) is not None and not os.path.isfile(getattr(run['args'], column))]
+
+    return failed
+
+def stage_order(templates):
+    """ Orders stages so every stage comes after the stages producing its inputs (registration order otherwise) """
+
+    depends_on = tcm_scheduler.dependencies(templates)
+    ordered = []
+    while len(ordered) < len(templates):
+        for stage in templates:
+            if stage['name'] not in ordered and depends_on[stage['name']] <= set(ordered):
+                ordered.append(stage['name'])
+
+    return [stage for name in ordered for stage in templates if stage['name'] == name]
+
+def register_instance(stage, instance, run_context, sources):
+    """ Registers the stage of one triple with the scheduler: the stage is run on the context of the triple, its inputs
+    are read from (and its outputs written to) artifacts prefixed by run or stage instance name """
+
+    def context_of(context):
+        return dict(run_context, artifacts = {artifact: context['artifacts'][source] for artifact, source in sources.items()})
+
+    def prefixed(outputs):
+        return {f'{instance}:{artifact}': value for artifact, value in (outputs or {}).items()}
+
+    if stage['expand'] is None:
+        run, expand = lambda context: prefixed(stage['run'](context_of(context))), None
+    else:
+        run = lambda context, item: prefixed(stage['run'](context_of(context), item))
+        expand = lambda context: stage['expand'](context_of(context))
+
+    tcm_scheduler.register(instance, run, inputs = list(sources.values()), outputs = [f'{instance}:{artifact}' for artifact in stage['outputs']],
+        resources = stage['resources'], expand = expand)
+
+def plan(runs, templates, SCHRODINGER, campaign_dir, args_by_group, artifacts):
+    """ Registers the stages of every valid triple. Stages of different triples with the same inputs (e.g. PIPER of
+    triples sharing cereblon and protein of interest but not ligand) are run once and shared.
+
+    Return: list of names of registered stage instances """
+
+    all_inputs = {artifact for stage in templates for artifact in stage['inputs']}
+    instances = {} # key of stage inputs to instance name
+    registered = []
+
+    for run in runs:
+        run['instances'] = {}
+        if run['errors']:
+            continue
+
+        run_context = {'SCHRODINGER': SCHRODINGER, 'tcm_dir': os.path.join(campaign_dir, f'TernaryComplexModeling_{run["name"]}'),
+            'args': run['args'], 'args_by_group': args_by_group}
+        os.makedirs(run_context['tcm_dir'], exist_ok = True)
+        for artifact, value in vars(run['args']).items():
+            artifacts[f'{run["name"]}:{artifact}'] = value
+
+        # columns that are not inputs of any stage (e.g. retry_hosts) may change every stage, so stages only match with the same ones
+        extras = tuple(sorted((column, repr(value)) for column, value in run['columns'].items() if column not in all_inputs and column != 'name'))
+
+        produced = {}
+        for stage in templates:
+            sources = {artifact: produced.get(artifact, f'{run["name"]}:{artifact}') for artifact in stage['inputs']}
+            key = (stage['name'], extras) + tuple((artifact, produced[artifact] if artifact in produced else repr(getattr(run['args'], artifact, None)))
+                for artifact in stage['inputs'])
+
+            if key not in instances:
+                instances[key] = f'{stage["name"]} {run["name"]}'
+                register_instance(stage, instances[key], run_context, sources)
+                registered.append(instances[key])
+            else:
+                logger.info(f'{stage["name"]} of {run["name"]} is shared with {instances[key]} (same inputs)')
+
+            run['instances'][stage['name']] = instances[key]
+            for artifact in stage['outputs']:
+                produced[artifact] = f'{instances[key]}:{artifact}'
+
+    return registered
+
+def write_summary(summary_path, runs, templates, results, artifacts):
+    """ Writes the campaign summary: one row per triple with its inputs, status, and the status, time, shared stage run and
+    outputs of each stage """
+
+    columns = ['name', 'status', 'cereblon', 'protein', 'ligand', 'errors']
+    for stage in templates:
+        columns += [f'{stage["name"]}_status', f'{stage["name"]}_seconds', f'{stage["name"]}_run'] + stage['outputs']
+
+    with open(summary_path, 'w', newline = '') as f:
+        writer = csv.DictWriter(f, fieldnames = columns)
+        writer.writeheader()
+        for run in runs:
+            row = {'name': run['name'], 'status': run['status'], 'errors': '; '.join(run['errors'])}
+            row.update({column: getattr(run['args'], column) for column in ('cereblon', 'protein', 'ligand')})
+            for stage_name, instance in run['instances'].items():
+                row[f'{stage_name}_status'] = results[instance]['status']
+                row[f'{stage_name}_seconds'] = round(results[instance]['seconds'], 1)
+                row[f'{stage_name}_run'] = instance
+                for stage in templates:
+                    if stage['name'] == stage_name:
+                        row.update({artifact: artifacts.get(f'{instance}:{artifact}') for artifact in stage['outputs']})
+            writer.writerow(row)
+
+def run_campaign(args, args_by_group, parser, SCHRODINGER, master_dir):
+    """ Runs every triple of the manifest as one campaign: checks each unique input file once, then runs the registered
+    stages of every valid triple (shared stages once) under the scheduler limits and writes a campaign summary.
+
+    Input:
+    - args: parsed arguments (see parse_args); given inputs and settings are defaults of every triple
+    - args_by_group: dictionary mapping arguments by group
+    - parser: parser used to parse args (columns are converted to argument types)
+    - SCHRODINGER: path to schrodinger installation
+    - master_dir: directory the campaign directory is made in
+
+    Return: boolean (True if a triple did not complete, False if every triple completed) """
+
+    campaign_dir = campaign_dir_of(args, master_dir)
+    name = os.path.basename(campaign_dir)[len('TCM_campaign_'):]
+    os.makedirs(campaign_dir, exist_ok = True)
+
+    # reading triples
+    try:
+        runs = build_runs(read_manifest(args.manifest), args, parser, os.path.dirname(args.manifest))
+    except (OSError, ValueError, ImportError) as e:
+        logger.critical(f'Could not read manifest {args.manifest}: {e}')
+        return True
+    logger.info(f'Campaign {name}: {len(runs)} triples from {args.manifest}. Results will be found in {campaign_dir}')
+
+    # checking each unique input file once (per-ligand validation tables are written in the campaign directory)
+    tcm_check_input.configure_checks(args, campaign_dir)
+    validate_files(runs, getattr(args, 'diagnostics_workers', None))
+    for run in runs:
+        if run['errors']:
+            logger.critical(f'Triple {run["name"]} will not run: {"; ".join(run["errors"])}')
+
+    # running stages of every valid triple
+    templates = stage_order(list(tcm_scheduler.stages.values()))
+    artifacts = {}
+    try:
+        instances = plan(runs, templates, SCHRODINGER, campaign_dir, args_by_group, artifacts)
+        results = tcm_scheduler.run({'artifacts': artifacts}, instances) if instances else {}
+    finally:
+        # removing the stage instances of the triples, so later runs of this process only see the workflow stages
+        for instance in set(tcm_scheduler.stages) - {stage['name'] for stage in templates}:
+            tcm_scheduler.unregister(instance)
+
+    for run in runs:
+        if run['errors']:
+            run['status'] = 'invalid'
+        else:
+            run['status'] = 'completed' if all(results[instance]['status'] == 'completed' for instance in run['instances'].values()) else 'failed'
+
+    summary_path = os.path.join(campaign_dir, f'TCM_campaign_{name}_summary.csv')
+    write_summary(summary_path, runs, templates, results, artifacts)
+
+    counts = {status: sum(run['status'] == status for run in runs) for status in ('completed', 'failed', 'invalid')}
+    logger.info(f'Campaign {name} finished: {counts["completed"]} of {len(runs)} triples completed, {counts["failed"]} failed, '
+        f'{counts["invalid"]} invalid. Summary: {summary_path}')
+
+    return counts['completed'] < len(runs)
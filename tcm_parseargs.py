@@ -4,10 +4,10 @@ import textwrap
 import argparse
 import sys
 import os
-import subprocess
 
 #Import TCM functionality
 import tcm_check_input
+import tcm_errors
 
 #Import parsers from other components of workflow
 from PIPER import piper_parseargs
@@ -17,9 +17,9 @@ logger = logging.getLogger(__name__)
 
 class ArgumentParser(argparse.ArgumentParser):
     def error(self, message):
+        """Logs error and raises it (instead of exiting) so callers decide how to stop"""
         logger.critical(message)
-        print("An error has occurred. Check log file for information.")
-        subprocess.run(['kill','0'])
+        raise tcm_errors.ArgumentError(message)
 
     """Disables prefix matching in ArgumentParser."""
     def _get_option_tuples(self, option_string):
@@ -35,8 +35,8 @@ def build_parser():
     - object of class argparse.ArgumentParser with defined user inputs
     - dictionary of which dest correspond to which stage of the workflow (e.g. input, PIPER, etc.) """
 
-    # creating object of class ArgumentParser with program name and description
-    parser = argparse.ArgumentParser(
+    # creating object of class ArgumentParser (raising ArgumentError on bad arguments) with program name and description
+    parser = ArgumentParser(
         prog = 'Ternary Complex Modeling Workflow', 
         formatter_class=argparse.RawDescriptionHelpFormatter,
         usage='%(prog)s [options]',
@@ -72,23 +72,66 @@ def build_parser():
     input.add_argument('-l', '--ligand', dest = 'ligand', type = str, required = True, help = 'file of ligand / CELMod; must be .mae, .sdf, .mol2, or .smi')
     input.add_argument('-n', '--name', dest = 'name', type = str, required = True, help = 'naming scheme to identify job by (e.g. by protein of interest like 5HXB-2)')
 
+    # adding specific arguments to change how inputs are checked
+    input.add_argument('--diagnostics_workers', dest = 'diagnostics_workers', type = int, help = 'number of worker processes used to run protein diagnostics on files with multiple structures (default is number of CPUs)')
+    input.add_argument('--ligand_workers', dest = 'ligand_workers', type = int, help = 'number of worker processes used to validate ligand libraries (default is number of CPUs)')
+    input.add_argument('--fail_fast', dest = 'fail_fast', action = 'store_true', help = 'stop protein diagnostics at the first structure with issues')
+    input.add_argument('--structure_backend', dest = 'structure_backend', choices = ['schrodinger', 'numpy'], help = 'reader of protein files for checks without diagnostics and CRBN landmark detection; numpy reads .pdb/.mae/.maegz into numpy arrays (default is schrodinger or TCM_STRUCTURE_BACKEND)')
+
     # adding specific argument into piper group
+    piper.add_argument('--piper_shards', dest = 'shards', type = int, help = 'split PIPER rotations into this many ranges, each run as its own job on its own host, and merge the poses (default 1; overrides shards of piper settings)')
+    piper.add_argument('--piper_shard_hosts', dest = 'shard_hosts', nargs = '+', help = 'HOSTs the PIPER shards are submitted to, in turn (default is HOST of piper settings)')
+    piper.add_argument('--piper_crop_radius', dest = 'crop_radius', type = float, help = 'dock only residues within this distance (A) of the cocrystallized ligand of cereblon (and of constraint residues), mapping poses back onto the full-length proteins (default is no cropping; overrides crop_radius of piper settings)')
+    piper.add_argument('--piper_adaptive', dest = 'adaptive', action = 'store_const', const = True, help = 'dock a coarse subset of the PIPER rotations first and the rest only around the best poses if they converged (see piper_adaptive.py; overrides adaptive of piper settings)')
+    piper.add_argument('--no_piper_store', dest = 'no_piper_store', action = 'store_true', help = 'always run PIPER instead of linking poses of an identical docking (same proteins, chains, constraints and docking settings) of an earlier run from the PIPER result store (see tcm_piper_store.py)')
     piper.add_argument('--piper_settings', dest = 'piper_settings', type = str, required = True, help = 'path to json file containing settings to apply to piper job')
     
     # adding specific argument into IFD group
     ifd.add_argument('--ifd_settings', dest = 'ifd_settings', type = str, required = True, help = 'path to json file containing settings to apply to ifd job')
     
+    # adding specific arguments to retry transient cluster failures (node eviction, license timeout, scratch full)
+    job_control.add_argument('--max_attempts', dest = 'max_attempts', type = int, help = 'largest number of times PIPER and IFD jobs are run when they fail with transient cluster errors (default 3; 1 is no retries)')
+    job_control.add_argument('--retry_backoff', dest = 'retry_backoff', type = float, help = 'seconds waited before the first retry, doubling for every next retry (default 60)')
+    job_control.add_argument('--retry_hosts', dest = 'retry_hosts', nargs = '+', help = 'alternate HOSTs to submit retries to, in order')
+
+    # adding specific arguments to kill stalled jobs (no change to job log or outputs)
+    job_control.add_argument('--stall_window', dest = 'stall_window', type = float, help = 'hours without any change to the job log or output files before a PIPER or IFD job is killed as stalled (default 6; 0 disables the watchdog)')
+    job_control.add_argument('--on_stall', dest = 'on_stall', choices = ['resubmit', 'fail'], help = 'resubmit stalled jobs (counted as retries, see --max_attempts) or fail the run (default resubmit)')
+
+    # adding specific arguments to duplicate straggler shards of sharded stages on other hosts
+    job_control.add_argument('--speculative_slowdown', dest = 'speculative_slowdown', type = float, help = 'duplicate a shard once it runs this many times longer than the median runtime of its completed sibling shards; the first copy to finish is kept (default 2; 0 disables speculative execution)')
+    job_control.add_argument('--speculative_min_runtime', dest = 'speculative_min_runtime', type = float, help = 'minutes a shard must run before it can be duplicated (default 10)')
+    job_control.add_argument('--speculative_hosts', dest = 'speculative_hosts', nargs = '+', help = 'HOSTs duplicates of straggler shards are submitted to, in turn, never the HOST of the straggler (default is the next of the other shard HOSTs of the stage; shards are not duplicated without another HOST)')
+
+    # adding specific arguments to run many triples as one campaign
+    input.add_argument('--manifest', dest = 'manifest', type = str, help = 'csv or yaml file listing many (cereblon, protein, ligand) triples to run as one campaign; other inputs and settings given are defaults of every triple (see tcm_manifest.py)')
+    job_control.add_argument('--max_concurrent_jobs', dest = 'max_concurrent_jobs', type = int, help = 'largest number of PIPER / IFD jobs running on the cluster at once (default 8)')
+
+    # adding specific argument to limit stages running at once
+    job_control.add_argument('--max_parallel_stages', dest = 'max_parallel_stages', type = int, help = 'largest number of independent stages (or stage tasks) running at once (default 4)')
+
+    # adding specific argument to resume a run, skipping stages that already completed with the same inputs and settings
+    job_control.add_argument('--resume', dest = 'resume', action = 'store_true', help = 'resume run in existing job directory, skipping stages (PIPER, IFD) whose inputs and settings are unchanged and whose outputs are intact')
+
+    # adding specific argument to run in the TCM service
+    job_control.add_argument('--service', dest = 'service', action = 'store_true', help = 'submit the run to the TCM service (python tcm_service.py serve; socket at TCM_SERVICE_SOCKET) and print its run id instead of running it here')
+
+    # adding specific argument to only run checks
+    job_control.add_argument('--preflight', dest = 'preflight', action = 'store_true', help = 'run every check (inputs, CRBN landmarks, default settings) and print a timed json report without submitting any job')
+
     # building args by group list to separate Namespace args
     args_by_group['ifd'] = ['ligand', 'ifd_settings']
-    args_by_group['piper'] = ['receptor_prot', 'ligand_prot', 'piper_settings']
+    args_by_group['piper'] = ['receptor_prot', 'ligand_prot', 'piper_settings', 'shards', 'shard_hosts', 'crop_radius', 'adaptive']
     
     return parser, args_by_group
 
-def parse_args(master_dir):
-    """ Builds and parse user's inputs. 
+def parse_known_args(master_dir):
+    """ Builds and parse user's inputs without checking them. 
     
     Returns: 
+    -parser: object of class argparse.ArgumentParser used to parse
     -args: Namespace object containing user parsed args
+    -unknowns: list of unrecognized arguments
     -args_by_group: dictionary grouping arguments by module in workflow """
 
     # building parser with defined user inputs
@@ -102,9 +145,21 @@ def parse_args(master_dir):
     args.cereblon = os.path.join(master_dir, args.cereblon)
     args.protein = os.path.join(master_dir, args.protein)
     args.ligand = os.path.join(master_dir, args.ligand)
+
+    return parser, args, unknowns, args_by_group
+
+def parse_args(master_dir):
+    """ Builds and parse user's inputs. 
+    
+    Returns: 
+    -args: Namespace object containing user parsed args
+    -args_by_group: dictionary grouping arguments by module in workflow """
+
+    # building parser and parsing user inputs
+    parser, args, unknowns, args_by_group = parse_known_args(master_dir)
     
     # making sure that the arguments are valid before proceeding
-    if tcm_check_input.check_args(parser ,sys.argv, args, unknowns) is True:
+    if tcm_check_input.check_args(parser ,sys.argv, args, unknowns, master_dir) is True:
         sys.exit(0) # exits because fatal error found
     
     return args, args_by_group
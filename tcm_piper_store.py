@@ -0,0 +1,177 @@
+#Import Python modules
+import logging
+import shutil
+import json
+import time
+import os
+
+#Import TCM functionality
+import tcm_validation_cache
+import tcm_checkpoint
+import tcm_maegz_index
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# Store of PIPER results shared between runs. Poses of PIPER only depend on the two proteins, their chains, the compiled
+# constraints and the docking settings, so runs docking the same CRBN-POI pair (e.g. a sweep of ligands) link the stored
+# poses instead of running PIPER again. Every entry is a directory named by the key of the docking (see key) holding the
+# -out.maegz, its index (and blocked copy) and a description of the docking.
+
+# settings of the PIPER result store (see configure); TCM_PIPER_STORE=0 disables the store
+settings = {
+    'enabled': os.getenv('TCM_PIPER_STORE', '1') not in ('0', 'no', 'false'),
+    'store_dir': os.getenv('TCM_PIPER_STORE_DIR', os.path.join(tcm_validation_cache.cache_root, 'piper_results')),
+    'max_mb': float(os.getenv('TCM_PIPER_STORE_MB', 4096)) # least recently used entries are evicted past this size
+}
+
+# names of files in every entry
+OUTPUT_NAME = 'piper-out.maegz'
+ENTRY_NAME = 'entry.json'
+
+#Version of the store entries (keys of other versions never match)
+store_version = 1
+
+def configure(**kwargs):
+    """ Changes PIPER result store settings for the rest of the run (arguments left as None are unchanged) """
+
+    for key, value in kwargs.items():
+        if key not in settings:
+            raise KeyError(f'Unknown PIPER result store setting {key}')
+        if value is not None:
+            settings[key] = value
+
+def enabled():
+    """ True if PIPER results are looked up in and added to the store """
+
+    return settings['enabled']
+
+def key(input_files, docking_settings):
+    """ Key of a docking in the store: hash of the content of its protein files, its docking settings (chains, constraints,
+    poses, rotations, etc.) and the Schrodinger release (see tcm_checkpoint.fingerprint)
+
+    Input:
+    - input_files: dictionary of input name to file path (see PIPER.docking_inputs)
+    - docking_settings: dictionary of settings deciding the poses (see PIPER.docking_inputs)
+
+    Return: key (str) """
+
+    return tcm_checkpoint.fingerprint(input_files, dict(docking_settings, store_version = store_version))
+
+def entry_dir(store_key):
+    """ Directory of the store entry of a docking """
+
+    return os.path.join(settings['store_dir'], store_key)
+
+def lookup(store_key):
+    """ Looks up the poses of a docking in the store, checking the stored output is intact. Marks the entry as recently used.
+
+    Return: path to stored -out.maegz or None if the docking is not stored """
+
+    if not enabled():
+        return None
+
+    stored_path = os.path.join(entry_dir(store_key), OUTPUT_NAME)
+    try:
+        with open(os.path.join(entry_dir(store_key), ENTRY_NAME), 'r') as f:
+            entry = json.load(f)
+        if os.path.getsize(stored_path) != entry['size'] or tcm_validation_cache.file_hash(stored_path) != entry['sha256']:
+            logger.warning(f'Stored PIPER output {stored_path} changed since it was stored; ignoring store entry')
+            return None
+        os.utime(entry_dir(store_key)) # refreshing the last use time for LRU eviction
+
+    except (OSError, ValueError, KeyError): # no entry, or entry missing or corrupt
+        return None
+
+    logger.info(f'PIPER result store hit: poses of {entry.get("receptor")} and {entry.get("ligand")} stored {entry.get("stored")}')
+    return stored_path
+
+def link(stored_path, out_path):
+    """ Links stored poses (and their index and blocked copy) to out_path (hard link, or copy if the store is on another
+    file system). Indexing never modifies the stored file, as it only writes sidecar files. """
+
+    for source, destination in zip([stored_path] + tcm_maegz_index.sidecar_paths(stored_path), [out_path] + tcm_maegz_index.sidecar_paths(out_path)):
+        if not os.path.isfile(source): # e.g. index could not be built when stored
+            continue
+        if os.path.lexists(destination):
+            os.remove(destination)
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copy2(source, destination)
+
+def store(store_key, out_path, description = None):
+    """ Adds the poses of a completed docking (and their index and blocked copy) to the store, then evicts least recently
+    used entries if the store grows past its size limit. Existing entries are kept.
+
+    Input:
+    - store_key: key of the docking (see key)
+    - out_path: -out.maegz written by PIPER
+    - description: dictionary describing the docking (e.g. receptor and ligand paths), saved in the entry """
+
+    if not enabled() or os.path.isdir(entry_dir(store_key)):
+        return
+
+    # writing the entry to a temporary directory then renaming it, so concurrent runs never read partial entries
+    tmp_dir = f'{entry_dir(store_key)}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(tmp_dir, exist_ok = True)
+        stored_path = os.path.join(tmp_dir, OUTPUT_NAME)
+        shutil.copy2(out_path, stored_path)
+        for source, destination in zip(tcm_maegz_index.sidecar_paths(out_path), tcm_maegz_index.sidecar_paths(stored_path)):
+            if os.path.isfile(source): # index and blocked copy, if written
+                shutil.copy2(source, destination)
+
+        entry = dict(description or {}, stored = time.strftime('%Y-%m-%d %H:%M:%S'), size = os.path.getsize(stored_path),
+            sha256 = tcm_validation_cache.file_hash(stored_path))
+        with open(os.path.join(tmp_dir, ENTRY_NAME), 'w') as f:
+            json.dump(entry, f, indent = 2)
+
+        try:
+            os.rename(tmp_dir, entry_dir(store_key))
+        except OSError: # stored by another run in the meantime
+            shutil.rmtree(tmp_dir, ignore_errors = True)
+            return
+
+        logger.info(f'Stored PIPER poses of {out_path} in the PIPER result store ({entry_dir(store_key)})')
+        evict()
+
+    except OSError as e: # store is an optimization, so failing to write it never fails the run
+        shutil.rmtree(tmp_dir, ignore_errors = True)
+        logger.warning(f'Could not store PIPER poses of {out_path}: {e}')
+
+def evict(max_mb = None):
+    """ Removes least recently used entries until the store is within max_mb (default from settings) """
+
+    max_bytes = (settings['max_mb'] if max_mb is None else max_mb) * 1024 * 1024
+    if not os.path.isdir(settings['store_dir']):
+        return
+
+    # collecting (last use time, size, path) of every entry
+    entries = []
+    for name in os.listdir(settings['store_dir']):
+        path = os.path.join(settings['store_dir'], name)
+        if name.endswith('.tmp') or not os.path.isdir(path):
+            continue
+        try:
+            size = sum(os.path.getsize(os.path.join(path, file_name)) for file_name in os.listdir(path))
+            entries.append((os.stat(path).st_mtime, size, path))
+        except FileNotFoundError: # removed by another run
+            continue
+
+    total = sum(entry[1] for entry in entries)
+
+    # removing oldest entries first
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors = True)
+        total -= size
+        logger.debug(f'Evicted PIPER result store entry {path}')
+
+def clear():
+    """ Removes every entry of the PIPER result store """
+
+    if os.path.isdir(settings['store_dir']):
+        for name in os.listdir(settings['store_dir']):
+            shutil.rmtree(os.path.join(settings['store_dir'], name), ignore_errors = True)
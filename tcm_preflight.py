@@ -0,0 +1,101 @@
+#Import Python modules
+import logging
+import json
+import sys
+import time
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+class MessageCollector(logging.Handler):
+    """ Logging handler that keeps the messages logged during a single check (warnings and above) for the report """
+
+    def __init__(self):
+        super().__init__(level = logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(f'{record.levelname}: {record.getMessage()}')
+
+def is_error(result):
+    """ Default way of reading check results; checks return True when an error is found """
+
+    return result is True
+
+class Preflight:
+    """ Runs the checks of an entry point one after another without submitting any job, timing each check and
+    collecting the messages it logs into a machine-readable report. """
+
+    def __init__(self, entry_point):
+        self.entry_point = entry_point
+        self.checks = []
+        self.start = time.perf_counter()
+
+    def run(self, name, check, *args, failed = is_error, **kwargs):
+        """ Runs and times a single check. Exceptions (including sys.exit) are recorded as errors instead of stopping the preflight.
+
+        Input:
+        - name: name of the check in the report
+        - check: function to call with args and kwargs
+        - failed: function given the result of check that returns True if the check failed (default is result is True)
+
+        Return: result of check (None if check raised) """
+
+        collector = MessageCollector()
+        logging.getLogger().addHandler(collector)
+        entry = {'check': name, 'status': 'pass', 'seconds': 0.0, 'messages': collector.messages}
+
+        start = time.perf_counter()
+        result = None
+        try:
+            result = check(*args, **kwargs)
+            if failed(result):
+                entry['status'] = 'fail'
+        except SystemExit as e: # checks of the entry points exit on fatal errors
+            entry['status'] = 'fail'
+            entry['messages'].append(f'exited with status {e.code}')
+        except Exception as e:
+            entry['status'] = 'error'
+            entry['messages'].append(f'{type(e).__name__}: {e}')
+        finally:
+            entry['seconds'] = round(time.perf_counter() - start, 4)
+            logging.getLogger().removeHandler(collector)
+
+        self.checks.append(entry)
+        return result
+
+    def skip(self, name, reason):
+        """ Records a check that does not apply to this run """
+
+        self.checks.append({'check': name, 'status': 'skipped', 'seconds': 0.0, 'messages': [reason]})
+
+    @property
+    def ok(self):
+        """ True if no check failed or raised """
+
+        return all(entry['status'] in ('pass', 'skipped') for entry in self.checks)
+
+    def report(self):
+        """ Returns the preflight report as a dictionary """
+
+        return {
+            'entry_point': self.entry_point,
+            'ok': self.ok,
+            'total_seconds': round(time.perf_counter() - self.start, 4),
+            'checks': self.checks
+        }
+
+    def print_report(self, stream = None):
+        """ Prints the preflight report as json (stdout by default) """
+
+        print(json.dumps(self.report(), indent = 2), file = stream or sys.stdout)
+
+def landmarks_missing(results, landmarks = ('lig_id', 'H378_o', 'H378_h', 'W380_h')):
+    """ Reads the results of IFD_find_info.parse_structure; the check fails if any CRBN landmark was not found """
+
+    missing = [landmark for landmark in landmarks if landmark not in results]
+    if missing:
+        logger.critical(f'Landmarks not found in structure: {missing}')
+        return True
+
+    return False
@@ -0,0 +1,130 @@
+#Import Python modules
+import logging
+import gzip
+import os
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# file extensions and the record format they are split by
+RECORD_FORMATS = {'sdf': 'sd', 'sd': 'sd', 'mol2': 'mol2', 'smi': 'smiles', 'mae': 'maestro', 'maegz': 'maestro', 'gz': 'maestro'}
+
+def get_record_format(file_path):
+    """ Given a structure file path, returns the record format of the file based on file extension (sd, mol2, smiles or maestro)
+    or None if the file type is not supported """
+
+    file_type = file_path.split('/')[-1].split('.')[-1].lower() # file type is the last thing in split list
+    return RECORD_FORMATS.get(file_type)
+
+def open_text(file_path):
+    """ Opens structure file for reading as text, decompressing gzipped files (e.g. .maegz) """
+
+    with open(file_path, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b' # gzip magic number
+
+    if compressed:
+        return gzip.open(file_path, 'rt')
+    return open(file_path, 'r')
+
+def split_sd(lines):
+    """ Splits lines of .sdf file into records (each record ends with $$$$).
+
+    Yields: tuple of (title, record text) """
+
+    record = []
+    for line in lines:
+        record.append(line)
+        if line.startswith('$$$$'):
+            yield record[0].strip(), ''.join(record)
+            record = []
+
+    # last record without $$$$ terminator
+    if any(line.strip() for line in record):
+        yield record[0].strip(), ''.join(record)
+
+def split_mol2(lines):
+    """ Splits lines of .mol2 file into records (each record starts with @<TRIPOS>MOLECULE).
+
+    Yields: tuple of (title, record text) """
+
+    record = []
+    for line in lines:
+        if line.startswith('@<TRIPOS>MOLECULE') and record:
+            yield mol2_title(record), ''.join(record)
+            record = []
+        if record or line.startswith('@<TRIPOS>MOLECULE'):
+            record.append(line)
+
+    if record:
+        yield mol2_title(record), ''.join(record)
+
+def mol2_title(record):
+    """ Title of a mol2 record is the line after @<TRIPOS>MOLECULE """
+
+    return record[1].strip() if len(record) > 1 else ''
+
+def split_smiles(lines):
+    """ Splits lines of .smi file into records (one SMILES per line, optionally followed by a title).
+
+    Yields: tuple of (title, SMILES) """
+
+    for line in lines:
+        fields = line.split(None, 1)
+        if not fields or fields[0].startswith('#'): # skipping blank and comment lines
+            continue
+        yield (fields[1].strip() if len(fields) > 1 else ''), fields[0]
+
+def maestro_blocks(lines):
+    """ Splits lines of .mae file into the file header and the ct blocks. Each structure (ct block) starts with an unindented
+    line beginning with f_m_ct. Partial ct blocks (p_m_ct), which only hold the changes from the structure before them,
+    can't be split into records of their own and are rejected.
+
+    Yields: tuple of (header text, ct block text) for every ct block
+
+    Raises: ValueError if the file has partial ct blocks """
+
+    header = []
+    record = None
+    for line in lines:
+        if line.startswith('f_m_ct'): # new top-level structure block
+            if record is not None:
+                yield ''.join(header), ''.join(record)
+            record = [line]
+        elif line.startswith('p_m_ct'): # partial structure block
+            raise ValueError('Maestro files with partial ct blocks (p_m_ct) are not supported; write every structure as a full ct block (f_m_ct)')
+        elif record is None: # still in the header
+            header.append(line)
+        else:
+            record.append(line)
+
+    if record is not None:
+        yield ''.join(header), ''.join(record)
+
+def split_maestro(lines):
+    """ Splits lines of .mae file into records. The file header (before the first ct block) is added to every record so each
+    record is a valid .mae text on its own.
+
+    Yields: tuple of (title, record text); titles are left empty as they are properties of the ct block """
+
+    for header, record in maestro_blocks(lines):
+        yield '', header + record
+
+# splitting function for each record format
+SPLITTERS = {'sd': split_sd, 'mol2': split_mol2, 'smiles': split_smiles, 'maestro': split_maestro}
+
+def stream_records(file_path):
+    """ Streams the records of a structure file as text without parsing the structures, so a single malformed record
+    can be reported without stopping the reading of the rest of the file.
+
+    Input:
+    - file_path: path to .sdf, .mol2, .smi, .mae or .maegz file
+
+    Yields: tuple of (record index starting at 1, record format, title, record text) """
+
+    record_format = get_record_format(file_path)
+    if record_format is None:
+        raise ValueError(f'Unsupported file type for {os.path.basename(file_path)}')
+
+    with open_text(file_path) as lines:
+        for index, (title, text) in enumerate(SPLITTERS[record_format](lines), start = 1):
+            yield index, record_format, title, text
@@ -0,0 +1,179 @@
+#Import Python modules
+import logging
+import argparse
+import asyncio
+import collections
+import random
+import re
+
+#Import TCM functionality
+import tcm_job_control
+import tcm_watchdog
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# exit codes of transient failures (killed by node eviction / preemption / out of memory, or temporary failure) and of
+# deterministic failures (bad usage, command not found, bad input data) that fail the same way on every attempt
+TRANSIENT_EXIT_CODES = {75, 137, 143, -9, -15}
+DETERMINISTIC_EXIT_CODES = {2, 64, 65, 66, 126, 127}
+
+# messages in job output / logs of deterministic failures (input or usage errors), checked before the transient messages.
+# Messages also printed by cluster failures (e.g. "Host not found", "invalid license") are left out.
+DETERMINISTIC_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    r'Traceback \(most recent call last\)', r'unrecognized argument', r'usage:', r'No such file or directory',
+    r'invalid (argument|option|choice|value|input|structure|chain|residue|constraint)', r'could not (read|parse|open)',
+    r'\b(file|command|module|structure|chain|residue)s? not found', r'No module named'
+]]
+
+# messages in job output / logs of transient cluster failures (failure messages only, as routine lines such as
+# "Checked out license" or "Job timeout set to 0" are printed by every job)
+TRANSIENT_PATTERNS = [re.compile(pattern, re.IGNORECASE | re.MULTILINE) for pattern in [
+    r'licen[cs]e (checkout )?(failed|denied|unavailable)', r'FLEXlm error', r'lmgrd is not running', # license checkout failures
+    r'No space left on device', r'Disk quota exceeded', # scratch full
+    r'\b(node|host)\b.*\b(evicted|lost|failed|down|unreachable)\b', r'\bpreempted\b', # node eviction
+    r'Connection (refused|reset|timed out)', r'\btimed out\b', r'Resource temporarily unavailable', # network / scheduler hiccups
+    r'Cannot allocate memory', r'^\s*Killed\s*$'
+]]
+
+# number of lines read from the end of the stage log file to classify a failure
+LOG_TAIL_LINES = 200
+
+# number of last log lines searched for failure messages (the error that ended the job is printed last)
+MESSAGE_TAIL_LINES = 20
+
+# retry policy of each cluster stage (see configure)
+policies = {
+    'PIPER': {'max_attempts': 3, 'backoff': 60.0, 'backoff_factor': 2.0, 'max_backoff': 1800.0, 'hosts': []},
+    'IFD': {'max_attempts': 3, 'backoff': 60.0, 'backoff_factor': 2.0, 'max_backoff': 1800.0, 'hosts': []}
+}
+
+def configure(stage = None, **kwargs):
+    """ Changes the retry policy of a stage (of every stage if stage is None) for the rest of the run (arguments left as
+    None are unchanged).
+
+    Input:
+    - stage: name of stage (PIPER or IFD) or None
+    - max_attempts: largest number of times the stage is run (1 is no retries)
+    - backoff: seconds waited before the first retry
+    - backoff_factor: growth of the wait before every next retry
+    - max_backoff: longest wait before a retry in seconds
+    - hosts: alternate HOSTs to submit retries to, in order (the first attempt uses the HOST of the stage settings) """
+
+    for policy_stage, policy in policies.items():
+        if stage is not None and policy_stage != stage:
+            continue
+        for key, value in kwargs.items():
+            if key not in policy:
+                raise KeyError(f'Unknown retry setting {key}')
+            if value is not None:
+                policy[key] = value
+
+def read_log_tail(log_path, lines = LOG_TAIL_LINES):
+    """ Reads the last lines of a job log file (empty list if the file does not exist) """
+
+    try:
+        with open(log_path, 'r', errors = 'replace') as f:
+            return list(collections.deque(f, maxlen = lines))
+    except OSError:
+        return []
+
+def classify(job, log_lines = ()):
+    """ Classifies a failed job as transient (worth retrying) or deterministic (fails the same way again), from its exit code,
+    job control status and the messages in its output and log. Failures that can't be classified are deterministic
+    so no cluster hours are spent on jobs that will fail again.
+
+    Input:
+    - job: job dictionary (see tcm_job_control.new_job)
+    - log_lines: lines of the job log file
+
+    Return: tuple of (transient or deterministic, reason) """
+
+    exit_code = job['exit_code'] if job['exit_code'] is not None else job['launch_returncode']
+
+    # job killed by the stall watchdog is resubmitted or failed depending on the watchdog settings
+    if job['status'] == 'stalled':
+        return 'transient' if tcm_watchdog.settings['on_stall'] == 'resubmit' else 'deterministic', 'job stalled (killed by watchdog)'
+    # stalled job the watchdog could not kill may still be running, so it is never resubmitted into the same directory
+    if job['status'] == 'kill_failed':
+        return 'deterministic', 'job stalled and could not be killed by watchdog'
+
+    if exit_code in DETERMINISTIC_EXIT_CODES:
+        return 'deterministic', f'exit code {exit_code}'
+    if exit_code in TRANSIENT_EXIT_CODES:
+        return 'transient', f'exit code {exit_code}'
+
+    # looking for known messages in the last lines of output and log (deterministic messages are checked first, so a
+    # real error is never retried because of a transient-looking line printed along with it)
+    text = '\n'.join(list(job['output_tail'])[-MESSAGE_TAIL_LINES:] + list(log_lines)[-MESSAGE_TAIL_LINES:])
+    for kind, patterns in (('deterministic', DETERMINISTIC_PATTERNS), ('transient', TRANSIENT_PATTERNS)):
+        for pattern in patterns:
+            match = pattern.search(text)
+            if match:
+                return kind, f'"{match.group(0).strip()}" in job output'
+
+    # jobs that died or were killed without a transient exit code or message are deterministic too, as a crashing job
+    # dies the same way on every attempt
+    return 'deterministic', f'unrecognized failure (status {job["exit_status"] or job["status"]}, exit code {exit_code})'
+
+def backoff_delay(policy, retry):
+    """ Seconds to wait before the retry-th retry (starting at 1): exponential backoff with up to 10% random jitter so
+    retries of many runs don't hit the cluster at once """
+
+    delay = min(policy['backoff'] * policy['backoff_factor'] ** (retry - 1), policy['max_backoff'])
+    return delay * (1 + 0.1 * random.random())
+
+def host_for_attempt(policy, attempt):
+    """ HOST to submit the attempt-th attempt (starting at 1) to: None (HOST of the stage settings) for the first attempt,
+    then the alternate hosts in order (the last one is kept for later attempts) """
+
+    if attempt == 1 or not policy['hosts']:
+        return None
+    return policy['hosts'][min(attempt - 2, len(policy['hosts']) - 1)]
+
+def with_host(stage_args, host):
+    """ Copy of stage arguments submitting to host (arguments are copied as stages delete arguments they used) """
+
+    stage_args = argparse.Namespace(**vars(stage_args))
+    if host is not None:
+        stage_args.HOST = host
+
+    return stage_args
+
+async def run_with_retries(stage, launch, log_path = None, log = None):
+    """ Runs a cluster stage under its retry policy: transient failures are retried after an exponential backoff (on the
+    alternate hosts of the policy if any) while deterministic failures stop at once.
+
+    Input:
+    - stage: name of stage (key of policies)
+    - launch: function given the HOST of the attempt (None for HOST of stage settings) returning a coroutine that runs the
+    stage and returns a job dictionary (e.g. lambda host: PIPER.submit_piper(piper_dir, SCHRODINGER, with_host(args, host)))
+    - log_path: path to the log file written by the job (used to classify failures)
+    - log: logger (default is logger of this module)
+
+    Return: job dictionary of the last attempt (with 'attempts' and 'failure' (None, or (classification, reason)) added) """
+
+    log = logger if log is None else log
+    policy = policies[stage]
+
+    for attempt in range(1, policy['max_attempts'] + 1):
+        host = host_for_attempt(policy, attempt)
+        if attempt > 1:
+            delay = backoff_delay(policy, attempt - 1)
+            log.warning(f'Retrying {stage} in {delay:.0f} s (attempt {attempt} of {policy["max_attempts"]}' + (f' on {host})' if host else ')'))
+            await asyncio.sleep(delay)
+
+        job = await launch(host)
+        job['attempts'] = attempt
+        job['failure'] = None
+        if tcm_job_control.succeeded(job):
+            return job
+
+        job['failure'] = classify(job, read_log_tail(log_path) if log_path else [])
+        log.warning(f'{stage} attempt {attempt} failed ({job["failure"][0]}: {job["failure"][1]})')
+        if job['failure'][0] == 'deterministic':
+            log.critical(f'{stage} failed with a deterministic error; not retrying')
+            return job
+
+    log.critical(f'{stage} failed after {policy["max_attempts"]} attempts')
+    return job
@@ -0,0 +1,225 @@
+#Import Python modules
+import logging
+import concurrent.futures
+import time
+import os
+
+#Import TCM functionality
+import tcm_errors
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# Stages of the workflow form a DAG: every stage declares the artifacts (arguments, files, directories) it needs and
+# produces, and runs once every stage producing its inputs has completed. Stages register themselves, e.g.:
+#   tcm_scheduler.register('MDFit', run_mdfit, inputs = ['ifd_dir'], outputs = ['mdfit_dir'], resources = {'cluster_jobs': 1})
+# and tcm_scheduler.run(context) runs every registered stage, independent branches concurrently.
+
+# registered stages in registration order (see register)
+stages = {}
+
+# global limits of the scheduler (see configure): number of tasks running at once and amount of each resource used at once
+settings = {
+    'max_parallel': 4,
+    'limits': {'cluster_jobs': 8, 'cpus': os.cpu_count() or 1}
+}
+
+def configure(max_parallel = None, **limits):
+    """ Changes scheduler limits for the rest of the run (arguments left as None are unchanged)
+
+    Input:
+    - max_parallel: largest number of stage tasks running at once
+    - limits: largest amount of a resource used at once by running tasks (e.g. cluster_jobs = 8) """
+
+    if max_parallel is not None:
+        settings['max_parallel'] = max_parallel
+    for resource, limit in limits.items():
+        if limit is not None:
+            settings['limits'][resource] = limit
+
+def register(name, run, inputs = (), outputs = (), resources = None, expand = None):
+    """ Registers a stage of the workflow.
+
+    Input:
+    - name: name of stage (e.g. PIPER)
+    - run: function given the run context (and an item if expand is given) returning a dictionary of output artifacts
+    - inputs: names of artifacts needed by the stage (outputs of other stages, or run inputs seeded in the context)
+    - outputs: names of artifacts produced by the stage
+    - resources: dictionary of resource to amount used by every task of the stage (e.g. {'cluster_jobs': 1})
+    - expand: function given the run context returning the items the stage is run on (one concurrent task per item, e.g.
+    one IFD per ligand); the outputs of expanded stages are lists with the output of every item in order """
+
+    stages[name] = {'name': name, 'run': run, 'inputs': list(inputs), 'outputs': list(outputs), 'resources': dict(resources or {}), 'expand': expand}
+
+def unregister(name):
+    """ Removes a registered stage (e.g. stage instances of a campaign once it finished) """
+
+    stages.pop(name, None)
+
+def dependencies(stage_list):
+    """ Finds the stages each stage depends on (stages producing its inputs).
+
+    Return: dictionary of stage name to set of stage names
+
+    Raises: ValueError if an artifact is produced by more than one stage or the stages form a cycle """
+
+    producers = {}
+    for stage in stage_list:
+        for artifact in stage['outputs']:
+            if artifact in producers:
+                raise ValueError(f'{artifact} is produced by both {producers[artifact]} and {stage["name"]}')
+            producers[artifact] = stage['name']
+
+    depends_on = {stage['name']: {producers[artifact] for artifact in stage['inputs'] if artifact in producers} for stage in stage_list}
+
+    # checking for cycles (repeatedly removing stages without remaining dependencies)
+    remaining = {name: set(deps) for name, deps in depends_on.items()}
+    while remaining:
+        free = [name for name, deps in remaining.items() if not deps]
+        if not free:
+            raise ValueError(f'Stages {", ".join(sorted(remaining))} depend on each other')
+        for name in free:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(free)
+
+    return depends_on
+
+def fits(resources, in_use, running):
+    """ Checks whether a task using resources can start (a task needing more than a limit still starts when nothing runs) """
+
+    if running == 0:
+        return True
+    if running >= settings['max_parallel']:
+        return False
+
+    return all(in_use.get(resource, 0) + amount <= settings['limits'].get(resource, float('inf')) for resource, amount in resources.items())
+
+def run_task(stage, context, item):
+    """ Runs one task of a stage, catching failures (including sys.exit of stages) so other branches keep running.
+
+    Return: tuple of (outputs dictionary or None if the task failed, seconds spent) """
+
+    start = time.time()
+    try:
+        outputs = stage['run'](context, item) if stage['expand'] is not None else stage['run'](context)
+    except SystemExit as e:
+        logger.critical(f'{stage["name"]} stopped (exit status {e.code})')
+        return None, time.time() - start
+    except tcm_errors.TCMError as e: # expected failures (already logged by the stage)
+        logger.critical(f'{stage["name"]} failed: {e}')
+        return None, time.time() - start
+    except Exception:
+        logger.exception(f'{stage["name"]} failed')
+        return None, time.time() - start
+
+    return outputs or {}, time.time() - start
+
+def run(context, stage_names = None, log = None):
+    """ Runs the registered stages as a DAG: a stage starts once the stages producing its inputs completed, and ready
+    tasks run concurrently within the limits of the scheduler. Stages depending on a failed stage are skipped while
+    independent branches keep running.
+
+    Input:
+    - context: dictionary given to every stage; its 'artifacts' dictionary holds the run inputs and receives the outputs of
+    every completed stage
+    - stage_names: names of stages to run (default is every registered stage)
+    - log: logger (default is logger of this module)
+
+    Return: dictionary of stage name to dictionary with status (completed, failed or skipped), seconds spent and outputs
+
+    Raises: ValueError if the stages form a cycle, or an input is neither produced by a stage nor in the context artifacts """
+
+    log = logger if log is None else log
+    stage_list = [stages[name] for name in (stage_names if stage_names is not None else stages)]
+    depends_on = dependencies(stage_list)
+    artifacts = context.setdefault('artifacts', {})
+
+    # checking every input is available before running anything
+    produced = {artifact for stage in stage_list for artifact in stage['outputs']}
+    for stage in stage_list:
+        missing = [artifact for artifact in stage['inputs'] if artifact not in produced and artifact not in artifacts]
+        if missing:
+            raise ValueError(f'{stage["name"]} needs {", ".join(missing)}, which no stage produces')
+
+    results = {stage['name']: {'status': 'waiting', 'seconds': 0.0, 'outputs': {}} for stage in stage_list}
+    tasks = {} # stage name to list of task outputs (None until done)
+    ready = [] # (stage, item index, item) waiting for resources
+    running = {} # future to (stage, item index)
+    in_use = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers = settings['max_parallel']) as executor:
+        while True:
+            # starting stages whose dependencies completed, skipping stages whose dependencies failed (until no stage changes,
+            # as skipping a stage can skip stages depending on it)
+            changed = True
+            while changed:
+                changed = False
+                for stage in stage_list:
+                    result = results[stage['name']]
+                    if result['status'] != 'waiting':
+                        continue
+                    statuses = {results[dependency]['status'] for dependency in depends_on[stage['name']]}
+                    if statuses & {'failed', 'skipped'}:
+                        result['status'] = 'skipped'
+                        changed = True
+                        log.warning(f'Skipping {stage["name"]}: a stage it depends on did not complete')
+                    elif statuses <= {'completed'}:
+                        items = list(stage['expand'](context)) if stage['expand'] is not None else [None]
+                        result['status'] = 'running'
+                        changed = True
+                        tasks[stage['name']] = [None] * len(items)
+                        ready.extend((stage, index, item) for index, item in enumerate(items))
+                        log.info(f'Starting {stage["name"]}' + (f' ({len(items)} tasks)' if stage['expand'] is not None else ''))
+                        if not items:
+                            result['status'] = 'completed'
+                            result['outputs'] = {artifact: [] for artifact in stage['outputs']}
+                            artifacts.update(result['outputs'])
+
+            # launching ready tasks in registration order while within limits
+            for task in list(ready):
+                stage, index, item = task
+                if not fits(stage['resources'], in_use, len(running)):
+                    continue
+                ready.remove(task)
+                for resource, amount in stage['resources'].items():
+                    in_use[resource] = in_use.get(resource, 0) + amount
+                running[executor.submit(run_task, stage, context, item)] = (stage, index)
+
+            if not running:
+                break
+
+            # waiting for a task to finish
+            done, _ = concurrent.futures.wait(list(running), return_when = concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                stage, index = running.pop(future)
+                for resource, amount in stage['resources'].items():
+                    in_use[resource] -= amount
+
+                outputs, seconds = future.result()
+                result = results[stage['name']]
+                result['seconds'] += seconds
+                tasks[stage['name']][index] = outputs if outputs is not None else False
+
+                # stage fails with its first failed task (other tasks of the stage still finish)
+                if outputs is None and result['status'] == 'running':
+                    result['status'] = 'failed'
+                    log.critical(f'{stage["name"]} failed')
+                if any(task is None for task in tasks[stage['name']]) or result['status'] != 'running':
+                    continue
+
+                # every task of the stage completed
+                if stage['expand'] is not None:
+                    result['outputs'] = {artifact: [task.get(artifact) for task in tasks[stage['name']]] for artifact in stage['outputs']}
+                else:
+                    result['outputs'] = {artifact: tasks[stage['name']][0].get(artifact) for artifact in stage['outputs']}
+                artifacts.update(result['outputs'])
+                result['status'] = 'completed'
+                log.info(f'Completed {stage["name"]} in {result["seconds"]:.0f} s')
+
+    return results
+
+def failed(results):
+    """ True if any stage failed or was skipped """
+
+    return any(result['status'] != 'completed' for result in results.values())
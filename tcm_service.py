@@ -0,0 +1,295 @@
+#Import Python modules
+import logging
+import argparse
+import collections
+import socketserver
+import threading
+import socket
+import queue
+import json
+import time
+import sys
+import os
+
+#Import TCM functionality
+import tcm_errors
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# Optional long-running local service that runs TCM jobs with modules already imported and structure / validation caches
+# kept in memory, e.g.:
+#   python tcm_service.py serve &                      (starts the service)
+#   python TCM.py -c crbn.mae -p poi.mae ... --service  (submits the run and prints its run id)
+#   python tcm_service.py status <run id>               (prints status and result of the run)
+# Requests and responses are single lines of json over a Unix socket (only the user running the service can connect).
+
+#Get path of the service socket (can be moved with the TCM_SERVICE_SOCKET environmental variable)
+SOCKET_PATH = os.getenv('TCM_SERVICE_SOCKET', os.path.join(os.getenv('TCM_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.tcm_cache')), 'tcm_service.sock'))
+
+# number of finished runs whose status and result are kept (oldest are dropped first)
+MAX_FINISHED_RUNS = 1000
+
+# modules imported when the service starts so runs don't pay for them (Schrodinger modules are skipped if not installed)
+WARM_MODULES = ['TCM', 'PIPER.PIPER', 'InducedFitDocking.IFD', 'schrodinger.structure', 'schrodinger.structutils.analyze',
+    'schrodinger.protein.analysis']
+
+# state of the service (runs by id and queue of run ids waiting for the worker)
+runs = collections.OrderedDict()
+runs_lock = threading.Lock()
+pending = queue.Queue()
+
+def warm_up():
+    """ Imports the modules used by runs
+
+    Return: list of modules that could not be imported """
+
+    import importlib
+
+    missing = []
+    for module in WARM_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logger.warning(f'Could not import {module} ({e}); runs needing it will import it')
+            missing.append(module)
+
+    return missing
+
+def new_run(config, master_dir):
+    """ Builds the dictionary tracking a submitted run
+
+    Return: run dictionary """
+
+    return {
+        'run_id': f'tcm-{time.strftime("%Y%m%d-%H%M%S")}-{len(runs) + 1}-{os.urandom(3).hex()}',
+        'status': 'queued', # queued, running, completed, failed (a stage failed) or error (bad configuration or inputs)
+        'config': config,
+        'master_dir': master_dir,
+        'submitted': time.time(),
+        'started': None,
+        'finished': None,
+        'result': None, # RunResult of the run as dictionary
+        'error': None # error message of runs that raised
+    }
+
+def result_dict(result):
+    """ Json serializable dictionary of a RunResult """
+
+    return json.loads(json.dumps(result._asdict(), default = str))
+
+def drop_old_runs():
+    """ Drops the oldest finished runs over MAX_FINISHED_RUNS """
+
+    finished = [run_id for run_id, run in runs.items() if run['finished'] is not None]
+    for run_id in finished[:max(0, len(finished) - MAX_FINISHED_RUNS)]:
+        del runs[run_id]
+
+def worker():
+    """ Runs submitted runs one after another (runs change module settings, so they can't run concurrently in one process) """
+
+    import TCM
+
+    while True:
+        run_id = pending.get()
+        if run_id is None: # service stopping
+            return
+
+        with runs_lock:
+            run = runs[run_id]
+            run['status'], run['started'] = 'running', time.time()
+
+        try:
+            result = TCM.run_tcm(run['config'], master_dir = run['master_dir'])
+            status, outcome, error = result.status, result_dict(result), None
+        except tcm_errors.TCMError as e:
+            status, outcome, error = 'error', None, str(e)
+        except Exception as e: # unexpected errors never stop the service
+            logger.exception(f'Run {run_id} failed')
+            status, outcome, error = 'error', None, f'{type(e).__name__}: {e}'
+
+        with runs_lock:
+            run.update(status = status, result = outcome, error = error, finished = time.time())
+            drop_old_runs()
+        logger.info(f'Run {run_id} {status}' + (f': {error}' if error else ''))
+
+def handle_request(request, server):
+    """ Answers a request to the service
+
+    Input:
+    - request: dictionary with command (submit, status, list, ping or shutdown) and its arguments (submit: config and
+    master_dir; status: run_id)
+
+    Return: response dictionary (ok is False with an error message for bad requests) """
+
+    command = request.get('command')
+
+    if command == 'ping':
+        return {'ok': True, 'pid': os.getpid(), 'queued': pending.qsize()}
+
+    if command == 'submit':
+        if not isinstance(request.get('config'), dict) or not request.get('master_dir'):
+            return {'ok': False, 'error': 'submit needs a config dictionary and a master_dir'}
+        with runs_lock:
+            run = new_run(request['config'], request['master_dir'])
+            runs[run['run_id']] = run
+        pending.put(run['run_id'])
+        logger.info(f'Run {run["run_id"]} queued ({run["config"].get("name")})')
+        return {'ok': True, 'run_id': run['run_id']}
+
+    if command == 'status':
+        with runs_lock:
+            run = runs.get(request.get('run_id'))
+            if run is None:
+                return {'ok': False, 'error': f'Unknown run {request.get("run_id")}'}
+            return dict(run, ok = True)
+
+    if command == 'list':
+        with runs_lock:
+            return {'ok': True, 'runs': [{key: run[key] for key in ('run_id', 'status', 'submitted', 'finished')} for run in runs.values()]}
+
+    if command == 'shutdown':
+        threading.Thread(target = server.shutdown, daemon = True).start()
+        return {'ok': True}
+
+    return {'ok': False, 'error': f'Unknown command {command}'}
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """ Reads one json request per line and writes one json response per line """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                response = handle_request(request, self.server) if isinstance(request, dict) else {'ok': False, 'error': 'request must be a json object'}
+            except ValueError as e:
+                response = {'ok': False, 'error': f'Bad request: {e}'}
+            self.wfile.write((json.dumps(response, default = str) + '\n').encode())
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def serve(socket_path = SOCKET_PATH):
+    """ Runs the service on socket_path until it is shut down (shutdown request, or interrupt) """
+
+    # refusing to start twice, but removing sockets left by services that died
+    if os.path.exists(socket_path):
+        try:
+            request({'command': 'ping'}, socket_path)
+            raise tcm_errors.TCMError(f'A TCM service is already running on {socket_path}')
+        except OSError:
+            os.remove(socket_path)
+
+    missing = warm_up()
+    os.makedirs(os.path.dirname(socket_path) or '.', exist_ok = True)
+    server = Server(socket_path, RequestHandler)
+    os.chmod(socket_path, 0o600)
+
+    thread = threading.Thread(target = worker, daemon = True)
+    thread.start()
+    logger.info(f'TCM service listening on {socket_path} (pid {os.getpid()})' + (f'; not imported: {", ".join(missing)}' if missing else ''))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pending.put(None)
+        thread.join(timeout = 5)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        logger.info('TCM service stopped')
+
+# client functions
+def request(message, socket_path = SOCKET_PATH, timeout = 30.0):
+    """ Sends a request to the service
+
+    Return: response dictionary
+
+    Raises: OSError if the service can't be reached, tcm_errors.TCMError if the service refuses the request """
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(socket_path)
+        connection.sendall((json.dumps(message) + '\n').encode())
+        reply = connection.makefile('rb').readline()
+
+    if not reply:
+        raise ConnectionError(f'TCM service on {socket_path} closed the connection')
+    response = json.loads(reply)
+    if not response.get('ok'):
+        raise tcm_errors.TCMError(response.get('error', 'request failed'))
+
+    return response
+
+def is_running(socket_path = SOCKET_PATH):
+    """ True if a TCM service answers on socket_path """
+
+    try:
+        request({'command': 'ping'}, socket_path, timeout = 2.0)
+        return True
+    except (OSError, ValueError, tcm_errors.TCMError):
+        return False
+
+def submit(config, master_dir = None, socket_path = SOCKET_PATH):
+    """ Submits a run (TCM arguments by dest, see TCM.run_tcm) to the service
+
+    Return: run id """
+
+    return request({'command': 'submit', 'config': config, 'master_dir': os.path.abspath(master_dir or os.getcwd())}, socket_path)['run_id']
+
+def status(run_id, socket_path = SOCKET_PATH):
+    """ Status of a run submitted to the service
+
+    Return: run dictionary (status, result of finished runs, error) """
+
+    return request({'command': 'status', 'run_id': run_id}, socket_path)
+
+def wait(run_id, poll_interval = 1.0, socket_path = SOCKET_PATH):
+    """ Waits until a run submitted to the service finishes
+
+    Return: run dictionary """
+
+    while True:
+        run = status(run_id, socket_path)
+        if run['finished'] is not None:
+            return run
+        time.sleep(poll_interval)
+
+def main(argv = None):
+    """ Command line of the TCM service """
+
+    parser = argparse.ArgumentParser(prog = 'tcm_service', description = 'Long-running local service running TCM jobs with warm imports and caches')
+    parser.add_argument('--socket', dest = 'socket', default = SOCKET_PATH, help = f'path of the service socket (default {SOCKET_PATH}, or TCM_SERVICE_SOCKET)')
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+    subparsers.add_parser('serve', help = 'start the service (runs until stopped)')
+    status_parser = subparsers.add_parser('status', help = 'print status (and result) of a run, or of every run if no run id is given')
+    status_parser.add_argument('run_id', nargs = '?')
+    subparsers.add_parser('ping', help = 'check the service is running')
+    subparsers.add_parser('stop', help = 'stop the service')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        logging.basicConfig(level = logging.INFO, format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        try:
+            serve(args.socket)
+        except tcm_errors.TCMError as e:
+            logger.critical(e)
+            return 1
+        return 0
+
+    try:
+        if args.command == 'status':
+            response = status(args.run_id, args.socket) if args.run_id else request({'command': 'list'}, args.socket)
+        else:
+            response = request({'command': 'ping' if args.command == 'ping' else 'shutdown'}, args.socket)
+    except (OSError, tcm_errors.TCMError) as e:
+        print(f'TCM service on {args.socket}: {e}')
+        return 1
+
+    print(json.dumps(response, indent = 2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
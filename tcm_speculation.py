@@ -0,0 +1,178 @@
+#Import Python modules
+import logging
+import asyncio
+import statistics
+import itertools
+import time
+import os
+
+#Import TCM functionality
+import tcm_job_control
+import tcm_watchdog
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# settings of speculative execution of straggler shards (see configure)
+settings = {
+    'slowdown': 2.0, # a shard is a straggler once it runs slowdown times longer than the median runtime of its completed siblings (0 disables speculation)
+    'min_completed': 0.5, # fraction of sibling shards that must have completed before the median is trusted
+    'min_runtime': 600.0, # shards running for less than this many seconds are never duplicated
+    'check_interval': 30.0, # seconds between straggler checks
+    'hosts': [] # HOSTs duplicates are submitted to, in turn, skipping the HOST of the shard (empty uses the other HOSTs of the stage)
+}
+
+def configure(**kwargs):
+    """ Changes speculative execution settings for the rest of the run (arguments left as None are unchanged) """
+
+    for key, value in kwargs.items():
+        if key not in settings:
+            raise KeyError(f'Unknown speculative execution setting {key}')
+        if value is not None:
+            settings[key] = value
+
+def enabled():
+    """ True if straggler shards are duplicated (slowdown above 0) """
+
+    return settings['slowdown'] > 0
+
+def speculative_dir(cwd):
+    """ Directory a duplicate of a shard is launched from, so its outputs never overwrite the outputs of the first copy """
+
+    return os.path.join(cwd, 'speculative')
+
+def is_straggler(job, durations, shards, now = None):
+    """ Checks whether a running shard is a straggler: enough of its siblings completed and it has run longer than
+    slowdown times their median runtime (and at least min_runtime).
+
+    Input:
+    - job: job dictionary of the running shard (see tcm_job_control.new_job)
+    - durations: runtimes in seconds of the completed sibling shards
+    - shards: number of sibling shards (including this one)
+
+    Return: boolean """
+
+    if not enabled() or job['submitted'] is None or tcm_job_control.is_finished(job):
+        return False
+    if not durations or len(durations) < settings['min_completed'] * shards:
+        return False
+
+    now = time.time() if now is None else now
+    runtime = now - job['submitted']
+
+    return runtime >= settings['min_runtime'] and runtime > settings['slowdown'] * statistics.median(durations)
+
+async def run_copy(command, cwd, jobs, log = None):
+    """ Launches one copy of a shard and polls it until it finishes (the job dictionary is added to jobs as soon as it is
+    launched, so the copy can be cancelled). The watchdog of the first copy skips the directory of the duplicate inside its
+    directory, so a progressing duplicate never hides a stalled first copy.
+
+    Return: job dictionary with final status """
+
+    job = await tcm_job_control.submit(command, cwd, log)
+    jobs.append(job)
+    if job['status'] == 'launched':
+        await tcm_job_control.poll(job, log, watch_paths = [cwd], exclude_paths = [speculative_dir(cwd)])
+
+    return job
+
+async def cancel(tasks, jobs, log = None):
+    """ Kills every running copy of a shard and stops polling it """
+
+    for job in jobs:
+        if job['job_id'] is not None and not tcm_job_control.is_finished(job):
+            if await tcm_watchdog.kill(job, log):
+                (logger if log is None else log).info(f'Cancelled job {job["job_id"]} (other copy of shard finished first)')
+            job['status'] = 'cancelled'
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions = True)
+
+def duplicate_host(shard, hosts):
+    """ HOST to launch the duplicate of a straggler shard on: the next of the speculative hosts, or without speculative hosts
+    the first of the other HOSTs of the stage, that is not the HOST of the shard (never the node the shard is slow on)
+
+    Input:
+    - shard: shard dictionary (see run_shard)
+    - hosts: iterator of speculative HOSTs (None if no speculative hosts are set)
+
+    Return: HOST or None if there is no other host """
+
+    if hosts is not None:
+        for _ in range(len(settings['hosts'])):
+            host = next(hosts)
+            if host != shard.get('host'):
+                return host
+        return None
+
+    return next((host for host in shard.get('other_hosts', []) if host is not None and host != shard.get('host')), None)
+
+async def run_shard(shard, durations, shards, hosts, log = None):
+    """ Runs a shard, launching a duplicate on another host if it becomes a straggler. The first copy to complete wins and
+    the other is cancelled; the shard fails only if every copy fails.
+
+    Input:
+    - shard: dictionary with name, command (function given a HOST, None for the HOST of the shard settings, returning the
+    command), cwd (directory to launch from), host (HOST of the shard) and other_hosts (other HOSTs of the stage, in the
+    order duplicates are sent to them)
+    - durations: runtimes of completed shards, shared between siblings (the runtime of this shard is added when it completes)
+    - shards: number of sibling shards
+    - hosts: iterator of speculative HOSTs for duplicates (None to use the other HOSTs of the stage)
+
+    Return: job dictionary of the winning copy (or of the last failed copy) with 'speculative' (True if the duplicate won) added """
+
+    log = logger if log is None else log
+    jobs = []
+    tasks = {asyncio.ensure_future(run_copy(shard['command'](None), shard['cwd'], jobs, log)): False}
+    failed = None
+    no_host = False # straggler found but no other host to duplicate it on
+
+    while tasks:
+        done, pending = await asyncio.wait(list(tasks), timeout = settings['check_interval'], return_when = asyncio.FIRST_COMPLETED)
+
+        for task in done:
+            job = task.result()
+            job['speculative'] = tasks.pop(task)
+            if tcm_job_control.succeeded(job):
+                await cancel(list(tasks), jobs, log)
+                durations.append(job['finished'] - job['submitted'])
+                if job['speculative']:
+                    log.info(f'Duplicate of shard {shard["name"]} finished first (job {job["job_id"]})')
+                return job
+            failed = job
+
+        # duplicating the shard once if it runs well past its completed siblings
+        if len(jobs) == 1 and len(tasks) == 1 and not no_host and is_straggler(jobs[0], durations, shards):
+            host = duplicate_host(shard, hosts)
+            if host is None:
+                log.warning(f'Shard {shard["name"]} is a straggler but has no other HOST to be duplicated on (see --speculative_hosts '
+                    'or --piper_shard_hosts); not launching a duplicate')
+                no_host = True
+                continue
+            os.makedirs(speculative_dir(shard['cwd']), exist_ok = True)
+            log.warning(f'Shard {shard["name"]} has run {(time.time() - jobs[0]["submitted"]) / 60:.0f} min (median of completed shards is '
+                f'{statistics.median(durations) / 60:.0f} min); launching duplicate on {host}')
+            tasks[asyncio.ensure_future(run_copy(shard['command'](host), speculative_dir(shard['cwd']), jobs, log))] = True
+
+    return failed
+
+async def run_shards(shards, max_concurrent = None, log = None):
+    """ Runs the shards of a stage concurrently (at most max_concurrent at once, duplicates of stragglers are not counted),
+    speculatively re-executing stragglers (see run_shard).
+
+    Input:
+    - shards: list of shard dictionaries (see run_shard)
+    - max_concurrent: largest number of shards running at once (default from tcm_job_control settings)
+    - log: logger (default is logger of this module)
+
+    Return: list of job dictionaries in the same order as shards (outputs of each shard are in the 'cwd' of its job) """
+
+    semaphore = asyncio.Semaphore(tcm_job_control.settings['max_concurrent'] if max_concurrent is None else max_concurrent)
+    durations = []
+    hosts = itertools.cycle(settings['hosts']) if settings['hosts'] else None
+
+    async def run_limited(shard):
+        async with semaphore:
+            return await run_shard(shard, durations, len(shards), hosts, log)
+
+    return await asyncio.gather(*[run_limited(shard) for shard in shards])
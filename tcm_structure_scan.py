@@ -0,0 +1,308 @@
+#Import Python modules
+import logging
+import os
+import itertools
+import concurrent.futures
+
+#Import TCM functionality
+import tcm_validation_cache
+import tcm_fast_reader
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+# issue categories of prepwizard diagnostics that mean a protein was not correctly prepared
+PROBLEM_TYPES = ['invalid_types', 'missing', 'overlapping', 'alternates']
+
+# settings of diagnostics (see configure); number of workers can be set with TCM_DIAGNOSTICS_WORKERS
+settings = {
+    'workers': int(os.getenv('TCM_DIAGNOSTICS_WORKERS', os.cpu_count() or 1)),
+    'fail_fast': False
+}
+
+# summaries of the files already scanned during this run (keyed by absolute file path)
+_summaries = {}
+
+def new_summary(file_path):
+    """ Builds an empty summary of a structure file. Summaries only hold plain python types so they can be
+    logged, compared and written to json.
+
+    Input:
+    - file_path: path to structure file that is summarized
+
+    Return: summary dictionary """
+
+    return {
+        'file': os.path.abspath(file_path), # absolute path of the scanned file
+        'loaded': False, # True if every structure in the file was read
+        'error_type': None, # name of exception raised while reading (e.g. FileNotFoundError)
+        'error': None, # message of exception raised while reading
+        'structures': 0, # number of structures in the file
+        'atoms': [], # number of atoms per structure
+        'chains': [], # sorted chain names found in the file
+        'residues': [], # unique residues in the file as [chain, pdbres (no spaces), resnum]
+        'problems': None, # per structure index and counts of each diagnostics problem type (None if diagnostics not run)
+        'partial': False, # True if diagnostics stopped at the first structure with issues (fail fast)
+        'backend': 'schrodinger' # reader used to read the file (schrodinger or numpy, see tcm_fast_reader)
+    }
+
+def configure(workers = None, fail_fast = None):
+    """ Changes how structures are diagnosed for the rest of the run (arguments left as None are unchanged).
+
+    Input:
+    - workers: number of worker processes diagnosing the structures of multi-structure files (1 runs diagnostics in this process)
+    - fail_fast: whether to stop diagnosing a file at the first structure with issues """
+
+    if workers is not None:
+        settings['workers'] = max(1, int(workers))
+    if fail_fast is not None:
+        settings['fail_fast'] = bool(fail_fast)
+
+def read_structures(file_path, summary, chains, residues):
+    """ Streams the structures of the file, recording atom counts in summary and chains and residues in the given
+    set and dict as each structure is read.
+
+    Yields: tuple of (structure index starting at 1, structure) """
+
+    # reading atoms into numpy arrays if numpy backend selected (see tcm_fast_reader)
+    if summary['backend'] == 'numpy':
+        yield from read_structures_fast(file_path, summary, chains, residues)
+        return
+
+    from schrodinger.structure import StructureReader # imported when first needed (slow to import)
+
+    for index, st in enumerate(StructureReader(file_path), start = 1):
+        summary['structures'] += 1
+        summary['atoms'].append(st.atom_total)
+
+        # collecting residues (and their chains) of the structure
+        for residue in st.residue:
+            chains.add(residue.chain)
+            residues[(residue.chain, residue.pdbres.replace(" ", ""), residue.resnum)] = None # sometimes pdbres has empty spaces, so remove those
+
+        yield index, st
+
+def read_structures_fast(file_path, summary, chains, residues):
+    """ Same as read_structures but reads the atoms of each structure into a numpy array with tcm_fast_reader
+    (diagnostics can't be run on these structures).
+
+    Yields: tuple of (structure index starting at 1, atom array) """
+
+    for index, (title, atoms) in enumerate(tcm_fast_reader.read_structures(file_path), start = 1):
+        summary['structures'] += 1
+        summary['atoms'].append(len(atoms))
+
+        # collecting residues (and their chains) of the structure
+        for residue in tcm_fast_reader.residues(atoms):
+            chains.add(residue[0])
+            residues[residue] = None
+
+        yield index, atoms
+
+def diagnose(index, st):
+    """ Runs prepwizard diagnostics on a single structure (in a worker process for multi-structure files).
+
+    Return: dictionary with the structure index and the number of issues of each problem type """
+
+    from schrodinger.application.prepwizard2.diagnostics import get_problems # imported when first needed (slow to import)
+
+    st_problems = get_problems(st)
+    structure_problems = {'structure': index}
+    structure_problems.update({problem_type: len(getattr(st_problems, problem_type) or []) for problem_type in PROBLEM_TYPES})
+
+    return structure_problems
+
+def diagnose_structures(file_path, structures, workers = 1, fail_fast = False):
+    """ Diagnoses the streamed structures. Files with more than one structure are diagnosed across worker processes with
+    results collected as they finish; a bounded number of structures is held in memory at once.
+
+    Input:
+    - file_path: path to the structure file (for logging)
+    - structures: iterator of (structure index, structure) (see read_structures)
+    - workers: number of worker processes
+    - fail_fast: whether to stop at the first structure with issues
+
+    Return: tuple of (list of structure problems sorted by structure index, True if stopped before diagnosing every structure) """
+
+    problems = []
+
+    def collect(structure_problems):
+        """ Records the diagnostics of a structure; returns True if diagnosing should stop """
+        problems.append(structure_problems)
+        logger.debug(f'Diagnostics of structure {structure_problems["structure"]} in {file_path}: {structure_problems}')
+        return fail_fast and has_problems(structure_problems)
+
+    # holding back first two structures to know whether the file has more than one structure
+    first_structures = list(itertools.islice(structures, 2))
+
+    # single structure (or single worker) is diagnosed in this process
+    if len(first_structures) < 2 or workers <= 1:
+        for index, st in itertools.chain(first_structures, structures):
+            if collect(diagnose(index, st)):
+                return problems, True
+        return problems, False
+
+    stopped = False
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers = workers)
+    try:
+        pending = set()
+        for index, st in itertools.chain(first_structures, structures):
+            pending.add(executor.submit(diagnose, index, st))
+
+            # waiting for results once enough structures are queued (bounds structures held in memory)
+            if len(pending) >= 2 * workers:
+                done, pending = concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+                if any([collect(future.result()) for future in done]):
+                    stopped = True
+                    break
+
+        # collecting remaining results as they finish
+        while pending and not stopped:
+            done, pending = concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+            stopped = any([collect(future.result()) for future in done])
+
+    finally:
+        executor.shutdown(wait = True, cancel_futures = True) # cancels structures not yet diagnosed when stopping early
+
+    return sorted(problems, key = lambda structure_problems: structure_problems['structure']), stopped
+
+def scan(file_path, diagnostics = True, workers = None, fail_fast = None):
+    """ Reads the structure file exactly once, collecting the chains, residues, atom counts and (optionally)
+    prepwizard diagnostics of every structure into a summary.
+
+    Input:
+    - file_path: path to structure file
+    - diagnostics: whether to run get_problems on every structure (expensive on large proteins)
+    - workers: number of worker processes for diagnostics (default from configure)
+    - fail_fast: whether to stop diagnostics at the first structure with issues (default from configure)
+
+    Return: summary dictionary (see new_summary) """
+
+    workers = settings['workers'] if workers is None else workers
+    fail_fast = settings['fail_fast'] if fail_fast is None else fail_fast
+
+    summary = new_summary(file_path)
+    summary['backend'] = scan_backend(file_path, diagnostics)
+    chains = set()
+    residues = {} # dict keeps residues in file order while removing duplicates
+
+    try:
+        structures = read_structures(file_path, summary, chains, residues)
+
+        # counting the issues found by diagnostics in each structure
+        if diagnostics:
+            summary['problems'], summary['partial'] = diagnose_structures(file_path, structures, workers, fail_fast)
+
+        # reading the rest of the file (all of it if diagnostics are not run) so chains and residues are complete
+        for _ in structures:
+            pass
+
+    except Exception as e: # any error in reading the file is recorded and reported by the checks
+        summary['error_type'] = type(e).__name__
+        summary['error'] = str(e)
+        return summary
+
+    summary['loaded'] = True
+    summary['chains'] = sorted(chains)
+    summary['residues'] = [list(residue) for residue in residues]
+
+    return summary
+
+def scan_backend(file_path, diagnostics = True):
+    """ Reader scan uses for the structure file: numpy if selected and supported (see tcm_fast_reader.use_fast_reader),
+    except when diagnostics are run (prepwizard diagnostics need Schrodinger structures)
+
+    Return: schrodinger or numpy """
+
+    return 'numpy' if not diagnostics and tcm_fast_reader.use_fast_reader(file_path) else 'schrodinger'
+
+def get_summary(file_path, diagnostics = True):
+    """ Returns the summary of the structure file, only reading the file if it was not already scanned this run
+    (or was scanned without the requested diagnostics) and is not in the on-disk validation cache.
+
+    Input:
+    - file_path: path to structure file
+    - diagnostics: whether the summary must contain diagnostics results
+
+    Return: summary dictionary (see new_summary) """
+
+    summary = _summaries.get(os.path.abspath(file_path))
+    if usable(summary, diagnostics):
+        return summary
+
+    # looking for a summary of the same file content read by the same backend in an earlier run
+    summary = tcm_validation_cache.load(file_path, scan_backend(file_path, diagnostics))
+    if not usable(summary, diagnostics):
+        # scanning file if never validated or if diagnostics are needed but were not run
+        summary = scan(file_path, diagnostics)
+        tcm_validation_cache.store(summary)
+
+    remember(summary)
+    return summary
+
+def usable(summary, diagnostics = True):
+    """ Checks whether an existing summary answers a request (exists and has diagnostics results if they are needed) """
+
+    if summary is None:
+        return False
+
+    return not (diagnostics and summary['loaded'] and summary['problems'] is None)
+
+def lookup(file_path):
+    """ Returns the summary of file_path already stored this run (or None) without scanning the file """
+
+    return _summaries.get(os.path.abspath(file_path))
+
+def remember(summary):
+    """ Stores summary so later checks on the same file reuse it instead of reading the file again """
+
+    _summaries[summary['file']] = summary
+
+def forget(file_path = None):
+    """ Drops the stored summary of file_path (or all stored summaries if file_path is None), e.g. after a file is rewritten """
+
+    if file_path is None:
+        _summaries.clear()
+        _residue_indexes.clear()
+    else:
+        _summaries.pop(os.path.abspath(file_path), None)
+        _residue_indexes.pop(os.path.abspath(file_path), None)
+
+def has_problems(structure_problems):
+    """ Given the diagnostics counts of a single structure, returns True if any issue was found """
+
+    return any(structure_problems.get(problem_type) for problem_type in PROBLEM_TYPES)
+
+# residue indexes of the files already scanned during this run (keyed by absolute file path)
+_residue_indexes = {}
+
+def build_residue_index(summary):
+    """ Builds a residue lookup index from the residue table of a summary. Each residue is stored under
+    (chain, pdbres, resnum) and under (None, pdbres, resnum) so lookups without a chain match any chain.
+
+    Input:
+    - summary: summary dictionary of a structure file
+
+    Return: set of (chain, pdbres, resnum) keys """
+
+    index = set()
+    for chain, pdbres, resnum in summary['residues']:
+        index.add((chain, pdbres, resnum))
+        index.add((None, pdbres, resnum))
+
+    return index
+
+def get_residue_index(file_path):
+    """ Returns the residue lookup index of the structure file, building it (from the single scan of the file)
+    the first time it is requested.
+
+    Input:
+    - file_path: path to structure file
+
+    Return: set of (chain, pdbres, resnum) keys (see build_residue_index) """
+
+    key = os.path.abspath(file_path)
+    if key not in _residue_indexes:
+        _residue_indexes[key] = build_residue_index(get_summary(file_path, diagnostics = False))
+
+    return _residue_indexes[key]
@@ -0,0 +1,153 @@
+#Import Python modules
+import logging
+import hashlib
+import json
+import os
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+#Get cache directory (can be moved with the TCM_CACHE_DIR environmental variable)
+cache_root = os.getenv('TCM_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.tcm_cache'))
+
+#Get maximum size of validation cache in MB (least recently used entries are evicted past this size)
+max_cache_mb = float(os.getenv('TCM_VALIDATION_CACHE_MB', 64))
+
+#Version of the stored summaries (entries of other versions are never read)
+summary_version = 2
+
+#Whether the validation cache is used at all (set TCM_VALIDATION_CACHE=0 to disable)
+cache_enabled = os.getenv('TCM_VALIDATION_CACHE', '1') not in ('0', 'no', 'false')
+
+def get_schrodinger_release():
+    """ Gets Schrodinger release version used for validation. Assumes pathname has version, e.g. "/schrodinger/2023-2/" """
+
+    SCHRODINGER = os.getenv('SCHRODINGER')
+    return os.path.basename(os.path.normpath(SCHRODINGER)) if SCHRODINGER else 'unknown'
+
+# hashes already computed this run keyed by (absolute path, modification time, size)
+_hashes = {}
+
+def file_hash(file_path, chunk_size = 1 << 20):
+    """ Computes the sha256 hash of the content of a file, reading it in chunks. Hashes are reused within a run
+    while the file is unchanged.
+
+    Return: hex digest (str) """
+
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    if key in _hashes:
+        return _hashes[key]
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+
+    _hashes[key] = digest.hexdigest()
+    return _hashes[key]
+
+def get_cache_dir():
+    """ Returns (and creates if needed) directory storing the validation cache entries """
+
+    cache_dir = os.path.join(cache_root, 'validation')
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def entry_path(file_path, backend):
+    """ Path of the cache entry for the file; entries are keyed by file content hash, Schrodinger release and the structure
+    backend that read the file (chain and residue names of the numpy and Schrodinger readers can differ) so moving/renaming
+    a file still hits while editing the file, changing release or changing backend misses """
+
+    key = hashlib.sha256(f'{file_hash(file_path)}:{get_schrodinger_release()}:{backend}:{summary_version}'.encode()).hexdigest()
+    return os.path.join(get_cache_dir(), f'{key}.json')
+
+def load(file_path, backend = 'schrodinger'):
+    """ Looks up the validation summary of a file in the cache. Marks the entry as recently used.
+
+    Input:
+    - file_path: path to structure file
+    - backend: reader that would scan the file (schrodinger or numpy, see tcm_structure_scan.scan_backend)
+
+    Return: summary dictionary (see tcm_structure_scan.new_summary) or None if not cached """
+
+    if not cache_enabled:
+        return None
+
+    try:
+        path = entry_path(file_path, backend)
+        with open(path, 'r') as f:
+            summary = json.load(f)
+        os.utime(path) # refreshing the last use time for LRU eviction
+
+    except (OSError, ValueError): # file missing or unreadable, or no entry / corrupt entry
+        return None
+
+    # summary is reported for the path currently checked
+    summary['file'] = os.path.abspath(file_path)
+    logger.debug(f'Validation cache hit for {file_path}')
+
+    return summary
+
+def store(summary):
+    """ Stores the validation summary of a successfully loaded file in the cache and evicts least recently used
+    entries if the cache grows past its size limit. Summaries of files that failed to load (or were only partially
+    diagnosed) are not stored.
+
+    Input:
+    - summary: summary dictionary (see tcm_structure_scan.new_summary) """
+
+    if not cache_enabled or not summary['loaded'] or summary.get('partial'):
+        return
+
+    try:
+        path = entry_path(summary['file'], summary['backend'])
+
+        # writing to temporary file then renaming so concurrent runs never read partial entries
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(summary, f)
+        os.replace(tmp_path, path)
+
+        evict()
+
+    except OSError as e: # cache is an optimization, so failing to write it never fails the run
+        logger.warning(f'Could not write validation cache entry for {summary["file"]}: {e}')
+
+def evict(max_mb = None):
+    """ Removes least recently used entries until the validation cache is within max_mb (default max_cache_mb) """
+
+    max_bytes = (max_cache_mb if max_mb is None else max_mb) * 1024 * 1024
+    cache_dir = get_cache_dir()
+
+    # collecting (last use time, size, path) of every entry
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.json'):
+            path = os.path.join(cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError: # removed by another run
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(entry[1] for entry in entries)
+
+    # removing oldest entries first
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        logger.debug(f'Evicted validation cache entry {path}')
+
+def clear():
+    """ Removes every entry of the validation cache """
+
+    cache_dir = get_cache_dir()
+    for name in os.listdir(cache_dir):
+        if name.endswith('.json'):
+            os.remove(os.path.join(cache_dir, name))
@@ -0,0 +1,131 @@
+#Import Python modules
+import logging
+import asyncio
+import time
+import os
+
+#Import TCM functionality
+import tcm_job_runner
+
+###Initiate logger###
+logger = logging.getLogger(__name__)
+
+#Get Schrodinger environmental variable
+SCHRODINGER = os.getenv('SCHRODINGER', '')
+
+# settings of the stall watchdog (see configure); the stall window can be set in seconds with TCM_STALL_WINDOW (0 disables the watchdog)
+settings = {
+    'stall_window': float(os.getenv('TCM_STALL_WINDOW', 6 * 3600)), # seconds without any change to the job log or outputs before a job is stalled
+    'on_stall': 'resubmit', # resubmit (stalled jobs are retried as transient failures, see tcm_retry) or fail
+    'kill_command': os.getenv('TCM_JOB_KILL_COMMAND', f'{os.path.join(SCHRODINGER, "jsc")} cancel') # command given a job id that kills the job
+}
+
+def configure(stall_window = None, on_stall = None, kill_command = None):
+    """ Changes the stall watchdog settings for the rest of the run (arguments left as None are unchanged) """
+
+    if stall_window is not None:
+        settings['stall_window'] = float(stall_window)
+    if on_stall is not None:
+        if on_stall not in ('resubmit', 'fail'):
+            raise ValueError(f'on_stall must be resubmit or fail, not {on_stall}')
+        settings['on_stall'] = on_stall
+    if kill_command is not None:
+        settings['kill_command'] = kill_command
+
+def enabled():
+    """ True if the watchdog is on (stall window above 0) """
+
+    return settings['stall_window'] > 0
+
+def walk_files(watch_path, exclude_paths = ()):
+    """ Paths of every file under a directory, skipping the excluded directories """
+
+    excluded = {os.path.abspath(path) for path in exclude_paths}
+    for root, dirs, files in os.walk(watch_path):
+        dirs[:] = [name for name in dirs if os.path.abspath(os.path.join(root, name)) not in excluded]
+        yield from (os.path.join(root, name) for name in files)
+
+def latest_activity(watch_paths, exclude_paths = ()):
+    """ Time of the latest change to the watched files: the files themselves, or every file under watched directories
+    (Schrodinger jobs write logs and outputs of subjobs in subdirectories) except under exclude_paths (e.g. directories of
+    other jobs launched inside the job directory).
+
+    Return: modification time (seconds since epoch) or None if there are no files """
+
+    latest = None
+    for watch_path in watch_paths:
+        if os.path.isdir(watch_path):
+            paths = walk_files(watch_path, exclude_paths)
+        else:
+            paths = [watch_path]
+
+        for path in paths:
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError: # removed while walking (e.g. temporary files)
+                continue
+            latest = mtime if latest is None or mtime > latest else latest
+
+    return latest
+
+def stalled_for(job, watch_paths, now = None, exclude_paths = ()):
+    """ Seconds since the job last showed progress (a change to the watched files, or the job launch) """
+
+    now = time.time() if now is None else now
+    last = max(time for time in (latest_activity(watch_paths, exclude_paths), job['submitted']) if time is not None)
+
+    return now - last
+
+async def kill(job, log = None):
+    """ Kills a job through job control.
+
+    Return: boolean (True if the kill command succeeded) """
+
+    log = logger if log is None else log
+    arguments = tcm_job_runner.split_command(settings['kill_command']) + [job['job_id']]
+    try:
+        process = await asyncio.create_subprocess_exec(*arguments, stdout = asyncio.subprocess.PIPE, stderr = asyncio.subprocess.STDOUT)
+        output, _ = await process.communicate()
+    except OSError as e:
+        log.critical(f'Watchdog could not kill job {job["job_id"]}: {e}')
+        return False
+
+    if process.returncode != 0:
+        log.critical(f'Watchdog could not kill job {job["job_id"]}: {output.decode(errors = "replace").strip()}')
+        return False
+
+    return True
+
+async def check(job, watch_paths, log = None, exclude_paths = ()):
+    """ Checks whether a running job is stalled (no progress within the stall window). Stalled jobs are killed and marked
+    with status stalled; if the kill fails, the job may still be running in its directory so it is marked kill_failed
+    (never resubmitted). The intervention is logged and recorded in job['interventions'].
+
+    Input:
+    - job: job dictionary (see tcm_job_control.new_job)
+    - watch_paths: job log / output files or directories of the job
+    - log: logger that interventions are recorded in (default is logger of this module)
+    - exclude_paths: directories under watch_paths that are not part of the job
+
+    Return: boolean (True if the job was stalled) """
+
+    log = logger if log is None else log
+    if not enabled() or job['job_id'] is None:
+        return False
+
+    idle = stalled_for(job, watch_paths, exclude_paths = exclude_paths)
+    if idle <= settings['stall_window']:
+        return False
+
+    log.warning(f'Watchdog: no progress in {", ".join(watch_paths)} for {idle / 60:.0f} min (window is {settings["stall_window"] / 60:.0f} min); '
+        f'killing job {job["job_id"]} ({"resubmitting" if settings["on_stall"] == "resubmit" else "marking failed"})')
+    killed = await kill(job, log)
+    if not killed:
+        log.critical(f'Watchdog: job {job["job_id"]} could not be killed and may still be running in {job["cwd"]}; marking it failed '
+            'instead of resubmitting')
+
+    job['status'] = 'stalled' if killed else 'kill_failed'
+    job.setdefault('interventions', []).append({'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'action': 'killed' if killed else 'kill failed',
+        'idle_seconds': round(idle), 'on_stall': settings['on_stall']})
+
+    return True
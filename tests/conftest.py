@@ -0,0 +1,26 @@
+#Import Python modules
+import tempfile
+import pytest
+import sys
+import os
+
+# TCM modules import the PIPER and IFD modules by name (e.g. import piper_check_input), so their directories are put on
+# the path after the TCM directory (as on PYTHONPATH of an installation), where PIPER is the package
+TCM_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TCM_path)
+sys.path.extend([os.path.join(TCM_path, 'PIPER'), os.path.join(TCM_path, 'InducedFitDocking')])
+
+# caches, stores and local jobs of the tests are kept out of the home directory
+os.environ.setdefault('TCM_CACHE_DIR', tempfile.mkdtemp(prefix = 'tcm_tests_'))
+
+@pytest.fixture
+def local_jobs(monkeypatch):
+    """ Submits and polls jobs with the local stand-in of job control (polled every 0.2 s) for one test """
+
+    import tcm_job_control
+    import tcm_watchdog
+    for module in (tcm_job_control, tcm_watchdog):
+        for key, value in module.settings.items():
+            monkeypatch.setitem(module.settings, key, value)
+    tcm_job_control.use_local_job_control()
+    tcm_job_control.configure(poll_interval = 0.2, poll_max_interval = 0.5)
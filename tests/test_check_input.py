@@ -0,0 +1,23 @@
+#Import TCM functionality
+import tcm_check_input
+import tcm_ligand_check
+import tcm_structure_scan
+import tcm_fast_reader
+import tcm_parseargs
+
+def test_check_args_writes_reports_in_job_directory_of_master_dir(tmp_path, monkeypatch):
+    """ Per-ligand validation tables go to the job directory in master_dir, wherever TCM is started from """
+
+    for module in (tcm_ligand_check, tcm_structure_scan, tcm_fast_reader):
+        for key, value in module.settings.items():
+            monkeypatch.setitem(module.settings, key, value)
+    monkeypatch.setattr(tcm_check_input, 'check_inputs', lambda args: False)
+    (tmp_path / 'elsewhere').mkdir()
+    monkeypatch.chdir(tmp_path / 'elsewhere')
+
+    parser, args_by_group = tcm_parseargs.build_parser()
+    argv = ['TCM.py', '-c', 'crbn.pdb', '-p', 'poi.pdb', '-l', 'lig.sdf', '-n', 'run', '--piper_settings', 'p.json', '--ifd_settings', 'i.json']
+    args, unknowns = parser.parse_known_args(argv[1:])
+
+    assert tcm_check_input.check_args(parser, argv, args, unknowns, str(tmp_path)) is False
+    assert tcm_ligand_check.settings['report_dir'] == str(tmp_path / 'TernaryComplexModeling_run')
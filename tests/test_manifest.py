@@ -0,0 +1,24 @@
+#Import TCM functionality
+import tcm_manifest
+import tcm_scheduler
+import tcm_parseargs
+
+def test_campaign_instances_are_unregistered(tmp_path, monkeypatch):
+    """ Stage instances of the triples of a campaign are removed from the scheduler once the campaign finished, so later
+    campaigns (or runs) of the process only see the workflow stages """
+
+    monkeypatch.setattr(tcm_scheduler, 'stages', {})
+    tcm_scheduler.register('Dock', lambda context: {'dock_dir': str(context['artifacts']['protein'])}, inputs = ['protein'], outputs = ['dock_dir'])
+    monkeypatch.setattr(tcm_manifest, 'validate_files', lambda runs, workers = None: {})
+
+    (tmp_path / 'manifest.csv').write_text('name,protein\npoi1,poi1.pdb\npoi2,poi2.pdb\n')
+    parser, args_by_group = tcm_parseargs.build_parser()
+    for action in parser._actions:
+        action.required = False
+    args = parser.parse_known_args(['--manifest', str(tmp_path / 'manifest.csv'), '-c', 'crbn.pdb', '-l', 'lig.sdf',
+        '--piper_settings', 'piper.json', '--ifd_settings', 'ifd.json'])[0]
+
+    for campaign in ('first', 'second'):
+        args.name = campaign
+        assert tcm_manifest.run_campaign(args, args_by_group, parser, None, str(tmp_path)) is False
+        assert list(tcm_scheduler.stages) == ['Dock']
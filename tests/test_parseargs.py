@@ -0,0 +1,44 @@
+#Import Python modules
+import pytest
+
+#Import TCM functionality
+import tcm_parseargs
+import tcm_errors
+
+#Import PIPER modules
+import piper_parseargs
+
+REQUIRED = ['-c', 'crbn.pdb', '-p', 'poi.pdb', '-l', 'lig.sdf', '-n', 'run', '--piper_settings', 'piper.json', '--ifd_settings', 'ifd.json']
+
+def test_tcm_arguments_are_parsed():
+    parser, args_by_group = tcm_parseargs.build_parser()
+    args, unknowns = parser.parse_known_args(REQUIRED + ['--piper_shards', '2', '--extra'])
+
+    assert (args.cereblon, args.shards, unknowns) == ('crbn.pdb', 2, ['--extra'])
+
+@pytest.mark.parametrize('argv', [REQUIRED[:-2], REQUIRED + ['--piper_shards', 'two'], REQUIRED + ['--on_stall', 'wait']])
+def test_bad_tcm_arguments_raise(argv):
+    """ Bad arguments raise ArgumentError instead of exiting, so in-process callers decide how to stop """
+
+    parser, args_by_group = tcm_parseargs.build_parser()
+    with pytest.raises(tcm_errors.ArgumentError):
+        parser.parse_known_args(argv)
+
+def test_tcm_options_are_not_prefix_matched():
+    parser, args_by_group = tcm_parseargs.build_parser()
+    args, unknowns = parser.parse_known_args(REQUIRED + ['--piper_shard', '2'])
+
+    assert args.shards is None
+    assert unknowns == ['--piper_shard', '2']
+
+def test_bad_piper_arguments_raise():
+    parser = piper_parseargs.build_parser()
+    with pytest.raises(tcm_errors.ArgumentError):
+        parser.parse_known_args([])
+
+def test_build_args_gives_every_piper_argument():
+    """ Arguments not given keep their parser defaults (e.g. receptor_chain read by PIPER checks and settings) """
+
+    args = piper_parseargs.build_args(receptor_prot = 'crbn.pdb', ligand_prot = 'poi.pdb', default = 'piper.json')
+
+    assert (args.receptor_prot, args.default, args.receptor_chain, args.constraint) == ('crbn.pdb', 'piper.json', None, None)
@@ -0,0 +1,34 @@
+#Import Python modules
+import math
+
+import pytest
+
+#Import PIPER modules
+import piper_adaptive
+
+@pytest.mark.parametrize('total, count, expected', [(10, 5, [0, 2, 4, 6, 8]), (6, 2, [0, 3]), (7, 3, [0, 2, 4]), (3, 5, [0, 1, 2])])
+def test_coarse_indexes_are_evenly_spread(total, count, expected):
+    assert piper_adaptive.coarse_indexes(total, count) == expected
+
+def test_neighbour_indexes_keep_rotations_near_orientations():
+    """ Rotations within the angle of an orientation (or of its transpose) are kept """
+
+    np = pytest.importorskip('numpy')
+
+    def about_z(angle):
+        cos, sin = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+        return np.array([[cos, -sin, 0.0], [sin, cos, 0.0], [0.0, 0.0, 1.0]])
+
+    matrices = np.array([about_z(angle) for angle in (0, 10, 30, 90, -12)])
+
+    assert piper_adaptive.neighbour_indexes(matrices, [about_z(0)], 15.0) == [0, 1, 4]
+    assert piper_adaptive.neighbour_indexes(matrices, [about_z(-85)], 10.0) == [3] # near the transpose
+    assert piper_adaptive.neighbour_indexes(matrices, [], 15.0) == []
+
+def test_rotation_matrices_read_last_nine_values():
+    np = pytest.importorskip('numpy')
+
+    matrices = piper_adaptive.rotation_matrices(['1 1 0 0 0 1 0 0 0 1\n', '2 0 -1 0 1 0 0 0 0 1\n'])
+
+    assert matrices.shape == (2, 3, 3)
+    assert np.allclose(matrices[1], [[0, -1, 0], [1, 0, 0], [0, 0, 1]])
@@ -0,0 +1,62 @@
+#Import Python modules
+import types
+import math
+
+import pytest
+
+#Import PIPER modules
+import piper_crop
+
+def structure(residues):
+    """ Stand-in for a Schrodinger structure: residues of (chain, resnum, pdbres, atom indexes) """
+
+    return types.SimpleNamespace(residue = [types.SimpleNamespace(chain = chain, resnum = resnum, pdbres = f'{pdbres} ',
+        atom = [types.SimpleNamespace(index = index) for index in indexes]) for chain, resnum, pdbres, indexes in residues])
+
+def test_constraint_anchors(tmp_path):
+    """ Distance and attraction residues are anchors of their protein; repulsion residues are not """
+
+    constraint = tmp_path / 'constraints.txt'
+    constraint.write_text('distance 2 10 HIS353 LYS40\nattraction 0.2 ligand GLU41 ASP42\nrepulsion receptor TRP380\n')
+
+    assert piper_crop.constraint_anchors(str(constraint)) == {'receptor': {(353, 'HIS')}, 'ligand': {(40, 'LYS'), (41, 'GLU'), (42, 'ASP')}}
+    assert piper_crop.constraint_anchors(None) == {'receptor': set(), 'ligand': set()}
+
+def test_anchor_residues_are_matched_on_the_docked_chain():
+    """ Residues with the number and name of a constraint residue on other chains (e.g. DDB1) are not anchors """
+
+    st = structure([('A', 353, 'HIS', [1, 2]), ('B', 353, 'HIS', [3, 4]), ('A', 354, 'TRP', [5])])
+
+    assert piper_crop.anchor_atoms(st, {(353, 'HIS')}, False, 'A') == [1, 2]
+    assert piper_crop.anchor_atoms(st, {(353, 'HIS')}, False) == [1, 2, 3, 4]
+
+def rotation_about_z(angle):
+    np = pytest.importorskip('numpy')
+    cos, sin = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    return np.array([[cos, -sin, 0.0], [sin, cos, 0.0], [0.0, 0.0, 1.0]])
+
+def test_superpose_recovers_rigid_transform():
+    np = pytest.importorskip('numpy')
+    mobile = np.array([[0.0, 0.0, 0.0], [3.8, 0.0, 0.0], [3.8, 3.8, 0.0], [0.0, 3.8, 3.8]])
+    rotation = rotation_about_z(30)
+    target = mobile @ rotation.T + [1.0, -2.0, 5.0]
+
+    found_rotation, translation, rmsd = piper_crop.superpose(mobile, target)
+
+    assert np.allclose(found_rotation, rotation)
+    assert np.allclose(translation, target.mean(axis = 0) - rotation @ mobile.mean(axis = 0))
+    assert rmsd == pytest.approx(0.0, abs = 1e-9)
+
+def test_split_pose_finds_receptor_first_or_ligand_first():
+    np = pytest.importorskip('numpy')
+    receptor = np.array([[0.0, 0.0, 0.0], [3.8, 0.0, 0.0], [3.8, 3.8, 0.0], [0.0, 3.8, 3.8]])
+    ligand = np.array([[0.0, 0.0, 0.0], [3.8, 0.0, 0.0], [7.6, 1.0, 0.0]]) + 20.0
+    moved_ligand = ligand @ rotation_about_z(45).T + [5.0, 0.0, 0.0]
+
+    for pose, expected in [(np.vstack([receptor, moved_ligand]), 'receptor first'), (np.vstack([moved_ligand, receptor]), 'ligand first')]:
+        receptor_part, ligand_part = piper_crop.split_pose(pose, receptor, ligand)
+        assert np.allclose(receptor_part, receptor), expected
+        assert np.allclose(ligand_part, moved_ligand), expected
+
+    with pytest.raises(ValueError):
+        piper_crop.split_pose(receptor, receptor, ligand)
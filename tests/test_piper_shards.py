@@ -0,0 +1,43 @@
+#Import Python modules
+import gzip
+
+import pytest
+
+#Import PIPER modules
+import piper_shards
+
+def write_poses(path, poses):
+    """ Writes poses (title, score, CA coordinates) as a PIPER -out.maegz """
+
+    with gzip.open(path, 'wt') as f:
+        f.write('{\n s_m_m2io_version\n :::\n 2.0.0\n}\n\n')
+        for title, score, ca in poses:
+            atoms = ''.join(f'  {index} " CA " {x} {y} {z}\n' for index, (x, y, z) in enumerate(ca, start = 1))
+            f.write(f'f_m_ct {{\n s_m_title\n r_psp_piper_score\n :::\n {title}\n {score}\n m_atom[{len(ca)}] {{\n'
+                f'  # First column is atom index #\n  s_m_pdb_atom_name\n  r_m_x_coord\n  r_m_y_coord\n  r_m_z_coord\n  :::\n{atoms}  :::\n }}\n}}\n\n')
+
+def test_rank_clusters_orders_by_population():
+    """ Largest clusters come first; clusters of the same size keep the rank of their centers """
+
+    clusters = [('best', 1), ('second', 3), ('third', 1), ('fourth', 3)]
+
+    assert piper_shards.rank_clusters(clusters) == [('second', 3), ('fourth', 3), ('best', 1), ('third', 1)]
+
+def test_merge_shards_keeps_largest_clusters(tmp_path):
+    """ Merged poses are clustered across shards and the most populated cluster is ranked first, even if its center is
+    scored worse than a lone pose """
+
+    pytest.importorskip('numpy')
+    receptor = [(0.0, 0.0, 0.0), (3.8, 0.0, 0.0), (7.6, 0.0, 0.0)]
+    def pose(shift): # ligand protein moved along y
+        return receptor + [(0.0, shift, 20.0), (3.8, shift, 20.0), (7.6, shift, 20.0)]
+
+    write_poses(tmp_path / 'shard1.maegz', [('lone', -100.0, pose(30.0)), ('crowd1', -90.0, pose(0.0))])
+    write_poses(tmp_path / 'shard2.maegz', [('crowd2', -80.0, pose(1.0)), ('crowd3', -70.0, pose(2.0))])
+
+    written = piper_shards.merge_shards([str(tmp_path / 'shard1.maegz'), str(tmp_path / 'shard2.maegz')], str(tmp_path / 'merged.maegz'), 2, 9.0)
+
+    assert written == 2
+    with gzip.open(tmp_path / 'merged.maegz', 'rt') as f:
+        titles = [line.strip() for line in f if line.strip() in ('lone', 'crowd1', 'crowd2', 'crowd3')]
+    assert titles == ['crowd1', 'lone']
@@ -0,0 +1,107 @@
+#Import Python modules
+import gzip
+import json
+import stat
+import sys
+import os
+
+import pytest
+
+#Import TCM functionality
+import TCM
+import tcm_check_input
+import piper_check_input
+
+# stand-in for $SCHRODINGER/run: writes the -out.maegz of the PIPER job named by -jobname into the working directory, one
+# pose per rotation of the -rotation_file given (3 poses without), scored by the number of the rotation
+FAKE_RUN = '''#!{python}
+import gzip, sys
+jobname = sys.argv[sys.argv.index('-jobname') + 1]
+rotations = ['1', '2', '3']
+if '-rotation_file' in sys.argv:
+    with open(sys.argv[sys.argv.index('-rotation_file') + 1]) as f:
+        rotations = [line.split()[0] for line in f if line.strip()]
+with gzip.open(jobname + '-out.maegz', 'wt') as f:
+    f.write('{{\\n s_m_m2io_version\\n :::\\n 2.0.0\\n}}\\n\\n')
+    for rotation in rotations:
+        f.write('f_m_ct {{\\n s_m_title\\n r_psp_piper_score\\n :::\\n rotation%s\\n -%s.0\\n}}\\n\\n' % (rotation, rotation))
+'''
+
+def run_stage(tmp_path, piper_settings, **config):
+    """ Runs TCM with the fake Schrodinger installation (every stage after PIPER fails without Schrodinger)
+
+    Return: tuple of (RunResult, list of titles of the PIPER poses) """
+
+    SCHRODINGER = tmp_path / 'schrodinger'
+    SCHRODINGER.mkdir()
+    (SCHRODINGER / 'run').write_text(FAKE_RUN.format(python = sys.executable))
+    (SCHRODINGER / 'run').chmod(stat.S_IRWXU)
+
+    # rotation set of 6 rotations (number followed by the 9 values of the rotation matrix)
+    (tmp_path / 'rotations.prm').write_text(''.join(f'{index} 1 0 0 0 1 0 0 0 1\n' for index in range(1, 7)))
+    for name in ('crbn.pdb', 'poi.pdb', 'lig.sdf'):
+        (tmp_path / name).write_text('')
+    (tmp_path / 'ifd.json').write_text('{}')
+    (tmp_path / 'piper.json').write_text(json.dumps(dict({'poses': 3, 'rotations': 6, 'trim_inputs': False, 'HOST': 'localhost',
+        'rotation_set': str(tmp_path / 'rotations.prm'), 'rotation_set_flag': '-rotation_file'}, **piper_settings)))
+
+    result = TCM.run_tcm(dict({'cereblon': 'crbn.pdb', 'protein': 'poi.pdb', 'ligand': 'lig.sdf', 'name': 'e2e', 'piper_settings': 'piper.json',
+        'ifd_settings': 'ifd.json', 'no_piper_store': True}, **config), master_dir = str(tmp_path), SCHRODINGER = str(SCHRODINGER))
+
+    piper_out = os.path.join(result.tcm_dir, 'prot_prot_docking_e2e', 'prot_prot_docking_e2e-out.maegz')
+    titles = []
+    if os.path.isfile(piper_out):
+        with gzip.open(piper_out, 'rt') as f:
+            lines = f.read().splitlines()
+        titles = [line.strip() for line in lines if line.strip().startswith('rotation')]
+
+    return result, titles
+
+@pytest.fixture
+def schrodinger_checks_skipped(monkeypatch, local_jobs):
+    """ Skips the checks of input files needing Schrodinger (jobs are run by the local stand-in of job control) """
+
+    monkeypatch.setattr(tcm_check_input, 'check_inputs', lambda args: False)
+    monkeypatch.setattr(piper_check_input, 'invalid_protein_error', lambda protein_file, chain: False)
+
+def test_piper_stage_runs_through_tcm(tmp_path, schrodinger_checks_skipped):
+    """ PIPER stage of run_tcm gets past prepare_piper (arguments TCM does not set, e.g. receptor_chain, are found) and
+    writes its poses """
+
+    result, titles = run_stage(tmp_path, {})
+
+    assert result.stages['PIPER']['status'] == 'completed'
+    assert titles == ['rotation1', 'rotation2', 'rotation3']
+
+def test_piper_shards_are_merged(tmp_path, schrodinger_checks_skipped):
+    """ --piper_shards docks every rotation range as its own job and keeps the best poses of all shards """
+
+    result, titles = run_stage(tmp_path, {}, shards = 2)
+
+    assert result.stages['PIPER']['status'] == 'completed'
+    piper_dir = os.path.join(result.tcm_dir, 'prot_prot_docking_e2e')
+    assert os.path.isfile(os.path.join(piper_dir, 'shard_1', 'prot_prot_docking_e2e_shard1-out.maegz'))
+    assert os.path.isfile(os.path.join(piper_dir, 'shard_2', 'prot_prot_docking_e2e_shard2-out.maegz'))
+    assert titles == ['rotation6', 'rotation5', 'rotation4'] # poses of shard 2, best scored first (unclustered, all of size 1)
+
+def test_piper_adaptive_docks_coarse_then_fine(tmp_path, schrodinger_checks_skipped):
+    """ --piper_adaptive docks the coarse rotations first, then the rest (every rotation if the coarse poses did not
+    converge), and merges the poses of both passes """
+
+    result, titles = run_stage(tmp_path, {'coarse_rotations': 2}, adaptive = True)
+
+    assert result.stages['PIPER']['status'] == 'completed'
+    piper_dir = os.path.join(result.tcm_dir, 'prot_prot_docking_e2e')
+    with open(os.path.join(piper_dir, 'coarse', 'shard_1', 'rotations_0-2.prm')) as f:
+        assert [line.split()[0] for line in f] == ['1', '4'] # evenly spread over the rotation set
+    assert os.path.isdir(os.path.join(piper_dir, 'fine'))
+    assert titles == ['rotation6', 'rotation5', 'rotation4']
+
+def test_piper_crop_radius_maps_poses_back(tmp_path, schrodinger_checks_skipped):
+    """ --piper_crop_radius docks cropped proteins (needs Schrodinger to crop and map poses back) """
+
+    pytest.importorskip('schrodinger')
+    result, titles = run_stage(tmp_path, {}, crop_radius = 12.0)
+
+    assert result.stages['PIPER']['status'] == 'completed'
+    assert os.path.isfile(os.path.join(result.tcm_dir, 'prot_prot_docking_e2e', 'crop.json'))
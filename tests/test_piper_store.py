@@ -0,0 +1,58 @@
+#Import Python modules
+import gzip
+import os
+
+import pytest
+
+#Import TCM functionality
+import tcm_piper_store
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """ PIPER result store in its own directory """
+
+    monkeypatch.setitem(tcm_piper_store.settings, 'store_dir', str(tmp_path / 'store'))
+    monkeypatch.setitem(tcm_piper_store.settings, 'enabled', True)
+    return tcm_piper_store
+
+def poses(path, text = 'f_m_ct {\n}\n'):
+    with gzip.open(path, 'wt') as f:
+        f.write(text)
+    return str(path)
+
+def test_key_follows_protein_content_and_docking_settings(tmp_path, store):
+    crbn, poi = tmp_path / 'crbn.pdb', tmp_path / 'poi.pdb'
+    crbn.write_text('CRBN\n')
+    poi.write_text('POI\n')
+    (tmp_path / 'renamed.pdb').write_text('CRBN\n')
+    settings = {'poses': 30, 'receptor_chain': 'B', 'constraints': None}
+
+    key = store.key({'receptor': str(crbn), 'ligand': str(poi)}, settings)
+
+    assert store.key({'receptor': str(tmp_path / 'renamed.pdb'), 'ligand': str(poi)}, settings) == key
+    assert store.key({'receptor': str(crbn), 'ligand': str(poi)}, dict(settings, receptor_chain = 'A')) != key
+    assert store.key({'receptor': str(poi), 'ligand': str(crbn)}, settings) != key
+
+def test_stored_poses_are_linked_and_checked(tmp_path, store):
+    out_path = poses(tmp_path / 'job-out.maegz')
+    store.store('dock1', out_path, {'receptor': 'crbn.pdb'})
+
+    stored_path = store.lookup('dock1')
+    store.link(stored_path, str(tmp_path / 'rerun-out.maegz'))
+    assert os.path.samefile(stored_path, tmp_path / 'rerun-out.maegz')
+
+    with open(stored_path, 'ab') as f: # changed after it was stored
+        f.write(b'x')
+    assert store.lookup('dock1') is None
+    assert store.lookup('missing') is None
+
+def test_evict_removes_least_recently_used_entries(tmp_path, store):
+    for index, name in enumerate(['old', 'used', 'new']):
+        store.store(name, poses(tmp_path / f'{name}-out.maegz', 'f_m_ct {\n}\n' * 200))
+        os.utime(store.entry_dir(name), (1000 + index, 1000 + index))
+    store.lookup('used')
+
+    entry_mb = sum(os.path.getsize(os.path.join(store.entry_dir('old'), name)) for name in os.listdir(store.entry_dir('old'))) / 1024 / 1024
+    store.evict(max_mb = 2.5 * entry_mb)
+
+    assert sorted(os.listdir(store.settings['store_dir'])) == ['new', 'used']
@@ -0,0 +1,30 @@
+#Import Python modules
+import shutil
+import os
+
+#Import PIPER modules
+import piper_trim
+
+def test_cached_path_is_keyed_by_content_chain_and_ligands(tmp_path, monkeypatch):
+    monkeypatch.setitem(piper_trim.settings, 'cache_dir', str(tmp_path / 'cache'))
+    crbn = tmp_path / 'crbn.pdb'
+    crbn.write_text('ATOM\n')
+    shutil.copy(crbn, tmp_path / 'copy.pdb')
+
+    path = piper_trim.cached_path(str(crbn), 'A')
+
+    assert os.path.basename(path).startswith('crbn_A_')
+    assert os.path.basename(piper_trim.cached_path(str(tmp_path / 'copy.pdb'), 'A')).split('_')[-1] == os.path.basename(path).split('_')[-1]
+    assert piper_trim.cached_path(str(crbn), 'B') != path
+    assert os.path.basename(piper_trim.cached_path(str(crbn), 'A', keep_ligands = True)).startswith('crbn_A_ligands_')
+
+def test_evict_removes_least_recently_used_files(tmp_path, monkeypatch):
+    monkeypatch.setitem(piper_trim.settings, 'cache_dir', str(tmp_path))
+    for index, name in enumerate(['old.mae', 'used.mae', 'new.mae', 'partial.123.tmp.mae']):
+        (tmp_path / name).write_bytes(b'x' * 1024)
+        os.utime(tmp_path / name, (1000 + index, 1000 + index))
+    os.utime(tmp_path / 'used.mae', (2000, 2000))
+
+    piper_trim.evict(max_mb = 2 / 1024)
+
+    assert sorted(os.listdir(tmp_path)) == ['new.mae', 'partial.123.tmp.mae', 'used.mae']
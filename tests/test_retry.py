@@ -0,0 +1,78 @@
+#Import Python modules
+import sys
+
+import pytest
+
+#Import TCM functionality
+import tcm_job_control
+import tcm_watchdog
+import tcm_retry
+
+def failed_job(**values):
+    """ Job dictionary of a job that completed badly (see tcm_job_control.new_job) """
+
+    job = tcm_job_control.new_job([], '.')
+    job.update(job_id = 'job-1', status = 'completed', exit_status = 'died')
+    job.update(values)
+    return job
+
+@pytest.mark.parametrize('exit_code, kind', [(137, 'transient'), (143, 'transient'), (75, 'transient'), (2, 'deterministic'), (127, 'deterministic')])
+def test_exit_codes(exit_code, kind):
+    assert tcm_retry.classify(failed_job(exit_code = exit_code))[0] == kind
+
+@pytest.mark.parametrize('exit_status', ['died', 'killed'])
+def test_unexplained_died_or_killed_jobs_are_deterministic(exit_status):
+    """ A died or killed status alone is no sign of a cluster failure """
+
+    assert tcm_retry.classify(failed_job(exit_status = exit_status, exit_code = 3)) == ('deterministic', f'unrecognized failure (status {exit_status}, exit code 3)')
+    assert tcm_retry.classify(failed_job(exit_status = exit_status))[0] == 'deterministic'
+
+@pytest.mark.parametrize('line, kind', [
+    ('FLEXlm error: license checkout failed', 'transient'),
+    ('OSError: [Errno 28] No space left on device', 'transient'),
+    ('node cn042 evicted by scheduler', 'transient'),
+    ('License server machine not found (FLEXlm error -96)', 'transient'),
+    ('ERROR: invalid license server response; Connection refused', 'transient'),
+    ('Killed', 'transient'),
+    ('piper.py: error: unrecognized arguments: -foo', 'deterministic'),
+    ('ERROR: invalid chain Z for receptor', 'deterministic'),
+    ('receptor.mae: No such file or directory', 'deterministic'),
+    ('Checked out license PSP_PIPER', 'deterministic') # routine line, so the failure is unrecognized
+])
+def test_messages(line, kind):
+    assert tcm_retry.classify(failed_job(exit_code = 1, output_tail = [line]))[0] == kind
+
+def test_deterministic_messages_win_over_transient_messages():
+    job = failed_job(exit_code = 1, output_tail = ['Traceback (most recent call last):', 'OSError: Connection reset by peer'])
+
+    assert tcm_retry.classify(job) == ('deterministic', '"Traceback (most recent call last)" in job output')
+
+def test_only_last_lines_are_searched():
+    log_lines = ['License checkout failed, retrying'] + ['still docking'] * tcm_retry.MESSAGE_TAIL_LINES
+
+    assert tcm_retry.classify(failed_job(exit_code = 1), log_lines)[0] == 'deterministic'
+    assert tcm_retry.classify(failed_job(exit_code = 1), log_lines[:-1])[0] == 'transient'
+
+def test_stalled_jobs_follow_watchdog_setting(monkeypatch):
+    monkeypatch.setitem(tcm_watchdog.settings, 'on_stall', 'resubmit')
+    assert tcm_retry.classify(failed_job(status = 'stalled'))[0] == 'transient'
+
+    monkeypatch.setitem(tcm_watchdog.settings, 'on_stall', 'fail')
+    assert tcm_retry.classify(failed_job(status = 'stalled'))[0] == 'deterministic'
+    assert tcm_retry.classify(failed_job(status = 'kill_failed'))[0] == 'deterministic'
+
+def test_local_job_exiting_with_error_is_not_retried(tmp_path, monkeypatch, local_jobs):
+    """ A job of the local stand-in of job control exiting with code 3 is reported died and never retried """
+
+    monkeypatch.setitem(tcm_retry.policies, 'PIPER', dict(tcm_retry.policies['PIPER'], max_attempts = 3, backoff = 0.0))
+    launches = []
+
+    async def launch(host):
+        launches.append(host)
+        return await tcm_job_control.run_job([f'{sys.executable} -c "import sys; sys.exit(3)"'], cwd = str(tmp_path))
+
+    job = tcm_job_control.wait(tcm_retry.run_with_retries('PIPER', launch))
+
+    assert job['exit_status'] == 'died'
+    assert job['failure'][0] == 'deterministic'
+    assert len(launches) == 1
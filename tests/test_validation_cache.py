@@ -0,0 +1,78 @@
+#Import Python modules
+import shutil
+import json
+import os
+
+import pytest
+
+#Import TCM functionality
+import tcm_validation_cache
+import tcm_structure_scan
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """ Validation cache in its own directory """
+
+    monkeypatch.setattr(tcm_validation_cache, 'cache_root', str(tmp_path / 'cache'))
+    monkeypatch.setattr(tcm_validation_cache, 'cache_enabled', True)
+    return tcm_validation_cache
+
+def loaded_summary(file_path, backend):
+    summary = tcm_structure_scan.new_summary(str(file_path))
+    summary.update(loaded = True, structures = 1, chains = ['A'], backend = backend)
+    return summary
+
+def test_entry_path_is_keyed_by_content_and_backend(tmp_path, cache):
+    """ Renamed files share an entry; edited files and other backends do not """
+
+    protein = tmp_path / 'protein.pdb'
+    protein.write_text('ATOM\n')
+    renamed = tmp_path / 'renamed.pdb'
+    shutil.copy(protein, renamed)
+
+    assert cache.entry_path(str(protein), 'schrodinger') == cache.entry_path(str(renamed), 'schrodinger')
+    assert cache.entry_path(str(protein), 'schrodinger') != cache.entry_path(str(protein), 'numpy')
+
+    path = cache.entry_path(str(protein), 'schrodinger')
+    renamed.write_text('HETATM\n')
+    assert cache.entry_path(str(renamed), 'schrodinger') != path
+
+def test_store_is_keyed_by_backend_of_summary(tmp_path, cache):
+    """ A summary read with numpy is only found by lookups of the numpy backend, whatever backend is configured """
+
+    protein = tmp_path / 'protein.pdb'
+    protein.write_text('ATOM\n')
+    cache.store(loaded_summary(protein, 'numpy'))
+
+    assert cache.load(str(protein), 'numpy')['backend'] == 'numpy'
+    assert cache.load(str(protein), 'schrodinger') is None
+
+def test_partial_and_failed_summaries_are_not_stored(tmp_path, cache):
+    protein = tmp_path / 'protein.pdb'
+    protein.write_text('ATOM\n')
+    summary = loaded_summary(protein, 'schrodinger')
+
+    cache.store(dict(summary, partial = True))
+    cache.store(dict(summary, loaded = False))
+
+    assert cache.load(str(protein)) is None
+
+def test_evict_removes_least_recently_used_entries(tmp_path, cache):
+    """ Oldest entries (by last use) are removed until the cache fits """
+
+    paths = []
+    for index in range(3):
+        protein = tmp_path / f'protein{index}.pdb'
+        protein.write_text(f'ATOM {index}\n')
+        cache.store(loaded_summary(protein, 'schrodinger'))
+        path = cache.entry_path(str(protein), 'schrodinger')
+        os.utime(path, (1000 + index, 1000 + index))
+        paths.append(path)
+    cache.load(str(tmp_path / 'protein0.pdb')) # used last
+
+    entry_mb = os.path.getsize(paths[0]) / 1024 / 1024
+    cache.evict(max_mb = 2.5 * entry_mb)
+
+    assert [os.path.isfile(path) for path in paths] == [True, False, True]
+    with open(paths[2]) as f:
+        assert json.load(f)['chains'] == ['A']
@@ -0,0 +1,32 @@
+#Import Python modules
+import os
+
+#Import TCM functionality
+import tcm_job_control
+import tcm_speculation
+import tcm_watchdog
+
+def touch(path, mtime):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, 'w') as f:
+        f.write('')
+    os.utime(path, (mtime, mtime))
+
+def test_latest_activity_walks_subdirectories(tmp_path):
+    touch(str(tmp_path / 'shard.log'), 1000)
+    touch(str(tmp_path / 'subjob' / 'subjob.log'), 2000)
+
+    assert tcm_watchdog.latest_activity([str(tmp_path)]) == 2000
+    assert tcm_watchdog.latest_activity([str(tmp_path / 'shard.log')]) == 1000
+    assert tcm_watchdog.latest_activity([str(tmp_path / 'missing')]) is None
+
+def test_duplicate_does_not_hide_stalled_first_copy(tmp_path):
+    """ Progress of the duplicate of a shard (launched inside the directory of the first copy) is not progress of the first copy """
+
+    shard_dir = str(tmp_path)
+    touch(os.path.join(shard_dir, 'shard.log'), 1000)
+    touch(os.path.join(tcm_speculation.speculative_dir(shard_dir), 'shard.log'), 5000)
+    job = dict(tcm_job_control.new_job([], shard_dir), submitted = 500)
+
+    assert tcm_watchdog.stalled_for(job, [shard_dir], now = 6000) == 1000
+    assert tcm_watchdog.stalled_for(job, [shard_dir], now = 6000, exclude_paths = [tcm_speculation.speculative_dir(shard_dir)]) == 5000